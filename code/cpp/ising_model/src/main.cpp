@@ -100,8 +100,8 @@ wstring FileSave(wstring title)
 /// @param seed 
 void GenRandomSpins(std::vector<int8_t>& spins, uint64_t seed)
 {
-	Random64 rnd;
-	rnd.Init(seed);
+	RandomStream rnd;
+	rnd.Init(seed, 0); //Stream 0 is kept for the initial spins, temperatures use the streams after it
 
 #ifdef GRID_2D
 	Int count = pow(GRID_SIZE, 2);
@@ -144,7 +144,7 @@ void CalculateMeanStdDev(const cqueue<T>& buffer, Float& mean, Float& stdDevSq)
 	stdDevSq = sqrt(meanSq - sqr(mean));
 }
 
-void EnergyThread(SpinGrid& grid, Int tempNum, std::vector<ModelData>& energyValues, const std::vector<int8_t>& initialSpins)
+void EnergyThread(SpinGrid& grid, uint64_t seed, Int tempNum, std::vector<ModelData>& energyValues, const std::vector<int8_t>& initialSpins)
 {
 	Float tempValue;
 	int64_t startTime, endTime;
@@ -158,6 +158,9 @@ void EnergyThread(SpinGrid& grid, Int tempNum, std::vector<ModelData>& energyVal
 	grid.SetTemperature(tempValue);
 	grid.SetGrid(initialSpins);
 
+	//Each temperature has its own stream, so results don't depend on the thread count or which thread runs it
+	grid.SetStream(seed, tempNum + 1);
+
 	//Buffer for calculating mean energy
 	const Int buffSize = ITER_AVG / SAMPLE_GAP;
 
@@ -189,7 +192,7 @@ void EnergyThread(SpinGrid& grid, Int tempNum, std::vector<ModelData>& energyVal
 			if (i > 0)
 			{
 				const Float devLimit = STD_DEV_COUNT * (lastStdDev / sqrt(buffSize));
-				const Float devLimitMag = STD_DEV_COUNT * (lastStdDev / sqrt(buffSize));
+				const Float devLimitMag = STD_DEV_COUNT * (lastStdDevMag / sqrt(buffSize));
 
 				if (abs(lastMean - mean) <= devLimit && abs(lastMeanMag - meanMag) <= devLimitMag)
 				{
@@ -258,9 +261,9 @@ void CalculateEnergyValues(uint64_t seed, const std::vector<int8_t>& initialSpin
 	for (UInt i = 0; i < threadCount; ++i)
 	{
 #ifdef GRID_2D
-		gridArray.push_back(SpinGrid2D(GRID_SIZE, GRID_SIZE, seed + (i + 1), MAGNETIC_FIELD));
+		gridArray.push_back(SpinGrid2D(GRID_SIZE, GRID_SIZE, seed, MAGNETIC_FIELD));
 #elif GRID_3D
-		gridArray.push_back(SpinGrid3D(GRID_SIZE, GRID_SIZE, GRID_SIZE, seed + (i + 1), MAGNETIC_FIELD));
+		gridArray.push_back(SpinGrid3D(GRID_SIZE, GRID_SIZE, GRID_SIZE, seed, MAGNETIC_FIELD));
 #endif
 	}
 
@@ -284,7 +287,7 @@ void CalculateEnergyValues(uint64_t seed, const std::vector<int8_t>& initialSpin
 			if (tempNum >= TEMP_COUNT)
 				continue;
 
-			threads[threadIndex] = std::thread(EnergyThread, std::ref(gridArray[threadIndex]), tempNum, std::ref(energies), std::ref(initialSpins));
+			threads[threadIndex] = std::thread(EnergyThread, std::ref(gridArray[threadIndex]), seed, tempNum, std::ref(energies), std::ref(initialSpins));
 		}
 	}
 
@@ -297,10 +300,10 @@ void CalculateEnergyValues(uint64_t seed, const std::vector<int8_t>& initialSpin
 #endif // THREADED
 
 #ifndef THREADED
-	SpinGrid grid(GRID_SIZE, GRID_SIZE, seed + 1);
+	SpinGrid grid(GRID_SIZE, GRID_SIZE, seed);
 	for (Int i = 0; i < TEMP_COUNT; ++i)
 	{
-		EnergyThread(grid, i, energies, initialSpins);
+		EnergyThread(grid, seed, i, energies, initialSpins);
 	}
 #endif // !THREADED
 
@@ -366,7 +369,7 @@ int main(int argc, char* argv[])
 	std::vector<int8_t> randomSpins(GRID_SIZE * GRID_SIZE * GRID_SIZE);
 #endif
 
-  GenRandomSpins(randomSpins, seed + 1);
+  GenRandomSpins(randomSpins, seed);
     
   //Main execution
   std::vector<ModelData> energies(TEMP_COUNT);
@@ -1,5 +1,7 @@
 #pragma once
 #include <stdint.h>
+#include <array>
+#include <cstddef>
 
 #define CRC32_NEGL 0xffffffff
 
@@ -190,4 +192,102 @@ public:
 private:
 	bool iset;
 	xorshift64 _xorRnd;
-};
\ No newline at end of file
+};
+
+/// @brief Counter-based Philox4x32-10 generator. Each block of output is a pure function of a counter and a key, so any
+/// block of any stream can be generated without the ones before it.
+class Philox4x32
+{
+public:
+	typedef std::array<uint32_t, 4> Block;
+
+	static Block Generate(Block counter, uint64_t key)
+	{
+		uint32_t key0 = uint32_t(key);
+		uint32_t key1 = uint32_t(key >> 32);
+
+		for (int round = 0; round < 10; ++round)
+		{
+			if (round > 0)
+			{
+				key0 += 0x9E3779B9;
+				key1 += 0xBB67AE85;
+			}
+
+			const uint64_t product0 = uint64_t(0xD2511F53) * counter[0];
+			const uint64_t product1 = uint64_t(0xCD9E8D57) * counter[2];
+			counter = { uint32_t(product1 >> 32) ^ counter[1] ^ key0, uint32_t(product1), uint32_t(product0 >> 32) ^ counter[3] ^ key1, uint32_t(product0) };
+		}
+
+		return counter;
+	}
+};
+
+/// @brief Random numbers from one Philox stream, picked by a seed and a stream number (a temperature or the initial
+/// spins). Streams never overlap, so results don't depend on which thread runs a stream or how many threads there are.
+/// Values are generated in bulk into a fixed buffer.
+class RandomStream
+{
+public:
+	static constexpr std::size_t BUFFER_SIZE = 256; //64 bit values generated per refill
+
+	RandomStream()
+	{
+	}
+
+	void Init(uint64_t seed, uint64_t stream)
+	{
+		_seed = seed;
+		_stream = stream;
+		_block = 0;
+		_position = BUFFER_SIZE;
+	}
+
+	/// @brief Generates a random integer in the range [from, to)
+	/// @param from 
+	/// @param to 
+	/// @return 
+	int64_t GetRandInt(int64_t from, int64_t to)
+	{
+		return from + Next() % (to - from);
+	}
+
+	double Get11()
+	{
+		return (Get01() * 2.0) - 1.0;
+	}
+
+	double Get01()
+	{
+		return double(Next() >> 11) / 9007199254740992.0;
+	}
+
+private:
+	uint64_t Next()
+	{
+		if (_position == BUFFER_SIZE)
+			Refill();
+
+		return _buffer[_position++];
+	}
+
+	void Refill()
+	{
+		//The counter holds the block number in the low words and the stream in the high words
+		for (std::size_t i = 0; i < BUFFER_SIZE; i += 2)
+		{
+			const Philox4x32::Block block = Philox4x32::Generate({ uint32_t(_block), uint32_t(_block >> 32), uint32_t(_stream), uint32_t(_stream >> 32) }, _seed);
+			_buffer[i] = uint64_t(block[0]) | (uint64_t(block[1]) << 32);
+			_buffer[i + 1] = uint64_t(block[2]) | (uint64_t(block[3]) << 32);
+			++_block;
+		}
+
+		_position = 0;
+	}
+
+	uint64_t _seed = 0;
+	uint64_t _stream = 0;
+	uint64_t _block = 0;
+	std::size_t _position = BUFFER_SIZE;
+	std::array<uint64_t, BUFFER_SIZE> _buffer = {};
+};
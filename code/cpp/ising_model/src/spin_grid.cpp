@@ -22,6 +22,14 @@ void SpinGrid::SetTemperature(double kBT)
 	}
 }
 
+/// @brief Switches to another random number stream, starting from its beginning.
+/// @param seed 
+/// @param stream 
+void SpinGrid::SetStream(uint64_t seed, uint64_t stream)
+{
+	_rnd.Init(seed, stream);
+}
+
 void SpinGrid::SetGrid(const std::vector<int8_t>& grid)
 {
 	if (grid.size() == _spinGrid.size())
@@ -48,14 +56,19 @@ double SpinGrid::CalculateEnergy(std::size_t index) const
 
 void SpinGrid::CalculateTotalEnergy()
 {
-	_totalEnergy = 0.0;
+	//Every bond is part of the local energy of both its sites, the field term only of one
+	double bondEnergy = 0.0;
+	double fieldEnergy = 0.0;
 
 	for (std::size_t i = 0; i < _spinGrid.size(); ++i)
 	{
-		_totalEnergy += CalculateEnergy(i);
+		const double siteFieldEnergy = -_magneticField * SpinAt(i);
+
+		bondEnergy += CalculateEnergy(i) - siteFieldEnergy;
+		fieldEnergy += siteFieldEnergy;
 	}
 
-	_totalEnergy /= 2; //Double counted pairs (true in 3D?)
+	_totalEnergy = bondEnergy / 2 + fieldEnergy;
 }
 
 void SpinGrid::CalculateMagnetisation()
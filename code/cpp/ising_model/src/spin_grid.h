@@ -27,11 +27,12 @@ class SpinGrid
 public:
 	SpinGrid(uint64_t seed, double magneticField, double interactionStrength = 1.0) : _magneticField(magneticField), _interactionStrength(interactionStrength)
 	{
-		_rnd.Init(seed);
+		_rnd.Init(seed, 0);
 	}
 
 	void SetMagneticField(double fieldStrength);
 	void SetTemperature(double kBT);
+	void SetStream(uint64_t seed, uint64_t stream);
 	void SetGrid(const std::vector<int8_t>& grid);
 	double GetTotalEnergy() const;
 	int64_t GetMagnetisation() const;
@@ -45,7 +46,7 @@ protected:
 	void CalculateTotalEnergy();
 	void CalculateMagnetisation();
 
-	Random64 _rnd;
+	RandomStream _rnd;
 
 	std::vector<int8_t> _spinGrid;
 
@@ -0,0 +1,108 @@
+"""Chooses the temperatures of a sweep adaptively, spending runs where the curves are least resolved.
+A coarse even grid is run first, then each interval between finished temperatures is scored by how far its
+midpoint could be from a straight line through its ends, from the energy curvature and the change in heat
+capacity, or by the error bars at its ends. The worst intervals are split at their midpoints until every interval
+is within the tolerance, too narrow to split, or the temperature budget runs out. New temperatures start from the
+final spins of a finished neighbour rather than from random spins.
+"""
+
+import numpy as np
+
+from checkpoint import PackSpins, UnpackSpins
+
+class AdaptiveSchedule():
+    """Hands out batches of temperatures to run and takes back their results.
+    Parameters:
+        temperatureRange : (lowest, highest) temperature.
+        initialCount : Evenly spaced temperatures in the first batch, at least 3.
+        tolerance : Largest acceptable interval score, as an energy per spin.
+        minSpacing : Intervals are not split below this width.
+        maxCount : Most temperatures the schedule will hand out, including any results added from an earlier run.
+    """
+
+    def __init__(self, temperatureRange, initialCount, tolerance, minSpacing, maxCount):
+        if initialCount < 3:
+            raise ValueError(f"The coarse grid needs at least 3 temperatures to estimate curvature, got {initialCount}")
+
+        self._initial = list(np.linspace(temperatureRange[0], temperatureRange[1], initialCount))
+        self._tolerance = tolerance
+        self._minSpacing = minSpacing
+        self._maxCount = maxCount
+
+        #Finished temperatures with their energy, energy error and heat capacity per spin, and the packed final spins
+        self._results = {}
+        self._grids = {}
+        self._pending = set()
+
+    def Add(self, temperature, energy, energyError, heatCapacity, finalGrid=None):
+        """Records a finished temperature. The observables are per spin, and the final grid is kept for warm starts."""
+
+        self._pending.discard(temperature)
+        self._results[temperature] = (energy, energyError, heatCapacity)
+        if finalGrid is not None:
+            self._grids[temperature] = (PackSpins(finalGrid), np.shape(finalGrid))
+
+    def StartGrid(self, temperature):
+        """The final spins of the nearest finished temperature with a stored grid (the lower one on a tie), or None."""
+
+        stored = sorted(self._grids)
+        if len(stored) == 0:
+            return None
+
+        nearest = min(stored, key=lambda temp: (abs(temp - temperature), temp))
+        return UnpackSpins(*self._grids[nearest])
+
+    def Scores(self):
+        """Returns the finished temperatures in order and the score of each interval between neighbours.
+        An interval scores the largest of its estimated midpoint interpolation error, from the second difference of
+        the energy or from the heat capacity change (each |dE/dT change| * width / 8), and the mean error of its ends.
+        """
+
+        temps = np.array(sorted(self._results))
+        if len(temps) < 3:
+            return temps, np.full(max(len(temps) - 1, 0), np.inf)
+
+        energy, energyError, heatCapacity = np.array([self._results[temp] for temp in temps]).T
+        widths = np.diff(temps)
+
+        #Change in slope at each temperature, the ends taking the value of their only neighbour
+        slopes = np.diff(energy) / widths
+        bends = np.abs(np.diff(slopes))
+        bends = np.concatenate([bends[:1], bends, bends[-1:]])
+
+        curvature = widths * np.maximum(bends[:-1], bends[1:]) / 8.0
+        heatCapacityChange = widths * np.abs(np.diff(heatCapacity)) / 8.0
+        noise = (energyError[:-1] + energyError[1:]) / 2.0
+
+        return temps, np.maximum(np.maximum(curvature, heatCapacityChange), noise)
+
+    def Next(self, count):
+        """Returns up to count new temperatures to run, an empty list once the sweep is resolved or out of budget.
+        Results of the previous batch should be added first, intervals still waiting on a temperature are skipped.
+        """
+
+        remaining = self._maxCount - len(self._results) - len(self._pending)
+        count = min(count, remaining)
+        if count <= 0:
+            return []
+
+        #The coarse grid comes first, less any temperatures a resumed run already finished
+        coarse = [temp for temp in self._initial if temp not in self._results and temp not in self._pending]
+        if len(coarse) > 0 or len(self._results) < 3:
+            batch = coarse[:count]
+        else:
+            temps, scores = self.Scores()
+            midpoints = (temps[:-1] + temps[1:]) / 2.0
+
+            candidates = (scores > self._tolerance) & (np.diff(temps) >= 2.0 * self._minSpacing)
+            for temp in self._pending:
+                candidates &= ~((temps[:-1] < temp) & (temp < temps[1:]))
+
+            order = np.argsort(-scores[candidates])
+            batch = [float(temp) for temp in midpoints[candidates][order[:count]]]
+
+        self._pending.update(batch)
+        return batch
+
+    def TemperatureCount(self):
+        return len(self._results)
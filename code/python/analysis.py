@@ -0,0 +1,35 @@
+"""Statistical tools for the time series produced by the simulations.
+"""
+
+import numpy as np
+
+def Autocorrelation(series):
+    """Normalised autocorrelation function of a time series, calculated with an FFT."""
+
+    series = np.asarray(series, dtype=float)
+    count = len(series)
+    deviation = series - series.mean()
+
+    #Zero pad to avoid wrapping around
+    fftSize = 1 << (2 * count - 1).bit_length()
+    transform = np.fft.rfft(deviation, n=fftSize)
+    correlation = np.fft.irfft(transform * np.conj(transform), n=fftSize)[:count]
+
+    if correlation[0] == 0.0:
+        return np.zeros(count)
+
+    return correlation / correlation[0]
+
+def IntegratedAutocorrelationTime(series, windowFactor=5.0):
+    """Integrated autocorrelation time 1 + 2 * sum(rho) in units of samples, using Sokal's automatic window.
+    A series of n samples holds about n / tau independent ones. The window is the smallest M with M >= windowFactor * tau(M).
+    """
+
+    correlation = Autocorrelation(series)
+
+    tau = 2.0 * np.cumsum(correlation) - 1.0
+    window = np.arange(len(tau)) >= windowFactor * tau
+    if not window.any():
+        return tau[-1]
+
+    return tau[np.argmax(window)]
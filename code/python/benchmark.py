@@ -0,0 +1,240 @@
+"""Benchmarks the lattice engines across grid sizes, temperatures and update algorithms.
+Each case reports spin updates and sweeps per second, the integrated autocorrelation time of the energy and the
+resulting independent samples per second. Results are written to a JSON file and compared against a stored baseline,
+exiting with an error if any case has regressed or the baseline is missing or shares no cases with the run. Baselines are specific to a machine, so
+each machine stores its own with --save-baseline rather than one being kept in the repository.
+
+    python benchmark.py                  #Run everything and compare against the baseline
+    python benchmark.py --quick          #Small grids only
+    python benchmark.py --save-baseline  #Store this run as the new baseline
+"""
+
+import argparse, json, os, platform, sys, time
+import numpy as np
+
+import spin_grid, packed_grid, analysis, onsager, results_store, rng_streams
+
+GRID_SIZES = [32, 64, 128, 256, 512, 1024, 2048]
+QUICK_GRID_SIZES = [32, 64, 128]
+TEMPERATURES = {"low": 1.5, "critical": onsager.CriticalTemperature(), "high": 3.5}
+
+WARMUP_SECONDS = 0.5 #Sweeps before timing starts, so the grid is away from its random start
+MEASURE_SECONDS = 2.0 #Minimum time spent sweeping in each case
+MIN_SWEEPS = 20 #Minimum sweeps in each case, unless they take longer than MAX_CASE_SECONDS
+MAX_CASE_SECONDS = 30.0 #Slow cases stop here, after at least 2 sweeps
+TIMING_BLOCKS = 5 #The measurement is split into this many blocks and the fastest gives the reported rates
+RELIABLE_TAU_FACTOR = 50 #The autocorrelation time is only trusted from a series this many times longer
+SEED = 12345
+
+OUTPUT_FILE = "./benchmarks/latest.json"
+BASELINE_FILE = "./benchmarks/baseline.json"
+THROUGHPUT_TOLERANCE = 0.25 #Fractional drop in sweeps per second counted as a regression
+EFFECTIVE_TOLERANCE = 0.5 #Independent samples per second are noisier, through the autocorrelation time
+
+class _LatticeEngine():
+    """Adapts metropolis.Lattice to the Sweep interface of the other engines, without any observers subscribed."""
+
+    def __init__(self, size, temperature, seed):
+        import matplotlib
+        matplotlib.use("Agg")
+        import metropolis
+
+        #Lattice reads its inverse temperature from the module
+        metropolis.beta = 1.0 / temperature
+
+        self._lattice = metropolis.Lattice(size, 1.0, 0.0, seed=seed)
+        self._siteCount = size * size
+        self._iterationNum = 0
+        self._lastTotalEnergy = self._lattice.energy
+
+    def Sweep(self, sweeps):
+        self._lattice.metropolis(sweeps * self._siteCount)
+        self._iterationNum += sweeps * self._siteCount
+        self._lastTotalEnergy = self._lattice.energy
+
+def _SpinGridEngine(algorithm):
+    def Create(size, temperature, seed):
+        grid = spin_grid.SpinGrid(size, size, 0.0, 1.0, seed)
+        grid.SetGrid(rng_streams.RandomSpins(seed, (size, size)))
+        grid.SetTemperature(temperature)
+        grid.SetAlgorithm(algorithm)
+        return grid
+    return Create
+
+def _PackedEngine(size, temperature, seed):
+    grid = packed_grid.PackedSpinGrid(size, size, 0.0, 1.0, seed)
+    grid.SetRandomGrid()
+    grid.SetTemperature(temperature)
+    return grid
+
+#Engine name to a factory called as (size, temperature, seed), and the largest grid it is run on
+ENGINES = {
+    "spin_grid/metropolis": (_SpinGridEngine(spin_grid.ALGORITHM_METROPOLIS), 512 if spin_grid.numba is not None else 128),
+    "spin_grid/checkerboard": (_SpinGridEngine(spin_grid.ALGORITHM_CHECKERBOARD), None),
+    "spin_grid/wolff": (_SpinGridEngine(spin_grid.ALGORITHM_WOLFF), 512), #Clusters are tiny at high temperatures, so large grids take minutes a sweep
+    "spin_grid/swendsen-wang": (_SpinGridEngine(spin_grid.ALGORITHM_SWENDSEN_WANG), None),
+    "packed_grid/checkerboard": (_PackedEngine, None),
+    "metropolis.Lattice": (_LatticeEngine, 512 if spin_grid.numba is not None else 128),
+}
+
+def RunCase(engineName, size, temperatureLabel, seed=SEED):
+    """Times one engine on one grid size and temperature, returning a dictionary of metrics."""
+
+    factory = ENGINES[engineName][0]
+    temperature = TEMPERATURES[temperatureLabel]
+    engine = factory(size, temperature, seed)
+
+    warmupEnd = time.perf_counter() + WARMUP_SECONDS
+    while time.perf_counter() < warmupEnd:
+        engine.Sweep(1)
+
+    #Only time spent inside Sweep counts. Timing is split into blocks and the fastest is reported, since other
+    #processes on the machine can only slow a block down
+    energies = []
+    blockRates = []
+    seconds = 0.0
+    blockSweeps, blockSeconds, blockStart = 0, 0.0, engine._iterationNum
+    while (seconds < MEASURE_SECONDS or len(energies) < MIN_SWEEPS) and not (seconds >= MAX_CASE_SECONDS and len(energies) >= 2):
+        start = time.perf_counter()
+        engine.Sweep(1)
+        elapsed = time.perf_counter() - start
+        energies.append(engine._lastTotalEnergy)
+
+        seconds += elapsed
+        blockSeconds += elapsed
+        blockSweeps += 1
+        if blockSeconds >= MEASURE_SECONDS / TIMING_BLOCKS:
+            blockRates.append((blockSweeps / blockSeconds, (engine._iterationNum - blockStart) / blockSeconds))
+            blockSweeps, blockSeconds, blockStart = 0, 0.0, engine._iterationNum
+
+    if len(blockRates) == 0:
+        blockRates.append((blockSweeps / blockSeconds, (engine._iterationNum - blockStart) / blockSeconds))
+
+    sweeps = len(energies)
+    sweepsPerSecond, spinUpdatesPerSecond = max(blockRates)
+
+    #A constant series (a frozen low temperature grid) has no correlations to measure
+    tau = analysis.IntegratedAutocorrelationTime(energies) if np.var(energies) > 0.0 else 1.0
+    tau = max(float(tau), 1.0)
+
+    return {
+        "engine": engineName,
+        "size": size,
+        "temperature": temperatureLabel,
+        "kBT": temperature,
+        "sweeps": sweeps,
+        "seconds": seconds,
+        "sweepsPerSecond": sweepsPerSecond,
+        "spinUpdatesPerSecond": spinUpdatesPerSecond,
+        "autocorrelationTime": tau,
+        "independentSamplesPerSecond": sweepsPerSecond / tau,
+        "tauReliable": sweeps >= RELIABLE_TAU_FACTOR * tau,
+    }
+
+def RunSuite(engines, sizes, temperatureLabels):
+    """Runs every combination, skipping grids larger than an engine's limit."""
+
+    results = []
+    for engineName in engines:
+        maxSize = ENGINES[engineName][1]
+        for size in sizes:
+            if maxSize is not None and size > maxSize:
+                continue
+
+            for temperatureLabel in temperatureLabels:
+                result = RunCase(engineName, size, temperatureLabel)
+                results.append(result)
+
+                print(f"{engineName:26} {size:5}^2 {temperatureLabel:9} {result['spinUpdatesPerSecond']:10.3g} flips/s "
+                      f"{result['sweepsPerSecond']:10.3g} sweeps/s  tau {result['autocorrelationTime']:8.2f}{'' if result['tauReliable'] else '*'} "
+                      f"{result['independentSamplesPerSecond']:10.3g} samples/s", flush=True)
+
+    return results
+
+def MachineInfo():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpuCount": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": None if spin_grid.numba is None else spin_grid.numba.__version__,
+    }
+
+def CompareToBaseline(results, baseline):
+    """Returns a description of every case that is slower than the baseline by more than the tolerances, and the names
+    of the cases the baseline doesn't have.
+    """
+
+    baselineCases = {(case["engine"], case["size"], case["temperature"]): case for case in baseline["results"]}
+
+    regressions = []
+    unmatched = []
+    for result in results:
+        name = f"{result['engine']} {result['size']}^2 {result['temperature']}"
+        reference = baselineCases.get((result["engine"], result["size"], result["temperature"]))
+        if reference is None:
+            unmatched.append(name)
+            continue
+
+        if result["sweepsPerSecond"] < (1.0 - THROUGHPUT_TOLERANCE) * reference["sweepsPerSecond"]:
+            regressions.append(f"{name}: {result['sweepsPerSecond']:.3g} sweeps/s, baseline {reference['sweepsPerSecond']:.3g}")
+
+        #Autocorrelation times from short series are too noisy to judge
+        if result["tauReliable"] and reference["tauReliable"] and \
+           result["independentSamplesPerSecond"] < (1.0 - EFFECTIVE_TOLERANCE) * reference["independentSamplesPerSecond"]:
+            regressions.append(f"{name}: {result['independentSamplesPerSecond']:.3g} samples/s, baseline {reference['independentSamplesPerSecond']:.3g}")
+
+    return regressions, unmatched
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the lattice engines against a stored baseline.")
+    parser.add_argument("--quick", action="store_true", help=f"only grid sizes {QUICK_GRID_SIZES}")
+    parser.add_argument("--sizes", type=int, nargs="+", help="grid sizes to run")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES), help="engines to run")
+    parser.add_argument("--temperatures", nargs="+", choices=list(TEMPERATURES), default=list(TEMPERATURES), help="temperatures to run")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="file the results are written to")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline instead of comparing")
+    args = parser.parse_args()
+
+    #Without a baseline there is nothing to check against, so fail before spending time on the suite
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+        sys.exit(2)
+
+    sizes = args.sizes or (QUICK_GRID_SIZES if args.quick else GRID_SIZES)
+    report = {"machine": MachineInfo(), "results": RunSuite(args.engines, sizes, args.temperatures)}
+
+    for fileName in [args.output] + ([args.baseline] if args.save_baseline else []):
+        os.makedirs(os.path.dirname(fileName) or ".", exist_ok=True)
+        results_store.WriteJson(fileName, report)
+    print(f"Results written to {args.output}" + (f" and {args.baseline}" if args.save_baseline else ""))
+
+    if args.save_baseline:
+        sys.exit(0)
+
+    with open(args.baseline) as fileBuff:
+        baseline = json.load(fileBuff)
+
+    if baseline["machine"] != report["machine"]:
+        print("Warning: the baseline was recorded on a different machine or software versions")
+
+    regressions, unmatched = CompareToBaseline(report["results"], baseline)
+    if len(unmatched) > 0:
+        print(f"{len(unmatched)} case(s) not in the baseline, so not compared:")
+        for name in unmatched:
+            print("  " + name)
+
+    #A stale or renamed baseline would otherwise pass having compared nothing
+    if len(unmatched) == len(report["results"]):
+        print(f"No case matches the baseline at {args.baseline}, run with --save-baseline to store a new one")
+        sys.exit(2)
+
+    if len(regressions) > 0:
+        print(f"\nPERFORMANCE REGRESSION in {len(regressions)} case(s):")
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+
+    print("No regressions against the baseline")
@@ -0,0 +1,91 @@
+"""Checkpoints for resuming long simulations exactly.
+A checkpoint is a .npz file holding the state dictionaries of several objects, written atomically so an
+interruption part way through a write leaves the previous checkpoint intact. The settings of the run that wrote it
+can be stored alongside, and are checked before it is resumed.
+"""
+
+import hashlib, json, os
+import numpy as np
+
+def PackSpins(spins):
+    """Packs a lattice of -1/+1 spins into 1 bit per spin."""
+    return np.packbits(np.asarray(spins) > 0, axis=None)
+
+def UnpackSpins(packed, shape):
+    bits = np.unpackbits(packed, count=int(np.prod(shape)))
+    return (2 * bits.astype(np.int8) - 1).reshape(shape)
+
+def GeneratorState(rng):
+    """The exact state of a numpy Generator, or a list of them, as a JSON string. Array fields are stored as lists."""
+    state = [generator.bit_generator.state for generator in rng] if isinstance(rng, list) else rng.bit_generator.state
+    return json.dumps(state, default=lambda value: value.tolist())
+
+def SetGeneratorState(rng, state):
+    """Restores a state from GeneratorState into a Generator, or a list of them in the same order."""
+
+    state = json.loads(str(state))
+    if isinstance(rng, list):
+        for generator, generatorState in zip(rng, state):
+            generator.bit_generator.state = generatorState
+    else:
+        rng.bit_generator.state = state
+
+def OptionalFloat(value):
+    """A total saved by GetState as nan (or None) while it isn't calculated yet, back as a float or None.
+    Works for plain floats from an in-memory state as well as the 0-d arrays read back from a file.
+    """
+    return None if value is None or np.isnan(value) else float(value)
+
+def SettingsDigest(settings):
+    """Short hash of a dictionary of run settings, so runs with different settings can name their checkpoints apart."""
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+def SaveCheckpoint(fileName, states, settings=None):
+    """Writes a checkpoint atomically.
+    Parameters:
+        states : Dictionary of object name to the state dictionary returned by its GetState.
+        settings : Dictionary of every setting the run depends on, as plain JSON values, checked by LoadCheckpoint.
+    """
+
+    arrays = {}
+    if settings is not None:
+        arrays["settings.json"] = np.asarray(json.dumps(settings, sort_keys=True))
+    for name, state in states.items():
+        for key, value in state.items():
+            arrays[f"{name}.{key}"] = np.asarray(value)
+
+    directory = os.path.dirname(fileName)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+
+    tempName = fileName + ".tmp"
+    with open(tempName, "wb") as fileBuff:
+        np.savez(fileBuff, **arrays)
+        fileBuff.flush()
+        os.fsync(fileBuff.fileno())
+    os.replace(tempName, fileName)
+
+def LoadCheckpoint(fileName, settings=None):
+    """Reads a checkpoint back into a dictionary of object name to state dictionary.
+    If settings are given they must match the ones it was saved with, otherwise a ValueError is raised rather than
+    continuing a different run.
+    """
+
+    states = {}
+    with np.load(fileName) as data:
+        for fullKey in data.files:
+            name, key = fullKey.split(".", 1)
+            states.setdefault(name, {})[key] = data[fullKey]
+
+    savedSettings = json.loads(str(states.pop("settings")["json"])) if "settings" in states else None
+    if settings is not None:
+        settings = json.loads(json.dumps(settings))
+        if savedSettings is None:
+            raise ValueError(f"Checkpoint {fileName} has no stored settings to check, delete it to start the run again")
+
+        differences = [name for name in sorted(settings.keys() | savedSettings.keys()) if settings.get(name) != savedSettings.get(name)]
+        if len(differences) > 0:
+            raise ValueError(f"Checkpoint {fileName} was written by a run with different settings ({', '.join(differences)}), "
+                             "delete it to start the run again")
+
+    return states
@@ -0,0 +1,193 @@
+"""Streaming detection of equilibrium for Monte Carlo time series.
+Samples are grouped into a fixed number of batches, so memory use doesn't grow with the length of the run.
+"""
+
+import numpy as np
+
+class RunningStats():
+    """Welford's running mean and variance."""
+
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def Add(self, value):
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+
+    def Count(self):
+        return self._count
+
+    def Mean(self):
+        return self._mean
+
+    def Variance(self):
+        if self._count < 2:
+            return 0.0
+        return self._m2 / (self._count - 1)
+
+def MergeStats(countA, meanA, m2A, countB, meanB, m2B):
+    """Combines the Welford statistics of two sets of samples (Chan et al.)."""
+
+    count = countA + countB
+    delta = meanB - meanA
+    mean = meanA + delta * countB / count
+    m2 = m2A + m2B + delta * delta * countA * countB / count
+
+    return count, mean, m2
+
+class EquilibriumDetector():
+    """Decides when a time series has equilibrated and its mean is known to a target error.
+
+    Samples are collected in up to batchCount batches. When every batch is full, the first and second halves are
+    compared, and if they differ by more than driftSigma standard errors every sample so far is discarded as burn-in,
+    so the kept samples are exactly those since the cut, as for anything else reset when BurnIn changes.
+    Otherwise neighbouring batches are merged and the batch size doubles. The error of the mean is estimated from
+    the spread of the batch means, which accounts for autocorrelation once batches are longer than the correlation time.
+    Short batches of correlated samples make the error too small, so the series can't converge until its batches hold
+    at least minBatchSize samples.
+    """
+
+    def __init__(self, targetError, batchCount=64, minBatches=16, driftSigma=3.0, minBatchSize=16):
+        self._targetError = targetError
+        self._batchCount = batchCount
+        self._minBatches = minBatches
+        self._driftSigma = driftSigma
+        self._minBatchSize = minBatchSize
+
+        self._batchSize = 1
+        self._filled = 0
+        self._counts = np.zeros(batchCount, dtype=np.int64)
+        self._means = np.zeros(batchCount)
+        self._m2 = np.zeros(batchCount)
+
+        self._current = RunningStats()
+        self._burnIn = 0
+        self._drifting = True
+
+    def Add(self, value):
+        self._current.Add(value)
+
+        if self._current.Count() < self._batchSize:
+            return
+
+        #Close the current batch
+        self._counts[self._filled] = self._current.Count()
+        self._means[self._filled] = self._current.Mean()
+        self._m2[self._filled] = self._current._m2
+        self._filled += 1
+        self._current.Reset()
+
+        if self._filled >= self._minBatches:
+            self._drifting = self._CheckDrift()
+
+        if self._filled == self._batchCount:
+            if self._drifting:
+                self.Cut()
+            else:
+                self._MergeBatches()
+
+    def _CheckDrift(self):
+        half = self._filled // 2
+        first = self._means[:half]
+        second = self._means[self._filled - half:self._filled]
+
+        spread = np.sqrt((first.var(ddof=1) + second.var(ddof=1)) / half)
+        if spread == 0.0:
+            return first.mean() != second.mean()
+
+        return np.abs(first.mean() - second.mean()) > self._driftSigma * spread
+
+    def Cut(self):
+        """Discards every sample so far as burn-in, including the unfinished batch.
+        Called directly to keep a series to the same samples as another detector that has cut.
+        """
+
+        self._burnIn += self.SampleCount() + self._current.Count()
+        self._filled = 0
+        self._current.Reset()
+
+    def _MergeBatches(self):
+        count, mean, m2 = MergeStats(self._counts[0::2], self._means[0::2], self._m2[0::2],
+                                     self._counts[1::2], self._means[1::2], self._m2[1::2])
+
+        half = self._filled // 2
+        self._counts[:half] = count
+        self._means[:half] = mean
+        self._m2[:half] = m2
+        self._filled = half
+        self._batchSize *= 2
+
+    def GetState(self):
+        """Copies of the batches and the unfinished batch as a dictionary of arrays, for checkpointing."""
+        return {"batchSize": self._batchSize, "filled": self._filled, "counts": self._counts.copy(), "means": self._means.copy(), "m2": self._m2.copy(),
+                "currentCount": self._current._count, "currentMean": self._current._mean, "currentM2": self._current._m2,
+                "burnIn": self._burnIn, "drifting": self._drifting}
+
+    def SetState(self, state):
+        self._batchSize = int(state["batchSize"])
+        self._filled = int(state["filled"])
+        self._counts = np.array(state["counts"], dtype=np.int64)
+        self._means = np.array(state["means"], dtype=float)
+        self._m2 = np.array(state["m2"], dtype=float)
+
+        self._current._count = int(state["currentCount"])
+        self._current._mean = float(state["currentMean"])
+        self._current._m2 = float(state["currentM2"])
+
+        self._burnIn = int(state["burnIn"])
+        self._drifting = bool(state["drifting"])
+
+    def SampleCount(self):
+        """Samples kept after the burn-in, not counting the unfinished batch."""
+        return int(self._counts[:self._filled].sum())
+
+    def BurnIn(self):
+        """Number of samples discarded as burn-in."""
+        return self._burnIn
+
+    def _KeptStats(self):
+        """Count, mean and M2 of every kept sample, the unfinished batch included."""
+
+        count, mean, m2 = self._current.Count(), self._current.Mean(), self._current._m2
+        for i in range(self._filled):
+            count, mean, m2 = MergeStats(count, mean, m2, self._counts[i], self._means[i], self._m2[i])
+
+        return count, mean, m2
+
+    def Mean(self):
+        """Mean of every kept sample, the same samples as anything reset when BurnIn changes."""
+        return self._KeptStats()[1]
+
+    def Variance(self):
+        """Variance of the individual kept samples."""
+        count, mean, m2 = self._KeptStats()
+        return m2 / max(count - 1, 1)
+
+    def Error(self):
+        """Standard error of the mean from the batch means."""
+        if self._filled < 2:
+            return np.inf
+        return self._means[:self._filled].std(ddof=1) / np.sqrt(self._filled)
+
+    def CorrelationTime(self):
+        """Integrated autocorrelation time in samples estimated from the batch means, the same convention as analysis.IntegratedAutocorrelationTime."""
+        variance = self.Variance()
+        if variance == 0.0:
+            return 1.0
+        return self.SampleCount() * self.Error()**2 / variance
+
+    def IsEquilibrated(self):
+        return self._filled >= self._minBatches and not self._drifting
+
+    def IsConverged(self):
+        """True once the series has equilibrated, its batches are at least minBatchSize long and the error of the mean is
+        within the target.
+        """
+        return self.IsEquilibrated() and self._batchSize >= self._minBatchSize and self.Error() <= self._targetError
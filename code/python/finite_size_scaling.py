@@ -0,0 +1,207 @@
+"""Finite size scaling study, running every lattice size in one job and extracting T_c and critical exponents.
+Each (size, temperature) point is run with ising_model.FindEquilibriumEnergy, so the lattice settings (dimensions,
+boundaries, algorithm and target error) come from ising_model.py. Periodic boundaries give much smaller corrections
+to scaling than open ones. Every point is cached under its size, temperature and seed, so adding a size or temperature
+only runs the new points. Runs are balanced across the workers by their estimated cost, each worker taking its
+cheapest runs first.
+
+T_c comes from the crossings of the Binder cumulant curves of neighbouring sizes. The peaks of the susceptibility and
+heat capacity give gamma/nu and alpha/nu from their heights, and 1/nu from how their positions approach T_c.
+
+    python finite_size_scaling.py                      #Run FSS_SIZES and analyse
+    python finite_size_scaling.py --sizes 8 16 32 64   #Other sizes, reusing any cached points
+"""
+
+import argparse, json, os, time
+import numpy as np
+
+import ising_model, sweep_runner, results_store, rng_streams
+
+FSS_SIZES = [8, 16, 24, 32, 48, 64]
+FSS_TEMPERATURES = np.linspace(2.1, 2.5, 21).round(6).tolist() #Dense around T_c, where the Binder curves cross
+FSS_SEED = 2024 #Base seed, each point derives its own from it with its size and temperature
+FSS_COST_EXPONENT = 2.2 #Runs to a fixed error near T_c take about L^z spin updates, z ~ 2.2 for local updates
+
+CACHE_DIR = "./results/fss-cache"
+CHECKPOINT_DIR = "./results/fss-checkpoints" #Unfinished points are saved here, apart from ising_model.py's own runs (None disables)
+OUTPUT_FILE = "./csv/fss-temp.csv"
+SUMMARY_FILE = "./results/fss-summary.json"
+
+RESULT_COLUMNS = ["size", *ising_model.RESULT_COLUMNS]
+
+def Settings():
+    """Every setting that changes the result of a point, stored with it so a cached point is only reused if they match."""
+    return {
+        "dimensions": ising_model.DIMENSIONS,
+        "periodic": ising_model.PERIODIC_BOUNDARIES,
+        "interactionStrength": ising_model.INTERACTION_STRENGTH,
+        "bField": ising_model.B_FIELD,
+        "algorithm": ising_model.UPDATE_ALGORITHM,
+        "packed": ising_model.PACKED_LATTICE,
+        "targetError": ising_model.TARGET_ERROR,
+        "maxIterations": ising_model.MAX_ITERATIONS,
+        "sampleIterations": ising_model.SAMPLE_ITERATIONS,
+        "bitGenerator": rng_streams.BIT_GENERATOR.__name__,
+    }
+
+def _PointSeeds(size, temperature, seed):
+    """Seeds for the simulation and the initial grid of a point, fixed by its size and temperature alone."""
+    key = (size, round(temperature * 1e6))
+    return rng_streams.Child(seed, *key, 0), rng_streams.Child(seed, *key, 1)
+
+def _RunPoint(task, initialGrid):
+    """Runs one point in a worker with FindEquilibriumEnergy, checkpointing to CHECKPOINT_DIR.
+    Set here rather than in the parent, so the workers use it whichever way they are started, and put back afterwards
+    so nothing else run in the process checkpoints there.
+    """
+
+    checkpointDir = ising_model.CHECKPOINT_DIR
+    ising_model.CHECKPOINT_DIR = CHECKPOINT_DIR
+    try:
+        return ising_model.FindEquilibriumEnergy(task, initialGrid)
+    finally:
+        ising_model.CHECKPOINT_DIR = checkpointDir
+
+def _CacheFile(size, temperature, seed):
+    return os.path.join(CACHE_DIR, f"L{size}-kBT{temperature!r}-seed{seed}.json")
+
+def LoadCachedPoint(size, temperature, seed, settings):
+    """The cached result of a point as a list of values, or None if it hasn't been run with these settings."""
+
+    fileName = _CacheFile(size, temperature, seed)
+    if not os.path.exists(fileName):
+        return None
+
+    with open(fileName) as fileBuff:
+        cached = json.load(fileBuff)
+
+    return cached["result"] if cached["settings"] == settings else None
+
+def RunPoints(sizes, temperatures, seed=FSS_SEED, workers=None):
+    """Runs every (size, temperature) point that isn't cached, caching each as it finishes.
+    Returns a dictionary of size to an array of results, one row per temperature, in the order of ising_model.RESULT_COLUMNS.
+    """
+
+    settings = Settings()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    results = {size: {} for size in sizes}
+    tasks = []
+    for size in sizes:
+        for temperature in temperatures:
+            cached = LoadCachedPoint(size, temperature, seed, settings)
+            if cached is not None:
+                results[size][temperature] = cached
+                continue
+
+            runSeed, gridSeed = _PointSeeds(size, temperature, seed)
+            initialGrid = sweep_runner.RandomInitialGrid(size, gridSeed, ising_model.DIMENSIONS)
+            tasks.append(sweep_runner.SweepTask(temperature, ising_model.B_FIELD, size, runSeed, initialGrid))
+
+    print(f"{sum(len(points) for points in results.values())} points cached, {len(tasks)} to run")
+
+    start = time.perf_counter()
+    costs = [float(task.gridSize) ** FSS_COST_EXPONENT for task in tasks]
+    for task, result in sweep_runner.RunBalancedSweep(_RunPoint, tasks, costs, workers):
+        values = [task.temperature, *(float(value) for value in result)]
+        results_store.WriteJson(_CacheFile(task.gridSize, task.temperature, seed), {"settings": settings, "result": values})
+        results[task.gridSize][task.temperature] = values
+
+        print(f"L = {task.gridSize} kBT = {task.temperature} J calculated ({time.perf_counter() - start:.0f} s)")
+
+    return {size: np.array([results[size][temperature] for temperature in temperatures]) for size in sizes}
+
+def _Column(name):
+    return ising_model.RESULT_COLUMNS.index(name)
+
+def BinderCrossings(temperatures, binders):
+    """Temperatures where the Binder cumulant curves of neighbouring sizes cross, by linear interpolation.
+    Parameters:
+        binders : Binder cumulant at each temperature for each size, smallest size first.
+    Returns one crossing per neighbouring pair of sizes, nan where the curves don't cross.
+    """
+
+    crossings = []
+    for smaller, larger in zip(binders[:-1], binders[1:]):
+        difference = np.asarray(larger) - np.asarray(smaller)
+        changes = np.nonzero(np.sign(difference[:-1]) * np.sign(difference[1:]) < 0)[0]
+        if len(changes) == 0:
+            crossings.append(np.nan)
+            continue
+
+        #The crossing nearest the middle of the range, away from noise where the curves merge at either end
+        i = changes[np.argmin(np.abs(changes - len(difference) / 2))]
+        fraction = difference[i] / (difference[i] - difference[i + 1])
+        crossings.append(temperatures[i] + fraction * (temperatures[i + 1] - temperatures[i]))
+
+    return np.array(crossings)
+
+def PeakOf(temperatures, values):
+    """Position and height of the maximum of a sampled curve, refined with a parabola through the highest point and its neighbours."""
+
+    i = int(np.argmax(values))
+    if i == 0 or i == len(values) - 1:
+        return temperatures[i], values[i]
+
+    coefficients = np.polyfit(temperatures[i - 1:i + 2], values[i - 1:i + 2], 2)
+    if coefficients[0] >= 0.0:
+        return temperatures[i], values[i]
+
+    position = -coefficients[1] / (2.0 * coefficients[0])
+    return position, np.polyval(coefficients, position)
+
+def PowerLawExponent(sizes, values):
+    """Exponent of a least squares fit of values ~ L^exponent."""
+    return np.polyfit(np.log(sizes), np.log(values), 1)[0]
+
+def Analyse(sizes, temperatures, results):
+    """Extracts T_c and the exponent ratios from the results of RunPoints, returning them as a dictionary."""
+
+    sizes = sorted(sizes)
+    temperatures = np.asarray(temperatures)
+
+    crossings = BinderCrossings(temperatures, [results[size][:, _Column("binder")] for size in sizes])
+    valid = crossings[~np.isnan(crossings)]
+    criticalTemperature = valid[-1] if len(valid) > 0 else np.nan #The largest sizes have the smallest corrections
+
+    susceptibilityPeaks = np.array([PeakOf(temperatures, results[size][:, _Column("susceptibility")]) for size in sizes])
+    heatCapacityPeaks = np.array([PeakOf(temperatures, results[size][:, _Column("heatcap")]) for size in sizes])
+
+    #Peak positions approach T_c as L^(-1/nu)
+    shifts = np.abs(susceptibilityPeaks[:, 0] - criticalTemperature)
+    inverseNu = -PowerLawExponent(sizes, shifts) if np.all(shifts > 0.0) else np.nan
+
+    return {
+        "sizes": sizes,
+        "binderCrossings": crossings.tolist(),
+        "criticalTemperature": float(criticalTemperature),
+        "susceptibilityPeaks": susceptibilityPeaks.tolist(),
+        "heatCapacityPeaks": heatCapacityPeaks.tolist(),
+        "gammaOverNu": float(PowerLawExponent(sizes, susceptibilityPeaks[:, 1])),
+        "alphaOverNu": float(PowerLawExponent(sizes, heatCapacityPeaks[:, 1])),
+        "inverseNu": float(inverseNu),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a finite size scaling study over several lattice sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=FSS_SIZES, help="lattice sizes to run")
+    parser.add_argument("--seed", type=int, default=FSS_SEED, help="base seed, points are cached per seed")
+    parser.add_argument("--workers", type=int, default=ising_model.WORKER_COUNT, help="worker processes, defaults to every core")
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    results = RunPoints(sizes, FSS_TEMPERATURES, args.seed, args.workers)
+
+    rows = np.concatenate([np.column_stack([np.full(len(FSS_TEMPERATURES), size), results[size]]) for size in sizes])
+    os.makedirs(os.path.dirname(OUTPUT_FILE) or ".", exist_ok=True)
+    results_store.WriteCsv(OUTPUT_FILE, RESULT_COLUMNS, rows.T)
+
+    summary = Analyse(sizes, FSS_TEMPERATURES, results)
+    results_store.WriteJson(SUMMARY_FILE, summary)
+
+    print(f"\n{'sizes':>10} {'Binder crossing':>16}")
+    for smaller, larger, crossing in zip(sizes[:-1], sizes[1:], summary["binderCrossings"]):
+        print(f"{smaller:>4} {larger:>5} {crossing:16.4f}")
+    print(f"\nT_c = {summary['criticalTemperature']:.4f}")
+    print(f"gamma/nu = {summary['gammaOverNu']:.3f}, alpha/nu = {summary['alphaOverNu']:.3f}, 1/nu = {summary['inverseNu']:.3f}")
+    print(f"Results written to {OUTPUT_FILE} and {SUMMARY_FILE}")
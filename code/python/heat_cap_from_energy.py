@@ -2,56 +2,66 @@
 """
 
 import numpy as np
-from scipy import optimize
+import results_store
 
 INPUT_FILE = "./energy-1000.csv"
 OUTPUT_FILE = "./heat-cap-1000.csv"
 AVG_POINTS = 20 #(Either side)
 
-#Read in data
-energyData = []
+def LoadEnergyData(fileName):
+    """Reads the temperature and energy columns of a CSV file with a header row."""
 
-fileBuff = open(INPUT_FILE, 'r')
-for line in fileBuff.read().split("\n"):
-    line = line.split(",")
+    data = results_store.ReadCsv(fileName, usecols=(0, 1))
+    return data[:, 0], data[:, 1]
 
-    if len(line) == 2:
-        try:
-            energyData.append((float(line[0]), float(line[1])))
-        except ValueError:
-            pass
-fileBuff.close()
+def WindowSums(values, windowSize):
+    """Sums of every run of windowSize consecutive values, from cumulative sums."""
 
-def square_distance(y_value, fit_value):
-    return (y_value - fit_value)**2
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    return cumulative[windowSize:] - cumulative[:-windowSize]
 
-def MinFunc(yVals, yFit):
-    return np.sum(square_distance(yVals, yFit))
+def SlidingGradient(xValues, yValues, avgPoints=AVG_POINTS, anchored=True):
+    """Least-squares gradient over a sliding window of 2 * avgPoints points, for every point with a full window.
+    The window for point i runs from i - avgPoints to i + avgPoints - 1. The x values don't need to be evenly spaced.
+    Parameters:
+        anchored : Fit a line through the first point of each window, as the original Nelder-Mead fit did,
+                   rather than an ordinary straight line fit.
+    Returns the x values of the points and their gradients.
+    """
 
-#Calculate gradients
-gradData = []
-for energyIndex in range(AVG_POINTS, len(energyData) - AVG_POINTS):
+    xValues = np.asarray(xValues, dtype=float)
+    yValues = np.asarray(yValues, dtype=float)
+    windowSize = 2 * avgPoints
+    windowCount = len(xValues) - windowSize
 
-    xValues = []
-    yValues = []
-    gradientAvg = 0.0
-    for sampleIndex in range(energyIndex - AVG_POINTS, energyIndex + AVG_POINTS):
-        #gradientAvg += (energyData[sampleIndex][1] - energyData[sampleIndex - 1][1]) / (energyData[sampleIndex][0] - energyData[sampleIndex - 1][0])
-        xValues.append(energyData[sampleIndex][0])
-        yValues.append(energyData[sampleIndex][1])
+    if windowCount <= 0:
+        return np.empty(0), np.empty(0)
 
-    xValues = np.array(xValues)
-    yValues = np.array(yValues)
+    centres = xValues[avgPoints:avgPoints + windowCount]
 
-    gradient = optimize.fmin(lambda grad : MinFunc(yValues, grad * (xValues - xValues[0]) + yValues[0]), x0=1.0)
+    #The gradient doesn't change with an offset, which keeps the sums small
+    xValues = xValues - xValues.mean()
+    yValues = yValues - yValues.mean()
 
-    #gradientAvg /= AVG_POINTS * 2.0 - 1.0
-    gradData.append((energyData[energyIndex][0], gradient[0]))
+    sumX = WindowSums(xValues, windowSize)[:windowCount]
+    sumY = WindowSums(yValues, windowSize)[:windowCount]
+    sumXX = WindowSums(xValues * xValues, windowSize)[:windowCount]
+    sumXY = WindowSums(xValues * yValues, windowSize)[:windowCount]
 
-fileBuff = open(OUTPUT_FILE, 'w')
-outData = "temp,heat-cap\n"
-for data in gradData:
-    outData += str(data[0]) + "," + str(data[1]) + "\n"
+    if anchored:
+        x0 = xValues[:windowCount]
+        y0 = yValues[:windowCount]
 
-fileBuff.write(outData)
-fileBuff.close()
\ No newline at end of file
+        covariance = sumXY - x0 * sumY - y0 * sumX + windowSize * x0 * y0
+        variance = sumXX - 2.0 * x0 * sumX + windowSize * x0 * x0
+    else:
+        covariance = windowSize * sumXY - sumX * sumY
+        variance = windowSize * sumXX - sumX * sumX
+
+    return centres, covariance / variance
+
+if __name__ == "__main__":
+    temps, energies = LoadEnergyData(INPUT_FILE)
+    gradTemps, gradients = SlidingGradient(temps, energies)
+
+    results_store.WriteCsv(OUTPUT_FILE, ["temp", "heat-cap"], [gradTemps, gradients])
@@ -0,0 +1,72 @@
+"""Opt-in counters and phase timers for the lattice engines.
+A grid only records into an Instrumentation while one is attached with EnableInstrumentation, so an uninstrumented grid
+pays a single None check per batch of updates. Counts are kept per local configuration (spin and neighbour sum), the
+index of the acceptance tables, which gives the histogram of proposed and accepted energy changes directly.
+"""
+
+import time
+import numpy as np
+
+class Instrumentation():
+    """Proposal and acceptance counts per table index, cluster counts, and the seconds spent in each named phase.
+    Parameters:
+        energyChanges : Energy change of a flip for each table index, the flattened energy table of the grid.
+    """
+
+    def __init__(self, energyChanges):
+        self._energyChanges = np.asarray(energyChanges, dtype=float).ravel()
+        self.Reset()
+
+    def Reset(self):
+        self.proposals = np.zeros(len(self._energyChanges), dtype=np.int64)
+        self.acceptances = np.zeros(len(self._energyChanges), dtype=np.int64)
+        self.clusterCount = 0 #Wolff clusters, or Swendsen-Wang clusters over every sweep
+        self.clusterSites = 0
+        self._phaseSeconds = {}
+        self._phaseCalls = {}
+
+    def SetEnergyChanges(self, energyChanges):
+        """Replaces the energy change of each table index after the field changes. Counts so far stay under the old values."""
+        self._energyChanges = np.asarray(energyChanges, dtype=float).ravel()
+
+    def Lap(self, phase, start):
+        """Adds the time since start to a phase and returns the current time, to start the next phase from."""
+
+        now = time.perf_counter()
+        self._phaseSeconds[phase] = self._phaseSeconds.get(phase, 0.0) + (now - start)
+        self._phaseCalls[phase] = self._phaseCalls.get(phase, 0) + 1
+        return now
+
+    def CountTableIndices(self, proposed, accepted):
+        """Counts proposals and acceptances from arrays of the table indices of each."""
+        self.proposals += np.bincount(proposed.ravel(), minlength=len(self.proposals))
+        self.acceptances += np.bincount(accepted.ravel(), minlength=len(self.acceptances))
+
+    def CountClusters(self, clusters, sites):
+        self.clusterCount += clusters
+        self.clusterSites += sites
+
+    def Report(self):
+        """The counters and timings as a dictionary of plain values, ready to write as JSON.
+        Energy changes are merged over the table indices that share them.
+        """
+
+        energyChanges, inverse = np.unique(self._energyChanges, return_inverse=True)
+        proposals = np.bincount(inverse, weights=self.proposals, minlength=len(energyChanges))
+        acceptances = np.bincount(inverse, weights=self.acceptances, minlength=len(energyChanges))
+
+        totalProposals = int(self.proposals.sum())
+        totalAcceptances = int(self.acceptances.sum())
+        totalSeconds = sum(self._phaseSeconds.values())
+
+        return {
+            "proposals": totalProposals,
+            "acceptances": totalAcceptances,
+            "acceptanceRate": totalAcceptances / totalProposals if totalProposals > 0 else None,
+            "energyChanges": [{"energyChange": float(change), "proposals": int(proposed), "acceptances": int(accepted)}
+                              for change, proposed, accepted in zip(energyChanges, proposals, acceptances) if proposed > 0],
+            "clusterCount": self.clusterCount,
+            "meanClusterSize": self.clusterSites / self.clusterCount if self.clusterCount > 0 else None,
+            "phases": {phase: {"seconds": seconds, "calls": self._phaseCalls[phase], "fraction": seconds / totalSeconds}
+                       for phase, seconds in sorted(self._phaseSeconds.items(), key=lambda item: -item[1])},
+        }
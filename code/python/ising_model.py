@@ -1,111 +1,332 @@
-import spin_grid
-import array
-import numpy.random as rand
+import spin_grid, packed_grid, replica_grid, sweep_runner, adaptive_sweep, equilibration, observables, results_store, checkpoint, reweighting, rng_streams
+import os, time
 import numpy as np
 
 #Parameters
 GRID_SIZE = 100
+DIMENSIONS = 2 #Lattice dimensions, the grid has GRID_SIZE sites along every axis
+PERIODIC_BOUNDARIES = False #Wrap every axis around, otherwise the edges are open
 B_FIELD = 0.0
 INTERACTION_STRENGTH = 1.0
 
 TEMPERATURE_RANGE = (0.1, 3.0)
-TEMPERATURE_COUNT = 50
+TEMPERATURE_COUNT = 50 #Evenly spaced temperatures, or the most the adaptive schedule will run
+
+ADAPTIVE_TEMPERATURES = False #Refine the temperature grid where the curves are least resolved, separately run temperatures only
+ADAPTIVE_INITIAL_COUNT = 9 #Evenly spaced temperatures run before any refinement
+ADAPTIVE_TOLERANCE = 2e-3 #Intervals are split until their estimated interpolation error and error bars (energy per spin) are below this
+ADAPTIVE_MIN_SPACING = 0.005 #Intervals are never split below this width
+ADAPTIVE_BATCH_SIZE = 8 #Temperatures chosen together, fixed rather than one per worker so the chosen temperatures don't depend on the worker count
 
 MAX_ITERATIONS = 10000000 #Maximum iterations to run no matter what
 SAMPLE_ITERATIONS = 100000 #The number of iterations to average the change over
-TOLERANCE = 1e-3 #A tolerance value for considering a change large enough to mean the system hasn't reached equilibrium
+SAMPLE_SWEEPS = max(1, SAMPLE_ITERATIONS // GRID_SIZE**DIMENSIONS) #Sweeps between convergence checks, the same number of spin updates as SAMPLE_ITERATIONS
+TARGET_ERROR = 1e-3 #Standard error of the mean energy per spin at which a temperature is finished
+
+UPDATE_ALGORITHM = spin_grid.ALGORITHM_CHECKERBOARD #Algorithm used when temperatures are run separately, cluster updates decorrelate far faster near T_c
+PACKED_LATTICE = False #Store separately run grids 64 spins to a word for very large grids, checkerboard updates only
+PARALLEL_TEMPERING = False #Sweep every temperature together as one batch of replicas instead of running each separately, open 2D grids only
+REPLICA_EXCHANGE = True #Allow neighbouring temperatures to swap configurations
+WORKER_COUNT = None #Processes used when temperatures are run separately (None uses every core)
+SEED = None #Base seed for the run, None draws fresh entropy which is printed so the run can be repeated
 
+OUTPUT_RUN_DIR = "./results/run-temp" #Binary results, appended as each temperature finishes so an interrupted run can resume
+CHECKPOINT_DIR = OUTPUT_RUN_DIR + "/checkpoints" #Unfinished temperatures are saved here and continued exactly on the next run (None disables)
+CHECKPOINT_CYCLES = 10 #Convergence checks between checkpoints
+INSTRUMENTATION_DIR = None #Proposal and acceptance counts, the energy change histogram and phase timings of each separately run temperature are written here as JSON (None disables)
+SAMPLE_DIR = None #Total energy and spin of every sweep after burn-in are saved here per temperature, for reweighting.py (None disables)
 OUTPUT_FILE_ENERGY = "./csv/energy-temp.csv"
 OUTPUT_FILE_HEAT_CAP = "./csv/heatcap-temp.csv"
+OUTPUT_FILE_SUSCEPTIBILITY = "./csv/susceptibility-temp.csv"
+
+RESULT_COLUMNS = ["temp", "energy", "energy-error", "magnetisation", "magnetisation-error", "heatcap", "susceptibility", "binder"]
+
+def _CheckpointFile(name, settings):
+    if CHECKPOINT_DIR is None:
+        return None
+    return os.path.join(CHECKPOINT_DIR, f"{name}-{checkpoint.SettingsDigest(settings)}.npz")
+
+def _CheckpointSettings(seed, settings):
+    """Every setting a checkpointed run depends on, the given ones of its kind of run and those shared by all runs.
+    Stored in the checkpoint and hashed into its name, so a run only ever resumes its own checkpoint.
+    """
+
+    seed = rng_streams.Root(seed)
+    return {**settings, "interactionStrength": INTERACTION_STRENGTH, "targetError": TARGET_ERROR, "maxIterations": MAX_ITERATIONS,
+            "sampleIterations": SAMPLE_ITERATIONS, "recordSamples": SAMPLE_DIR is not None, "bitGenerator": rng_streams.BIT_GENERATOR.__name__,
+            "seedEntropy": seed.entropy, "seedSpawnKey": list(seed.spawn_key)}
+
+def _LoadCheckpoint(checkpointFile, states, settings):
+    """Restores every object in states from a checkpoint if one exists, returning the cycle to continue from.
+    Raises a ValueError if the checkpoint was written with different settings.
+    """
+
+    if checkpointFile is None or not os.path.exists(checkpointFile):
+        return 0
+
+    saved = checkpoint.LoadCheckpoint(checkpointFile, settings)
+    for name, obj in states.items():
+        obj.SetState(saved[name])
+
+    return int(saved["loop"]["cycle"])
+
+def _SaveCheckpoint(checkpointFile, states, cycle, settings):
+    if checkpointFile is None or cycle % CHECKPOINT_CYCLES != 0:
+        return
+
+    saved = {name: obj.GetState() for name, obj in states.items()}
+    saved["loop"] = {"cycle": cycle}
+    checkpoint.SaveCheckpoint(checkpointFile, saved, settings)
+
+def _SampleFile(name):
+    return os.path.join(SAMPLE_DIR, name + ".npz")
+
+def _RemoveCheckpoint(checkpointFile):
+    if checkpointFile is not None and os.path.exists(checkpointFile):
+        os.remove(checkpointFile)
+
+def FindEquilibriumEnergy(task, initialGrid):
+    """Runs one temperature until its mean energy is known to TARGET_ERROR.
+    Returns the mean energy and average absolute spin with their standard errors, then the heat capacity and
+    susceptibility per spin and the Binder cumulant.
+    """
+    return _RunTemperature(task, initialGrid)[0]
+
+def FindEquilibriumState(task, initialGrid):
+    """Runs one temperature like FindEquilibriumEnergy, returning its results and the final spins."""
+
+    results, grid = _RunTemperature(task, initialGrid)
+    return results, grid.GetGrid()
+
+def _RunTemperature(task, initialGrid):
+
+    #Set up new grid, starting from the given spins
+    seed = rng_streams.Root(task.seed)
+    if DIMENSIONS == 2 and not PERIODIC_BOUNDARIES:
+        gridType = packed_grid.PackedSpinGrid if PACKED_LATTICE else spin_grid.SpinGrid
+        grid = gridType(task.gridSize, task.gridSize, task.field, INTERACTION_STRENGTH, seed)
+    else:
+        grid = spin_grid.HypercubicGrid((task.gridSize,) * DIMENSIONS, task.field, INTERACTION_STRENGTH, PERIODIC_BOUNDARIES, seed)
+    siteCount = task.gridSize**DIMENSIONS
+
+    #Only the unpacked grids are instrumented, a resumed temperature counts from the checkpoint on
+    timer = None
+    if INSTRUMENTATION_DIR is not None and isinstance(grid, spin_grid.HypercubicGrid):
+        timer = grid.EnableInstrumentation()
+
+    grid.SetTemperature(task.temperature)
+    grid.SetAlgorithm(UPDATE_ALGORITHM)
+    grid.SetGrid(initialGrid)
+
+    #The energy decides the burn-in, and the spin detector, fluctuations and samples are all cut with it so every
+    #result comes from the same sweeps
+    energyDetector = equilibration.EquilibriumDetector(TARGET_ERROR * siteCount)
+    spinDetector = equilibration.EquilibriumDetector(TARGET_ERROR, driftSigma=np.inf)
+    accumulator = observables.ObservableAccumulator(siteCount)
+    recorder = reweighting.SampleRecorder()
+
+    #Continue from the last checkpoint of this temperature if there is one
+    #The initial spins aren't part of the settings, a resumed run takes its spins from the checkpoint
+    runName = f"grid{task.gridSize}-d{DIMENSIONS}-B{task.field!r}-kBT{task.temperature!r}"
+    settings = _CheckpointSettings(seed, {"gridSize": task.gridSize, "dimensions": DIMENSIONS, "periodic": PERIODIC_BOUNDARIES,
+                                          "field": task.field, "temperature": task.temperature, "algorithm": UPDATE_ALGORITHM, "packed": PACKED_LATTICE})
+    checkpointFile = _CheckpointFile(runName, settings)
+    states = {"grid": grid, "energy": energyDetector, "spin": spinDetector, "accumulator": accumulator}
+    if SAMPLE_DIR is not None:
+        states["samples"] = recorder
+    startCycle = _LoadCheckpoint(checkpointFile, states, settings)
+
+    #Sweeps between checks follow the size of this grid, which can differ from GRID_SIZE
+    sampleSweeps = max(1, SAMPLE_ITERATIONS // siteCount)
+    cycles = int(MAX_ITERATIONS / SAMPLE_ITERATIONS)
+    for i in range(startCycle, cycles):
+        for sweep in range(sampleSweeps):
+            grid.Sweep(1)
+
+            if timer is not None:
+                start = time.perf_counter()
+
+            burnIn = energyDetector.BurnIn()
+            energyDetector.Add(grid._lastTotalEnergy)
+            spinDetector.Add(np.abs(grid._lastAverageSpin))
+            accumulator.Add(grid._lastTotalEnergy, grid._lastAverageSpin * siteCount)
+            if SAMPLE_DIR is not None:
+                recorder.Add(grid._lastTotalEnergy, grid._lastAverageSpin * siteCount)
+
+            #A burn-in cut discards every sample so far, this one included, from everything at once
+            if energyDetector.BurnIn() != burnIn:
+                spinDetector.Cut()
+                accumulator.Reset()
+                recorder.Reset()
 
-INITIAL_GRID = None
+            if timer is not None:
+                timer.Lap("observables", start)
 
-#Start with the same random grid each time
-def InitRandomSpins(grid):
-    global INITIAL_GRID
+        if energyDetector.IsConverged():
+            break
+
+        _SaveCheckpoint(checkpointFile, states, i + 1, settings)
+
+    if SAMPLE_DIR is not None:
+        recorder.Save(_SampleFile(runName), task.temperature, task.field, INTERACTION_STRENGTH, siteCount)
+    if timer is not None:
+        os.makedirs(INSTRUMENTATION_DIR, exist_ok=True)
+        results_store.WriteJson(os.path.join(INSTRUMENTATION_DIR, runName + ".json"), {"temperature": task.temperature, "gridSize": task.gridSize,
+                                "algorithm": UPDATE_ALGORITHM, "spinUpdates": grid._iterationNum, **timer.Report()})
+    _RemoveCheckpoint(checkpointFile)
+
+    beta = 1.0 / task.temperature
+    return (energyDetector.Mean(), energyDetector.Error(), spinDetector.Mean(), spinDetector.Error(),
+            accumulator.HeatCapacity(beta), accumulator.Susceptibility(beta), accumulator.BinderCumulant()), grid
+
+def RunAdaptiveSweep(writer, initialGrid, seedSequence):
+    """Runs the temperatures chosen by an AdaptiveSchedule in batches of ADAPTIVE_BATCH_SIZE, appending each to the writer.
+    Temperatures after the coarse grid start from the final spins of their nearest finished neighbour. Each temperature
+    is seeded from its value, so a resumed run gives it the same stream.
+    """
+
+    siteCount = GRID_SIZE**DIMENSIONS
+    schedule = adaptive_sweep.AdaptiveSchedule(TEMPERATURE_RANGE, ADAPTIVE_INITIAL_COUNT, ADAPTIVE_TOLERANCE, ADAPTIVE_MIN_SPACING, TEMPERATURE_COUNT)
+
+    #Temperatures finished before an interruption still guide the refinement, but have no grids to start from
+    finished = results_store.LoadRun(OUTPUT_RUN_DIR)[0]
+    for temp, energy, energyError, heatCap in zip(finished["temp"], finished["energy"], finished["energy-error"], finished["heatcap"]):
+        schedule.Add(float(temp), energy / siteCount, energyError / siteCount, heatCap)
 
-    setupValues = False
-    if INITIAL_GRID == None:
-        INITIAL_GRID = array.array("i", [0 for i in range(GRID_SIZE**2)])
-        setupValues = True
+    while True:
+        temps = schedule.Next(ADAPTIVE_BATCH_SIZE)
+        if len(temps) == 0:
+            break
+
+        tasks = [sweep_runner.SweepTask(temp, B_FIELD, GRID_SIZE, rng_streams.TemperatureSeed(seedSequence, temp), schedule.StartGrid(temp)) for temp in temps]
+        for task, (result, finalGrid) in sweep_runner.RunSweep(FindEquilibriumState, tasks, initialGrid, WORKER_COUNT):
+            writer.Append(dict(zip(RESULT_COLUMNS, (task.temperature, *result))))
+            schedule.Add(task.temperature, result[0] / siteCount, result[1] / siteCount, result[4], finalGrid)
+
+            print(f"kBT = {task.temperature} J calculated")
+
+    print(f"{schedule.TemperatureCount()} temperatures run")
 
-    #Initial random spin arrangement 
-    for i in range(grid._sizeX):
-        for j in range(grid._sizeY):
-            if setupValues:
-                randNum = rand.randint(1, 3)
-                
-                if randNum == 1:
-                    INITIAL_GRID[i * grid._sizeY + j] = 1
-                else:
-                    INITIAL_GRID[i * grid._sizeY + j] = -1
-            
-            grid.SetSpin(i, j, INITIAL_GRID[i * grid._sizeY + j])
+def RunParallelTempering(writer, temps, finishedTemps, initialGrid, seed):
+    """Runs the temperatures as replicas with FindEquilibriumEnergies, appending those not in finishedTemps to the writer.
+    The replicas only make sense together, so any missing temperature reruns the whole set, continuing from its
+    checkpoint, and only the missing rows are written.
+    """
 
-def FindEquilibriumEnergy(temp):
+    if all(temp in finishedTemps for temp in temps):
+        return
 
-    #Set up new grid
-    grid = spin_grid.SpinGrid(GRID_SIZE, GRID_SIZE, B_FIELD, INTERACTION_STRENGTH)
-    grid.SetTemperature(temp)
-    InitRandomSpins(grid)
+    for values in zip(temps, *FindEquilibriumEnergies(temps, initialGrid, seed)):
+        if values[0] not in finishedTemps:
+            writer.Append(dict(zip(RESULT_COLUMNS, values)))
 
-    #Last term accounts for edge cases
-    minEnergy = -GRID_SIZE * GRID_SIZE * 4 * INTERACTION_STRENGTH - B_FIELD * GRID_SIZE * GRID_SIZE + GRID_SIZE * 4 * INTERACTION_STRENGTH
-    energyTolerance = np.abs(minEnergy * TOLERANCE)
+def FindEquilibriumEnergies(temps, initialGrid, seed):
+    """Runs every temperature together as replicas until all of their mean energies are known to TARGET_ERROR.
+    Returns arrays of the same values as FindEquilibriumEnergy.
+    """
 
-    energyValue = 0.0
+    seed = rng_streams.Root(seed)
+    replicas = replica_grid.ReplicaGrid(GRID_SIZE, temps, B_FIELD, INTERACTION_STRENGTH, seed)
+    replicas.SetGrid(initialGrid)
+
+    #Each temperature's burn-in is decided by its energy, and cuts its spin detector, fluctuations and samples with it
+    energyDetectors = [equilibration.EquilibriumDetector(TARGET_ERROR * GRID_SIZE**2) for temp in temps]
+    spinDetectors = [equilibration.EquilibriumDetector(TARGET_ERROR, driftSigma=np.inf) for temp in temps]
+    accumulator = observables.ObservableAccumulator(GRID_SIZE**2, len(temps))
+    recorders = [reweighting.SampleRecorder() for temp in temps]
+
+    settings = _CheckpointSettings(seed, {"gridSize": GRID_SIZE, "field": B_FIELD, "temperatures": [float(temp) for temp in temps],
+                                          "replicaExchange": REPLICA_EXCHANGE})
+    checkpointFile = _CheckpointFile(f"replicas{GRID_SIZE}-B{B_FIELD!r}", settings)
+    states = {"replicas": replicas, "accumulator": accumulator}
+    states.update({f"energy{i}": detector for i, detector in enumerate(energyDetectors)})
+    states.update({f"spin{i}": detector for i, detector in enumerate(spinDetectors)})
+    if SAMPLE_DIR is not None:
+        states.update({f"samples{i}": recorder for i, recorder in enumerate(recorders)})
+    startCycle = _LoadCheckpoint(checkpointFile, states, settings)
 
     cycles = int(MAX_ITERATIONS / SAMPLE_ITERATIONS)
-    for i in range(cycles):
-        grid.Iterate(SAMPLE_ITERATIONS)
+    for i in range(startCycle, cycles):
+        for sweep in range(SAMPLE_SWEEPS):
+            replicas.Sweep(1, REPLICA_EXCHANGE)
+
+            burnIn = [detector.BurnIn() for detector in energyDetectors]
+            for tempIndex in range(len(temps)):
+                energyDetectors[tempIndex].Add(replicas._lastTotalEnergy[tempIndex])
+                spinDetectors[tempIndex].Add(np.abs(replicas._lastAverageSpin[tempIndex]))
+            accumulator.Add(replicas._lastTotalEnergy, replicas._lastAverageSpin * GRID_SIZE**2)
+            if SAMPLE_DIR is not None:
+                for tempIndex, recorder in enumerate(recorders):
+                    recorder.Add(replicas._lastTotalEnergy[tempIndex], replicas._lastAverageSpin[tempIndex] * GRID_SIZE**2)
 
-        #Calculate change
-        if np.abs(grid._lastTotalEnergy - energyValue) < energyTolerance:
-            energyValue = grid._lastTotalEnergy
+            #A burn-in cut discards every sample of its temperature so far, this one included, from everything at once
+            reset = [burnIn[i] != energyDetectors[i].BurnIn() for i in range(len(temps))]
+            accumulator.Reset(reset)
+            for tempIndex in np.flatnonzero(reset):
+                spinDetectors[tempIndex].Cut()
+                recorders[tempIndex].Reset()
+
+        #The replicas share one sweep so they finish together
+        if all(detector.IsConverged() for detector in energyDetectors):
             break
-        else:
-            energyValue = grid._lastTotalEnergy
-
-    return energyValue
-
-outputValues = []
-
-tempInterval = (TEMPERATURE_RANGE[1] - TEMPERATURE_RANGE[0]) / (TEMPERATURE_COUNT - 1)
-for tempNum in range(TEMPERATURE_COUNT):
-    #Calculate temperature to test
-    currentTemp = TEMPERATURE_RANGE[0] + tempInterval * tempNum
-
-    outputValues.append((currentTemp, FindEquilibriumEnergy(currentTemp)))
-
-    print(f"kBT = {currentTemp} J calculated")
-
-file_buff = open(OUTPUT_FILE_ENERGY, 'w')
-outputData = "temp,energy\n"
-for values in outputValues:
-    outputData += f"{values[0]},{values[1]}\n"
-file_buff.write(outputData)
-file_buff.close()
-
-#Generate C_V/N
-gradValues = []
-for valueIndex in range(len(outputValues)):
-    #Calculate gradient
-    gradient = 0.0
-    count = 0
-    if valueIndex > 0:
-        gradient += (outputValues[valueIndex][1] - outputValues[valueIndex - 1][1]) / (outputValues[valueIndex][0] - outputValues[valueIndex - 1][0])
-        count += 1
-    if valueIndex < len(outputValues) - 1:
-        gradient += (outputValues[valueIndex + 1][1] - outputValues[valueIndex][1]) / (outputValues[valueIndex + 1][0] - outputValues[valueIndex][0])
-        count += 1
-
-    gradient /= count
-
-    gradValues.append((outputValues[valueIndex][0] , gradient / (GRID_SIZE**2)))
-
-file_buff = open(OUTPUT_FILE_HEAT_CAP, 'w')
-outputData = "temp,heatcap\n"
-for values in gradValues:
-    outputData += f"{values[0]},{values[1]}\n"
-file_buff.write(outputData)
-file_buff.close()
\ No newline at end of file
+
+        _SaveCheckpoint(checkpointFile, states, i + 1, settings)
+
+    if SAMPLE_DIR is not None:
+        for temp, recorder in zip(temps, recorders):
+            recorder.Save(_SampleFile(f"replicas{GRID_SIZE}-B{B_FIELD!r}-kBT{temp!r}"), temp, B_FIELD, INTERACTION_STRENGTH, GRID_SIZE**2)
+    _RemoveCheckpoint(checkpointFile)
+
+    betas = 1.0 / np.asarray(temps)
+    results = [(energyDetectors[i].Mean(), energyDetectors[i].Error(), spinDetectors[i].Mean(), spinDetectors[i].Error()) for i in range(len(temps))]
+    return (*np.array(results).T, accumulator.HeatCapacity(betas), accumulator.Susceptibility(betas), accumulator.BinderCumulant())
+
+if __name__ == "__main__":
+    seedSequence = np.random.SeedSequence(SEED)
+
+    metadata = {
+        "gridSize": GRID_SIZE,
+        "dimensions": DIMENSIONS,
+        "periodic": PERIODIC_BOUNDARIES,
+        "interactionStrength": INTERACTION_STRENGTH,
+        "bField": B_FIELD,
+        "seed": seedSequence.entropy,
+        "algorithm": "replica-exchange" if PARALLEL_TEMPERING and REPLICA_EXCHANGE else UPDATE_ALGORITHM,
+    }
+    if PARALLEL_TEMPERING and (DIMENSIONS != 2 or PERIODIC_BOUNDARIES):
+        raise ValueError("Parallel tempering only supports open 2D grids, set PARALLEL_TEMPERING = False")
+    if PARALLEL_TEMPERING and ADAPTIVE_TEMPERATURES:
+        raise ValueError("Adaptive temperatures are run separately, set PARALLEL_TEMPERING = False")
+
+    #Without a set SEED every start draws a new one, and a resumed run keeps the one it was started with
+    writer = results_store.ResultWriter(OUTPUT_RUN_DIR, RESULT_COLUMNS, metadata, unchecked=["seed"] if SEED is None else [])
+
+    #A resumed run keeps its original seed, so the remaining temperatures get the same streams
+    seedSequence = np.random.SeedSequence(writer.GetMetadata()["seed"])
+    print(f"Seed entropy: {seedSequence.entropy}")
+
+    gridSeed, runSeed = seedSequence.spawn(2)
+    initialGrid = sweep_runner.RandomInitialGrid(GRID_SIZE, gridSeed, DIMENSIONS)
+
+    tempInterval = (TEMPERATURE_RANGE[1] - TEMPERATURE_RANGE[0]) / (TEMPERATURE_COUNT - 1)
+    temps = [TEMPERATURE_RANGE[0] + tempInterval * tempNum for tempNum in range(TEMPERATURE_COUNT)]
+
+    finishedTemps = set(results_store.LoadRun(OUTPUT_RUN_DIR)[0]["temp"])
+    if PARALLEL_TEMPERING:
+        RunParallelTempering(writer, temps, finishedTemps, initialGrid, runSeed)
+    elif ADAPTIVE_TEMPERATURES:
+        RunAdaptiveSweep(writer, initialGrid, runSeed)
+    else:
+        tasks = sweep_runner.MakeTasks(temps, B_FIELD, GRID_SIZE, runSeed)
+        tasks = [task for task in tasks if task.temperature not in finishedTemps]
+        for task, result in sweep_runner.RunSweep(FindEquilibriumEnergy, tasks, initialGrid, WORKER_COUNT):
+            writer.Append(dict(zip(RESULT_COLUMNS, (task.temperature, *result))))
+
+            print(f"kBT = {task.temperature} J calculated")
+
+    writer.Close()
+
+    #CSV copies for the report, heat capacity and susceptibility come straight from the fluctuations at each temperature
+    results_store.ExportCsv(OUTPUT_RUN_DIR, OUTPUT_FILE_ENERGY, RESULT_COLUMNS[:5], sortBy="temp")
+    results_store.ExportCsv(OUTPUT_RUN_DIR, OUTPUT_FILE_HEAT_CAP, ["temp", "heatcap"], sortBy="temp")
+    results_store.ExportCsv(OUTPUT_RUN_DIR, OUTPUT_FILE_SUSCEPTIBILITY, ["temp", "susceptibility", "binder"], sortBy="temp")
@@ -1,12 +1,11 @@
-import array, threading, time, sys, os, copy
-import numpy.random as rand
+import array, time, sys, os, copy
 import numpy as np
 import matplotlib.backends.backend_agg as agg
 import matplotlib.pyplot as plt
 import pygame, pygame_widgets
 from pygame_widgets.button import Button
 
-import spin_grid
+import sim_worker
 
 #Model Parameters
 GRID_SIZE = 200
@@ -17,30 +16,57 @@ B_FIELD = 0.0 #External magnetic field
 #Other options
 WINDOW_SIZE = (1600,800)
 FIG_DPI = 100
-ITERATION_COUNT = 10000
+ITERATION_COUNT = 10000 #Spin flips the worker attempts between checks for commands
+RENDER_SAMPLES = 2 #Cells averaged along each axis of a block when the grid is shrunk, larger blocks are sampled evenly (at most 7)
+DIRTY_FRACTION = 0.25 #A changed region covering more of the grid than this is redrawn whole
+GRAPH_CAPACITY = 1024 #Buckets of points held by each graph, pairs are merged when it fills
+SHOW_ACCEPTANCE_RATE = False #Instruments the worker and shows the acceptance rate of the latest interval beside the iteration count
+GRAPH_MARGIN = 0.1 #Fraction of the data range left above and below the line when the y axis is widened
 
 class Graph():
+    """A line graph drawn with matplotlib into a pygame surface, at a cost that doesn't grow with the number of points.
+    Points are held in a fixed number of buckets, each keeping the first x and the minimum and maximum y of the points
+    it covers. When the buckets fill, neighbouring pairs are merged and each bucket then covers twice as many points, so
+    the whole history stays visible with its extremes. The axes are drawn once and cached, and only the line is redrawn
+    over them until the data leaves the axis limits. The surface shares the canvas memory rather than copying it.
+    """
+
     def __init__(self):
         self._pos = (0,0)
         self._size = (0,0)
 
-        self._graphPoints = []
+        #Buckets of [x, minimum y, maximum y], and the bucket being filled
+        self._x = np.empty(GRAPH_CAPACITY)
+        self._yMin = np.empty(GRAPH_CAPACITY)
+        self._yMax = np.empty(GRAPH_CAPACITY)
+        self._bucketCount = 0
+        self._bucketPoints = 1 #Points covered by each full bucket
+        self._pending = [0, 0.0, 0.0, 0.0] #Points, x, minimum and maximum y
+
+        #Line vertices, each bucket is drawn as a vertical stroke from its minimum to its maximum
+        self._lineX = np.empty(2 * GRAPH_CAPACITY + 2)
+        self._lineY = np.empty(2 * GRAPH_CAPACITY + 2)
+
         self._xRange = [0,0]
         self._yRange = [0,0]
 
         self._fig = plt.figure(figsize=[0, 0], dpi=FIG_DPI)
         self._ax = self._fig.gca()
+        self._line, = self._ax.plot([], [], animated=True) #Animated artists are left out of full draws
+        self._canvas = agg.FigureCanvasAgg(self._fig)
 
-        self._matplotlibCache = None
-        self._imgSize = None
+        self._background = None
+        self._surface = None
 
         #Member constants
         self.BORDER = 0.05
     
     def SetSize(self, x, y, width, height):
         self._pos = (x, y)
-        self._size = (width, height)
-        self._fig.set_size_inches([self._size[0] / FIG_DPI, self._size[1] / FIG_DPI])
+        if (width, height) != self._size:
+            self._size = (width, height)
+            self._fig.set_size_inches([self._size[0] / FIG_DPI, self._size[1] / FIG_DPI])
+            self._background = None
 
     def GetGraphText(self):
         return self._ax.get_xlabel(), self._ax.get_ylabel(), self._ax.get_title()
@@ -49,9 +75,24 @@ class Graph():
         self._ax.set_xlabel(xLabel)
         self._ax.set_ylabel(yLabel)
         self._ax.set_title(title)
+        self._background = None
 
     def AddPoint(self, x, y):
-        self._graphPoints.append((x, y))
+        pending = self._pending
+        if pending[0] == 0:
+            pending[1:] = [x, y, y]
+        else:
+            pending[2] = min(pending[2], y)
+            pending[3] = max(pending[3], y)
+        pending[0] += 1
+
+        if pending[0] == self._bucketPoints:
+            if self._bucketCount == GRAPH_CAPACITY:
+                self._MergeBuckets()
+
+            self._x[self._bucketCount], self._yMin[self._bucketCount], self._yMax[self._bucketCount] = pending[1:]
+            self._bucketCount += 1
+            pending[0] = 0
 
         if x < self._xRange[0]:
             self._xRange[0] = x
@@ -63,28 +104,171 @@ class Graph():
         elif y > self._yRange[1]:
             self._yRange[1] = y
 
+    def _MergeBuckets(self):
+        """Merges neighbouring pairs of buckets, halving the number in use."""
+
+        count = self._bucketCount // 2
+        self._x[:count] = self._x[0:2 * count:2]
+        self._yMin[:count] = np.minimum(self._yMin[0:2 * count:2], self._yMin[1:2 * count:2])
+        self._yMax[:count] = np.maximum(self._yMax[0:2 * count:2], self._yMax[1:2 * count:2])
+
+        self._bucketCount = count
+        self._bucketPoints *= 2
+
+    def _UpdateLine(self):
+        count = self._bucketCount
+        self._lineX[0:2 * count:2] = self._x[:count]
+        self._lineX[1:2 * count:2] = self._x[:count]
+        self._lineY[0:2 * count:2] = self._yMin[:count]
+        self._lineY[1:2 * count:2] = self._yMax[:count]
+
+        if self._pending[0] > 0:
+            self._lineX[2 * count:2 * count + 2] = self._pending[1]
+            self._lineY[2 * count:2 * count + 2] = self._pending[2:]
+            count += 1
+
+        self._line.set_data(self._lineX[:2 * count], self._lineY[:2 * count])
+
+    def _UpdateLimits(self):
+        """Widens the axes when the data has left them, returning whether they changed.
+        The x axis doubles its span and the y axis gains a margin, so the cached axes are redrawn rarely.
+        """
+
+        xLimits = self._ax.get_xlim()
+        yLimits = self._ax.get_ylim()
+        changed = False
+
+        if self._xRange[0] < xLimits[0] or self._xRange[1] > xLimits[1]:
+            span = max(self._xRange[1] - self._xRange[0], 1)
+            self._ax.set_xlim(self._xRange[0], self._xRange[0] + 2 * span)
+            changed = True
+
+        if self._yRange[0] < yLimits[0] or self._yRange[1] > yLimits[1]:
+            margin = GRAPH_MARGIN * max(self._yRange[1] - self._yRange[0], 1)
+            self._ax.set_ylim(self._yRange[0] - margin, self._yRange[1] + margin)
+            changed = True
+
+        return changed
+
     def DrawMatPlotLib(self, screen, regen):
-        
-        if regen:
-            #Cache graph text then clear old plot
-            xLabel, yLabel, title = self.GetGraphText()
-            self._ax.clear()
-            self.SetGraphText(xLabel, yLabel, title)
+        if self._size[0] < 1 or self._size[1] < 1:
+            return
+
+        if regen or self._background is None:
+            full = self._UpdateLimits() or self._background is None
+            self._UpdateLine()
+
+            if full:
+                #Draw and cache everything but the line
+                self._canvas.draw()
+                self._background = self._canvas.copy_from_bbox(self._ax.bbox)
+            else:
+                self._canvas.restore_region(self._background)
+
+            self._ax.draw_artist(self._line)
 
-            #Add all points to plot
-            self._ax.plot([self._graphPoints[i][0] for i in range(len(self._graphPoints))], [self._graphPoints[i][1] for i in range(len(self._graphPoints))])
+            #The surface reads the canvas memory directly instead of copying it
+            self._surface = pygame.image.frombuffer(self._canvas.buffer_rgba(), self._canvas.get_width_height(), "RGBA")
 
-            canvas = agg.FigureCanvasAgg(self._fig)
-            canvas.draw()
-            renderer = canvas.get_renderer()
-            self._matplotlibCache = renderer.tostring_rgb()
+        #Draw graph
+        screen.blit(self._surface, self._pos)
 
-            self._imgSize = canvas.get_width_height()
+class LatticeView():
+    """Draws a spin grid as a single image, +1 spins black and -1 white.
+    Spins are written straight into an 8 bit palette surface with surfarray (the bytes of +1 and -1 are palette
+    entries 1 and 255), which is enlarged by a whole number of pixels per cell and blitted once. A grid with more cells
+    than there are pixels is shrunk first, each pixel showing the average spin of a block of cells. Only the region
+    that changed since the last frame is redrawn.
+    """
 
-        if self._matplotlibCache != None and self._imgSize != None:
-            #Draw graph
-            surf = pygame.image.fromstring(self._matplotlibCache, self._imgSize, "RGB")
-            screen.blit(surf, self._pos)
+    def __init__(self):
+        #Entry 1 is black and 255 white with greys between for averaged blocks, 0 is the empty grid before the first frame
+        self._palette = [(128, 128, 128)] + [((i - 1) * 255 // 254,) * 3 for i in range(1, 256)]
+
+        self._layout = None #Grid shape and space the surfaces were built for
+        self._factor = 1 #Cells per pixel along each axis of a shrunk grid
+        self._zoom = 1 #Screen pixels per pixel of the image
+        self._shades = None #Palette entry for each sum of sampled spins in a block
+        self._surface = None
+        self._scaledSurface = None
+        self._lastImage = None
+
+    def _Build(self, shape, size):
+        self._factor = max(1, int(np.ceil(max(shape) / size)))
+        imageSize = (shape[0] // self._factor, shape[1] // self._factor)
+        self._zoom = max(1, int(size // max(imageSize)))
+
+        #Fraction of +1 spins from 1 (entry 1, black) to 0 (entry 255, white)
+        count = min(self._factor, RENDER_SAMPLES)**2
+        self._shades = (255 - (np.arange(2 * count + 1) * 254 + count) // (2 * count)).astype(np.uint8)
+
+        self._surface = pygame.Surface(imageSize, depth=8)
+        self._surface.set_palette(self._palette)
+        self._scaledSurface = None
+        self._lastImage = np.empty(imageSize, dtype=np.uint8)
+
+    def _Image(self, spins):
+        """Palette indices for every pixel, a view of the spins themselves when they aren't shrunk."""
+
+        if self._factor == 1:
+            return spins.view(np.uint8)
+
+        #Each block is averaged over at most RENDER_SAMPLES^2 evenly spaced cells, so the cost follows the number of
+        #pixels rather than cells. The last partial block along each axis is left out.
+        imageSize = self._lastImage.shape
+        samples = min(self._factor, RENDER_SAMPLES)
+        offsets = [(2 * i + 1) * self._factor // (2 * samples) for i in range(samples)]
+
+        total = np.zeros(imageSize, dtype=np.int8)
+        for xOffset in offsets:
+            rows = spins[xOffset::self._factor][:imageSize[0]]
+            for yOffset in offsets:
+                total += rows[:, yOffset::self._factor][:, :imageSize[1]]
+
+        return np.take(self._shades, total + samples * samples)
+
+    def Draw(self, screen, spins, position, size, changed=True):
+        """Draws the grid into a square of the given size.
+        Parameters:
+            spins : 2D array of spins, only read during the call.
+            changed : Whether the spins may have changed since the last call, the cached image is reused if not.
+        """
+
+        layout = (spins.shape, int(size))
+        if layout != self._layout:
+            self._layout = layout
+            self._Build(spins.shape, size)
+
+        if changed or self._scaledSurface is None:
+            self._Update(self._Image(spins))
+
+        screen.blit(self._scaledSurface, position)
+
+    def _Update(self, image):
+        region = None
+        if self._scaledSurface is not None:
+            difference = image != self._lastImage
+            rows = np.flatnonzero(difference.any(axis=1))
+            if len(rows) == 0:
+                return
+
+            columns = np.flatnonzero(difference.any(axis=0))
+            region = pygame.Rect(rows[0], columns[0], rows[-1] + 1 - rows[0], columns[-1] + 1 - columns[0])
+            if region.w * region.h > DIRTY_FRACTION * image.size:
+                region = None
+
+        if region is None:
+            pygame.surfarray.blit_array(self._surface, image)
+            width, height = self._surface.get_size()
+            self._scaledSurface = pygame.transform.scale(self._surface, (width * self._zoom, height * self._zoom))
+        else:
+            #Only the bounding box of the changes is copied and enlarged
+            subSurface = self._surface.subsurface(region)
+            pygame.surfarray.blit_array(subSurface, image[region.left:region.right, region.top:region.bottom])
+            self._scaledSurface.blit(pygame.transform.scale(subSurface, (region.w * self._zoom, region.h * self._zoom)),
+                                     (region.left * self._zoom, region.top * self._zoom))
+
+        self._lastImage[:] = image
 
 class WindowHandler():
     def __init__(self, screen, StartAnim, StopAnim):
@@ -95,6 +279,7 @@ class WindowHandler():
         currentWindowSize = self._screen.get_size()
 
         self._graphDirty = True
+        self._latticeView = LatticeView()
 
         #Initialise button instances
         self._startButton = Button(screen, currentWindowSize[0] * 0.6, 10, self._buttonWidth, self._buttonHeight, text='Start', fontSize=20
@@ -113,7 +298,7 @@ class WindowHandler():
     def SetGraphDirty(self):
         self._graphDirty = True
 
-    def DrawUpdate(self, grid):
+    def DrawUpdate(self, spins, iterationNum, acceptanceRate=np.nan, changed=True):
         currentWindowSize = self._screen.get_size()
 
         self._startButton.setX(currentWindowSize[0] * 0.6)
@@ -121,24 +306,15 @@ class WindowHandler():
         self._screen.fill([200,200,200])
 
         #Text
-        text_surface = main_font.render(f'kT = {KBT} J   Iteration: {grid._iterationNum}', True, (0, 0, 0))
+        text = f'kT = {KBT} J   Iteration: {iterationNum}'
+        if not np.isnan(acceptanceRate):
+            text += f'   Acceptance: {acceptanceRate:.3f}'
+        text_surface = main_font.render(text, True, (0, 0, 0))
         self._screen.blit(text_surface, (50, 10))
     
         #Range for matrix
         matrixSize = np.min([currentWindowSize[0] / 2, currentWindowSize[1]]) - 100
-        pixelSize = (matrixSize / grid._sizeX, matrixSize / grid._sizeY)
-
-        for xIndex in range(grid._sizeX):
-            xPos = 50 + pixelSize[0] * xIndex
-            for yIndex in range(grid._sizeY):
-                yPos = 50 + pixelSize[1] * yIndex
-
-                if grid.GetSpin(xIndex, yIndex) == 1:
-                    col = [0,0,0]
-                else:
-                    col = [255,255,255]
-
-                pygame.draw.rect(self._screen, col, pygame.Rect(xPos, yPos, np.ceil(pixelSize[0]), np.ceil(pixelSize[1])))
+        self._latticeView.Draw(self._screen, spins, (50, 50), matrixSize, changed)
 
         self._drawFinished = True
 
@@ -159,16 +335,6 @@ class WindowHandler():
         if self._graphDirty:
             self._graphDirty = False
 
-def InitSpins(grid):
-    #Initial random spin arrangement 
-    for i in range(grid._sizeX):
-        for j in range(grid._sizeY):
-            randNum = rand.randint(1, 3)
-            if randNum == 1:
-                grid.SetSpin(i, j, 1)
-            else:
-                grid.SetSpin(i, j, -1)
-
 def InitPygame():
 
     pygame.init()
@@ -177,51 +343,50 @@ def InitPygame():
 
     return window
 
-START = False
+lastSequence = 0 #Sequence number of the last frame read from the worker
 
 def Update():
-    global START
-    
-    if grid.IsThreadFinished():
-        if grid._lastAverageSpin != None:
-            windowHandle._magnetisationGraph.AddPoint(grid._iterationNum, grid._lastAverageSpin)
-            windowHandle._energyGraph.AddPoint(grid._iterationNum, grid._lastTotalEnergy)
+    global lastSequence
 
-        windowHandle.DrawUpdate(grid)
-        pygame_widgets.update(events)
-        pygame.display.flip()
+    #The simulation runs independently in the worker, each frame draws the newest state it has published
+    sequence, spins, (iterationNum, totalEnergy, averageSpin, acceptanceRate) = worker.Read()
+    changed = sequence != lastSequence
+    if changed:
+        lastSequence = sequence
+        windowHandle._magnetisationGraph.AddPoint(iterationNum, averageSpin)
+        windowHandle._energyGraph.AddPoint(iterationNum, totalEnergy)
+        windowHandle.SetGraphDirty()
 
-        if START:
-            windowHandle.SetGraphDirty()
-            grid.StartIterateThread(ITERATION_COUNT)
+    windowHandle.DrawUpdate(spins, iterationNum, acceptanceRate, changed)
+    pygame_widgets.update(events)
+    pygame.display.flip()
 
 def StartAnim():
-    global START
-    START = True
+    worker.Start()
 
 def StopAnim():
-    global START
-    START = False
+    worker.Stop()
 
-grid = spin_grid.SpinGrid(GRID_SIZE, GRID_SIZE, B_FIELD, INTERACTION_STRENGTH)
-grid.SetTemperature(KBT)
-InitSpins(grid)
+#The worker process imports this module on some platforms, so the window is only created when run directly
+if __name__ == "__main__":
+    worker = sim_worker.SimulationWorker(GRID_SIZE, GRID_SIZE, KBT, B_FIELD, INTERACTION_STRENGTH, ITERATION_COUNT, instrument=SHOW_ACCEPTANCE_RATE)
 
-plt.ioff()
+    plt.ioff()
 
-window = InitPygame()
-clock = pygame.time.Clock()
-main_font = pygame.font.Font("./font/cmu-serif-roman.ttf", size=20)
+    window = InitPygame()
+    clock = pygame.time.Clock()
+    main_font = pygame.font.Font("./font/cmu-serif-roman.ttf", size=20)
 
-windowHandle = WindowHandler(window, StartAnim, StopAnim)
+    windowHandle = WindowHandler(window, StartAnim, StopAnim)
 
-while True:
-    clock.tick(30)
+    while True:
+        clock.tick(30)
 
-    events = pygame.event.get()
-    for event in events:
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit(0)
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
+                worker.Close()
+                pygame.quit()
+                sys.exit(0)
 
-    Update()
\ No newline at end of file
+        Update()
\ No newline at end of file
@@ -1,6 +1,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+try:
+    import numba
+except ImportError:
+    numba = None # steps run as plain Python instead
+
 BOLTZMANN = 1.38064852e-23 # Boltzmann constant (J/K)
 
 temperature = 100 # K
@@ -11,70 +16,219 @@ H = 0 # external magnetic field (J)
 size = 100 # lattice size
 steps = 10000 # number of steps
 
-plt.ion()
+chunkSize = 10000 # steps run between observer updates
+plotPoints = 2000 # points kept by the plot, older ones are thinned out
 pauseTime = 0.01 # seconds
 
+# one record per step, as written by recorder() and read by load_recording()
+RECORD_DTYPE = np.dtype([("step", np.int64), ("energy", np.float64), ("magnetization", np.int64)])
+
+# acceptance probability and energy change for each spin (-1, 1) and neighbour sum (-4 to 4), flattened
+def acceptance_table(J, H):
+    spin = np.array([-1, 1])[:, np.newaxis]
+    neighbours = np.arange(-4, 5)[np.newaxis, :]
+    dE = 2 * spin * (J * neighbours + H)
+    return np.minimum(1.0, np.exp(-beta * dE)).ravel(), dE.astype(float).ravel()
+
+# try to flip the spin at each (row, column) in turn, writing the energy and magnetization after every step
+# runs compiled by Numba on arrays, or as plain Python on memoryviews and lists, which index faster than arrays
+def metropolis_chunk(spins, size, rows, columns, uniforms, acceptance, changes, energy, magnetization, energies, magnetizations):
+    for k in range(len(rows)):
+        i = rows[k]
+        j = columns[k]
+        spin = spins[i * size + j]
+        neighbours = (
+            spins[((i - 1) % size) * size + j] +
+            spins[((i + 1) % size) * size + j] +
+            spins[i * size + (j - 1) % size] +
+            spins[i * size + (j + 1) % size] # periodic boundary conditions
+        )
+        index = (spin + 1) // 2 * 9 + neighbours + 4
+        if uniforms[k] < acceptance[index]:
+            spins[i * size + j] = -spin
+            energy += changes[index]
+            magnetization -= 2 * spin
+        energies[k] = energy
+        magnetizations[k] = magnetization
+    return energy, magnetization
+
+if numba is not None:
+    compiled_metropolis_chunk = numba.njit(cache=True)(metropolis_chunk)
+
 class Lattice:
     # initialize the lattice with random spins
-    def __init__(self, size, J, H):
+    # every lattice draws from its own Philox stream, so a seed (an int or a SeedSequence) reproduces a run exactly
+    def __init__(self, size, J, H, chunk=chunkSize, seed=None):
         self.size = size
         self.J = J
         self.H = H
-        self.lattice = np.random.choice([-1, 1], size=(size, size))
-        self.energy = []
-        self.energy.append(-J * np.sum(
+        self.rng = np.random.Generator(np.random.Philox(seed))
+        self.lattice = self.rng.choice([-1, 1], size=(size, size))
+        self.energy = float(-J * np.sum(
             self.lattice * (
                 np.roll(self.lattice, 1, axis=0) +
                 np.roll(self.lattice, 1, axis=1)
             )
         ) - H * np.sum(self.lattice))
-        self.magnetization = []
-        self.magnetization.append(np.sum(self.lattice))
-        self.fig, self.axs = plt.subplots(1, 3, figsize=(14, 4))
-        plt.subplots_adjust(wspace=0.5)
-
-    # plot the lattice, energy, and magnetization
-    def plot(self):
-        step = len(self.energy)
-        if step % 100 != 0: # plot every 100 steps, it's too slow to plot every step
-            return
-        self.axs[0].imshow(self.lattice, cmap='gray', vmin=-1, vmax=1)
-        self.axs[0].set_xticks([])
-        self.axs[0].set_yticks([])
-        self.axs[1].plot(range(step), self.energy, color='black', lw=0.5)
-        self.axs[1].set_xlabel('steps')
-        self.axs[1].set_ylabel('energy')
-        self.axs[2].plot(range(step), self.magnetization, color='black', lw=0.5)
-        self.axs[2].set_xlabel('steps')
-        self.axs[2].set_ylabel('magnetization')
-        plt.pause(pauseTime)
+        self.magnetization = int(np.sum(self.lattice))
+        self.step = 0
+
+        # the random numbers, and the energy and magnetization after each step, of a chunk, reused for every chunk
+        self.chunk = chunk
+        self.uniforms = np.empty((chunk, 3))
+        self.sites = np.empty((2, chunk), dtype=np.int64)
+        self.energies = np.empty(chunk)
+        self.magnetizations = np.empty(chunk, dtype=np.int64)
+        self.observers = []
+
+    # add a generator that is sent (first step, energies, magnetizations) after every chunk
+    # the arrays are overwritten by the next chunk, so observers copy anything they keep
+    def subscribe(self, observer):
+        next(observer)
+        self.observers.append(observer)
+        return observer
 
-    # try to flip a spin and calculate the change in energy and magnetization
-    def flip(self, i, j):
-        dE = 2 * self.J * self.lattice[i, j] * (
-            self.lattice[(i - 1) % self.size, j] +
-            self.lattice[(i + 1) % self.size, j] +
-            self.lattice[i, (j - 1) % self.size] +
-            self.lattice[i, (j + 1) % self.size] # periodic boundary conditions
-        ) + 2 * self.H * self.lattice[i, j]
-        if dE <= 0 or np.random.rand() < np.exp(-beta * dE):
-            self.lattice[i, j] *= -1
-            return dE, 2 * self.lattice[i, j]
-        return 0, 0
-
-    # run the Metropolis algorithm
+    # finish every observer, letting them close files and store results
+    def close(self):
+        for observer in self.observers:
+            observer.close()
+        self.observers = []
+
+    # run the Metropolis algorithm, drawing the random numbers for a chunk of steps at a time
     def metropolis(self, steps):
-        for _ in range(steps):
-            i, j = np.random.randint(self.size, size=2)
-            dE, dM = self.flip(i, j)
-            self.energy.append(self.energy[-1] + dE)
-            self.magnetization.append(self.magnetization[-1] + dM)
-            self.plot()
-    
-
-lattice = Lattice(size, J, H)
-lattice.metropolis(steps)
-print(lattice.energy[-1], lattice.magnetization[-1])
-
-plt.ioff()
-plt.show()
+        acceptance, changes = acceptance_table(self.J, self.H)
+        flat = self.lattice.reshape(-1)
+
+        done = 0
+        while done < steps:
+            n = min(self.chunk, steps - done)
+
+            # a row and column, as floor(u * size), and an acceptance test for each step, drawn together so the
+            # stream doesn't depend on the chunk size
+            draws = self.rng.random(out=self.uniforms[:n])
+            rows = np.multiply(draws[:, 0], self.size, out=self.sites[0, :n], casting="unsafe")
+            columns = np.multiply(draws[:, 1], self.size, out=self.sites[1, :n], casting="unsafe")
+            uniforms = draws[:, 2]
+            energies = self.energies[:n]
+            magnetizations = self.magnetizations[:n]
+
+            if numba is not None:
+                self.energy, self.magnetization = compiled_metropolis_chunk(
+                    flat, self.size, rows, columns, uniforms, acceptance, changes,
+                    self.energy, self.magnetization, energies, magnetizations)
+            else:
+                self.energy, self.magnetization = metropolis_chunk(
+                    memoryview(flat), self.size, rows.tolist(), columns.tolist(), uniforms.tolist(),
+                    acceptance.tolist(), changes.tolist(), self.energy, self.magnetization,
+                    memoryview(energies), memoryview(magnetizations))
+            self.energy = float(self.energy)
+            self.magnetization = int(self.magnetization)
+
+            for observer in self.observers:
+                observer.send((self.step, energies, magnetizations))
+            self.step += n
+            done += n
+
+# plot the lattice, energy, and magnetization after every chunk
+# keeps at most `points` evenly spaced steps, dropping every other one and halving the spacing whenever it fills,
+# so the cost of a plot doesn't grow with the length of the run
+def plotter(lattice, points=plotPoints):
+    fig, axs = plt.subplots(1, 3, figsize=(14, 4))
+    plt.subplots_adjust(wspace=0.5)
+
+    image = axs[0].imshow(lattice.lattice, cmap='gray', vmin=-1, vmax=1)
+    axs[0].set_xticks([])
+    axs[0].set_yticks([])
+    energyLine, = axs[1].plot([], [], color='black', lw=0.5)
+    axs[1].set_xlabel('steps')
+    axs[1].set_ylabel('energy')
+    magnetizationLine, = axs[2].plot([], [], color='black', lw=0.5)
+    axs[2].set_xlabel('steps')
+    axs[2].set_ylabel('magnetization')
+
+    history = np.empty(points, dtype=RECORD_DTYPE)
+    count = 0
+    spacing = 1
+    nextStep = 0
+    while True:
+        first, energies, magnetizations = yield
+
+        n = len(energies)
+        while True:
+            if nextStep < first: # the next step to keep was in an earlier chunk, move on to the first one in this chunk
+                nextStep += (first - nextStep + spacing - 1) // spacing * spacing
+            if nextStep >= first + n:
+                break
+
+            if count == points:
+                count = (points + 1) // 2
+                history[:count] = history[0:points:2]
+                spacing *= 2
+                nextStep = history["step"][count - 1] + spacing
+                continue
+
+            taken = np.arange(nextStep - first, n, spacing)[:points - count]
+            history["step"][count:count + len(taken)] = first + taken
+            history["energy"][count:count + len(taken)] = energies[taken]
+            history["magnetization"][count:count + len(taken)] = magnetizations[taken]
+            count += len(taken)
+            nextStep = first + taken[-1] + spacing
+
+        image.set_data(lattice.lattice)
+        energyLine.set_data(history["step"][:count], history["energy"][:count])
+        magnetizationLine.set_data(history["step"][:count], history["magnetization"][:count])
+        for ax in axs[1:]:
+            ax.relim()
+            ax.autoscale_view()
+        plt.pause(pauseTime)
+
+# keep running means over every step in `results`: energy, energy squared, magnetization, |magnetization| and
+# magnetization squared, with the number of steps under "steps"
+def statistics(results):
+    sums = np.zeros(5)
+    steps = 0
+    while True:
+        first, energies, magnetizations = yield
+
+        sums += (
+            np.sum(energies), np.sum(energies ** 2), np.sum(magnetizations),
+            np.sum(np.abs(magnetizations)), np.sum(magnetizations.astype(float) ** 2)
+        )
+        steps += len(energies)
+
+        results["steps"] = steps
+        for name, total in zip(["energy", "energy_squared", "magnetization", "abs_magnetization", "magnetization_squared"], sums):
+            results[name] = total / steps
+
+# append every step to a binary file of RECORD_DTYPE records, flushed after each chunk
+def recorder(filename):
+    with open(filename, "wb") as file:
+        records = None
+        while True:
+            first, energies, magnetizations = yield
+
+            if records is None or len(records) < len(energies):
+                records = np.empty(len(energies), dtype=RECORD_DTYPE)
+            chunk = records[:len(energies)]
+            chunk["step"] = np.arange(first, first + len(energies))
+            chunk["energy"] = energies
+            chunk["magnetization"] = magnetizations
+            chunk.tofile(file)
+            file.flush()
+
+# memory map a file written by recorder(), so long runs can be analysed without loading them
+def load_recording(filename):
+    return np.memmap(filename, dtype=RECORD_DTYPE, mode="r")
+
+
+if __name__ == "__main__":
+    plt.ion()
+
+    lattice = Lattice(size, J, H, chunk=100) # small chunks so the short demo run animates
+    lattice.subscribe(plotter(lattice))
+    lattice.metropolis(steps)
+    lattice.close()
+    print(lattice.energy, lattice.magnetization)
+
+    plt.ioff()
+    plt.show()
@@ -0,0 +1,85 @@
+"""Streaming accumulation of thermodynamic observables from the fluctuations of a simulation.
+"""
+
+import numpy as np
+
+class ObservableAccumulator():
+    """Running sums of the energy and magnetisation moments needed for C_v, susceptibility and the Binder cumulant.
+    Values can be scalars, or arrays with one entry per replica.
+    """
+
+    def __init__(self, siteCount, shape=()):
+        self._siteCount = siteCount
+
+        self._count = np.zeros(shape, dtype=np.int64)
+        self._energyShift = np.zeros(shape)
+        self._energySum = np.zeros(shape)
+        self._energySqSum = np.zeros(shape)
+        self._absMagSum = np.zeros(shape)
+        self._magSqSum = np.zeros(shape)
+        self._magFourthSum = np.zeros(shape)
+
+    def Reset(self, which=None):
+        """Clears the sums, either all of them or only the replicas selected by which."""
+        if which is None:
+            which = Ellipsis
+
+        for values in (self._count, self._energyShift, self._energySum, self._energySqSum, self._absMagSum, self._magSqSum, self._magFourthSum):
+            values[which] = 0
+
+    def Add(self, energy, magnetisation):
+        """Adds a sample of the total energy and total magnetisation."""
+
+        #Energies are summed relative to the first sample to avoid cancellation in the variance
+        first = self._count == 0
+        self._energyShift = np.where(first, energy, self._energyShift)
+        energy = energy - self._energyShift
+
+        magSq = np.square(magnetisation, dtype=float)
+
+        self._count += 1
+        self._energySum += energy
+        self._energySqSum += np.square(energy)
+        self._absMagSum += np.abs(magnetisation)
+        self._magSqSum += magSq
+        self._magFourthSum += np.square(magSq)
+
+    def GetState(self):
+        """Copies of the running sums as a dictionary of arrays, for checkpointing."""
+        return {"count": np.copy(self._count), "energyShift": np.copy(self._energyShift), "energySum": np.copy(self._energySum),
+                "energySqSum": np.copy(self._energySqSum), "absMagSum": np.copy(self._absMagSum), "magSqSum": np.copy(self._magSqSum),
+                "magFourthSum": np.copy(self._magFourthSum)}
+
+    def SetState(self, state):
+        self._count = np.array(state["count"], dtype=np.int64)
+        self._energyShift = np.array(state["energyShift"], dtype=float)
+        self._energySum = np.array(state["energySum"], dtype=float)
+        self._energySqSum = np.array(state["energySqSum"], dtype=float)
+        self._absMagSum = np.array(state["absMagSum"], dtype=float)
+        self._magSqSum = np.array(state["magSqSum"], dtype=float)
+        self._magFourthSum = np.array(state["magFourthSum"], dtype=float)
+
+    def Count(self):
+        return self._count
+
+    def MeanEnergy(self):
+        return self._energyShift + self._energySum / self._count
+
+    def MeanAbsMagnetisation(self):
+        """Mean absolute magnetisation per spin."""
+        return self._absMagSum / self._count / self._siteCount
+
+    def HeatCapacity(self, beta):
+        """Heat capacity per spin, beta^2 (<E^2> - <E>^2) / N."""
+        meanEnergy = self._energySum / self._count
+        return beta**2 * (self._energySqSum / self._count - meanEnergy**2) / self._siteCount
+
+    def Susceptibility(self, beta):
+        """Magnetic susceptibility per spin, beta (<M^2> - <|M|>^2) / N."""
+        meanAbsMag = self._absMagSum / self._count
+        return beta * (self._magSqSum / self._count - meanAbsMag**2) / self._siteCount
+
+    def BinderCumulant(self):
+        """Binder cumulant 1 - <M^4> / (3 <M^2>^2)."""
+        meanMagSq = self._magSqSum / self._count
+        return 1.0 - (self._magFourthSum / self._count) / (3.0 * meanMagSq**2)
@@ -0,0 +1,80 @@
+"""Exact results for the infinite 2D square lattice Ising model with no external field (Onsager, Yang).
+Temperatures are kBT values and every quantity is per spin. Curves are cached on disk so repeated runs are free.
+"""
+
+import os
+import numpy as np
+from scipy import special
+
+CACHE_DIR = "./cache"
+
+def CriticalTemperature(interactionStrength=1.0):
+    return 2.0 * interactionStrength / np.log(1.0 + np.sqrt(2.0))
+
+def _Coupling(temps, interactionStrength):
+    coupling = 2.0 * interactionStrength / np.asarray(temps, dtype=float)
+
+    #Elliptic modulus k = 2 sinh(2K) / cosh^2(2K), scipy takes the parameter m = k^2
+    modulus = 2.0 * np.sinh(coupling) / np.cosh(coupling)**2
+    return coupling, np.minimum(modulus**2, 1.0)
+
+def Energy(temps, interactionStrength=1.0):
+    """Internal energy per spin, -J coth(2K) [1 + (2/pi)(2 tanh^2(2K) - 1) K(k)] with K = J / kBT."""
+
+    coupling, parameter = _Coupling(temps, interactionStrength)
+    tanhSq = np.tanh(coupling)**2
+
+    #K(k) diverges at T_c where its prefactor vanishes
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ellipticTerm = np.where(parameter < 1.0, (2.0 * tanhSq - 1.0) * special.ellipk(parameter), 0.0)
+
+    return -interactionStrength / np.tanh(coupling) * (1.0 + (2.0 / np.pi) * ellipticTerm)
+
+def HeatCapacity(temps, interactionStrength=1.0):
+    """Heat capacity per spin (in units of kB), which diverges logarithmically at T_c."""
+
+    coupling, parameter = _Coupling(temps, interactionStrength)
+    tanhSq = np.tanh(coupling)**2
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        first = special.ellipk(parameter)
+        second = special.ellipe(parameter)
+        bracket = first - second - (1.0 - tanhSq) * (np.pi / 2.0 + (2.0 * tanhSq - 1.0) * first)
+
+    return (4.0 / np.pi) * (0.5 * coupling / np.tanh(coupling))**2 * bracket
+
+def Magnetisation(temps, interactionStrength=1.0):
+    """Spontaneous magnetisation per spin, (1 - sinh(2K)^-4)^(1/8) below T_c and 0 above."""
+
+    coupling = 2.0 * interactionStrength / np.asarray(temps, dtype=float)
+    base = 1.0 - np.sinh(coupling)**-4.0
+
+    return np.power(np.maximum(base, 0.0), 0.125)
+
+def OnsagerCurves(interactionStrength, startTemp, endTemp, count, cacheDir=CACHE_DIR):
+    """Evenly spaced temperatures with their exact energy, heat capacity and magnetisation.
+    Results are kept in cacheDir, keyed by the arguments.
+    Returns temps, energy, heatCap, magnetisation.
+    """
+
+    cacheFile = None
+    if cacheDir is not None:
+        cacheFile = os.path.join(cacheDir, f"onsager_J{interactionStrength!r}_T{startTemp!r}-{endTemp!r}_n{count}.npz")
+        if os.path.exists(cacheFile):
+            with np.load(cacheFile) as cached:
+                return cached["temps"], cached["energy"], cached["heatCap"], cached["magnetisation"]
+
+    temps = np.linspace(startTemp, endTemp, count)
+    energy = Energy(temps, interactionStrength)
+    heatCap = HeatCapacity(temps, interactionStrength)
+    magnetisation = Magnetisation(temps, interactionStrength)
+
+    if cacheFile is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+
+        #Write then rename so an interrupted run never leaves half a cache file
+        tempFile = cacheFile + ".tmp.npz"
+        np.savez(tempFile, temps=temps, energy=energy, heatCap=heatCap, magnetisation=magnetisation)
+        os.replace(tempFile, cacheFile)
+
+    return temps, energy, heatCap, magnetisation
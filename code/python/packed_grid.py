@@ -0,0 +1,394 @@
+"""Bit packed lattice for very large grids, storing 64 spins in each uint64 word (multispin coding).
+Bit k of word w in row x holds the spin at (x, 64 w + k), set for +1 and clear for -1. Checkerboard Metropolis
+sweeps work on whole words with bitwise operations, so a 10000x10000 grid takes 12.5 MB.
+"""
+
+import threading
+import numpy as np
+
+import spin_grid, rng_streams
+from checkpoint import GeneratorState, SetGeneratorState, OptionalFloat
+
+WORD_BITS = 64
+THRESHOLD_BITS = 32 #Acceptance probabilities are compared as 32 bit fixed point fractions
+BLOCK_WORDS = 1 << 15 #Words updated at once, which bounds the size of temporary arrays
+
+ALL_BITS = np.uint64(0xFFFFFFFFFFFFFFFF)
+EVEN_BITS = np.uint64(0x5555555555555555)
+ODD_BITS = np.uint64(0xAAAAAAAAAAAAAAAA)
+ONE = np.uint64(1)
+HIGH_SHIFT = np.uint64(WORD_BITS - 1)
+
+if hasattr(np, "bitwise_count"):
+    def PopCount(words):
+        """Total number of set bits in an array of uint64 words."""
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+else:
+    def PopCount(words):
+        """Total number of set bits in an array of uint64 words."""
+
+        #Parallel bit count for NumPy versions without bitwise_count
+        words = words - ((words >> ONE) & EVEN_BITS)
+        words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return int(((words * np.uint64(0x0101010101010101)) >> np.uint64(56)).sum(dtype=np.int64))
+
+def PackRows(spins):
+    """Packs a (sizeX, sizeY) array of -1/+1 spins into (sizeX, ceil(sizeY / 64)) words."""
+
+    sizeX, sizeY = spins.shape
+    bits = np.zeros((sizeX, -(-sizeY // WORD_BITS) * WORD_BITS), dtype=bool)
+    bits[:, :sizeY] = spins > 0
+
+    return np.packbits(bits, axis=1, bitorder="little").view("<u8").astype(np.uint64)
+
+def UnpackRows(words, sizeY):
+    """Unpacks rows of words back into an array of -1/+1 spins with sizeY columns."""
+
+    bits = np.unpackbits(words.astype("<u8").view(np.uint8), axis=1, count=sizeY, bitorder="little")
+    return 2 * bits.astype(np.int8) - 1
+
+def _BitSum(a, b, c, d):
+    """Adds four bit masks position by position, returning the bits of the count (0 to 4) lowest first."""
+
+    sumAB, carryAB = a ^ b, a & b
+    sumCD, carryCD = c ^ d, c & d
+
+    #Both pairs can only carry when all four are set, which leaves the low sums clear
+    return sumAB ^ sumCD, carryAB ^ carryCD ^ (sumAB & sumCD), carryAB & carryCD
+
+class PackedSpinGrid():
+    """Square grid with open boundaries and the same interface as spin_grid.SpinGrid, holding 1 bit per spin.
+    Updates are checkerboard Metropolis sweeps. Each spin is tested against its own random number, built a bit at a
+    time from random words and compared with the acceptance threshold of its local configuration.
+    """
+
+    def __init__(self, sizeX, sizeY, bField, interactionStrength, seed=None):
+        if sizeX < 2 or sizeY < 2:
+            raise ValueError(f"PackedSpinGrid needs at least 2 rows and columns, not {sizeX}x{sizeY}")
+
+        self._sizeX = sizeX
+        self._sizeY = sizeY
+        self._bondCount = sizeX * (sizeY - 1) + (sizeX - 1) * sizeY
+
+        self._bField = bField
+        self._interactionStrength = interactionStrength
+        self._beta = 0.0
+
+        self._thd = None
+        self._threadFinished = True
+
+        self._iterationNum = 0
+        self._lastAverageSpin = None
+        self._lastTotalEnergy = None
+
+        #Philox streams as in HypercubicGrid, one for the initial spins and one for each checkerboard colour
+        seed = rng_streams.Root(seed)
+        self._rng = rng_streams.Stream(seed)
+        self._sublatticeRngs = rng_streams.Streams(seed, 2, rng_streams.SUBLATTICE_KEY)
+
+        #Rows of words with an empty row above and below, so neighbouring rows are plain slices
+        self._wordCount = -(-sizeY // WORD_BITS)
+        self._words = np.zeros((sizeX + 2, self._wordCount), dtype=np.uint64)
+        self._lattice = self._words[1:-1]
+
+        #Bits that hold sites, the padding at the end of each row always stays clear
+        self._rowMask = np.full(self._wordCount, ALL_BITS)
+        if sizeY % WORD_BITS != 0:
+            self._rowMask[-1] = (ONE << np.uint64(sizeY % WORD_BITS)) - ONE
+
+        #Sites in the first and last column, which are missing a neighbour
+        self._firstColumn = np.zeros(self._wordCount, dtype=np.uint64)
+        self._firstColumn[0] = ONE
+        self._lastColumn = np.zeros(self._wordCount, dtype=np.uint64)
+        self._lastColumn[(sizeY - 1) // WORD_BITS] = ONE << np.uint64((sizeY - 1) % WORD_BITS)
+
+        self._rowsPerBlock = max(1, BLOCK_WORDS // self._wordCount)
+        self.SetTemperature(np.inf)
+
+    def SetTemperature(self, kBT):
+        self._beta = 1.0 / kBT
+        acceptance = spin_grid.AcceptanceTable(self._beta, self._bField, self._interactionStrength)[1]
+
+        #Sites are classed by c = 2 * (disagreeing neighbours) + (missing neighbours), which gives a
+        #neighbour sum of (4 - c) * spin. Classes that share a threshold are tested together.
+        self._alwaysAccept = []
+        thresholds = {}
+        for c in range(9):
+            for spinUp, column in ((True, 8 - c), (False, c)):
+                probability = acceptance[int(spinUp), column]
+                if probability >= 1.0:
+                    self._alwaysAccept.append((c, spinUp))
+                elif probability > 0.0:
+                    thresholds.setdefault(int(probability * 2**THRESHOLD_BITS), []).append((c, spinUp))
+
+        self._thresholds = list(thresholds.items())
+
+    def SetAlgorithm(self, algorithm):
+        """Only checkerboard updates work on packed words."""
+        if algorithm != spin_grid.ALGORITHM_CHECKERBOARD:
+            raise ValueError(f"PackedSpinGrid only supports the '{spin_grid.ALGORITHM_CHECKERBOARD}' algorithm, not '{algorithm}'")
+
+    def SetGrid(self, spins):
+        """Copies a whole spin arrangement into the grid, totals are recalculated on the next iteration."""
+        for start in range(0, self._sizeX, self._rowsPerBlock):
+            self._lattice[start:start + self._rowsPerBlock] = PackRows(np.asarray(spins[start:start + self._rowsPerBlock]))
+
+        self._lastTotalEnergy = None
+        self._lastAverageSpin = None
+
+    def SetRandomGrid(self):
+        """Sets every spin to -1 or +1 with equal probability, without building an unpacked grid."""
+        self._lattice[:] = self._rng.bit_generator.random_raw(self._lattice.size).reshape(self._lattice.shape) & self._rowMask
+
+        self._lastTotalEnergy = None
+        self._lastAverageSpin = None
+
+    def GetGrid(self):
+        """Unpacks the whole grid into an int8 array of spins."""
+        return UnpackRows(self._lattice, self._sizeY)
+
+    def SetSpin(self, xPos, yPos, value):
+        if value == 1 or value == -1:
+            bit = ONE << np.uint64(yPos % WORD_BITS)
+            if value == 1:
+                self._lattice[xPos, yPos // WORD_BITS] |= bit
+            else:
+                self._lattice[xPos, yPos // WORD_BITS] &= ~bit
+
+    def GetSpin(self, xPos, yPos):
+        bit = (int(self._lattice[xPos, yPos // WORD_BITS]) >> (yPos % WORD_BITS)) & 1
+        return 2 * bit - 1
+
+    def GetState(self):
+        """The packed words, counters and generator state as a dictionary, for checkpointing."""
+        return {"words": self._lattice.copy(), "iterationNum": self._iterationNum, "rng": GeneratorState([self._rng, *self._sublatticeRngs]),
+                "lastTotalEnergy": np.nan if self._lastTotalEnergy is None else self._lastTotalEnergy,
+                "lastAverageSpin": np.nan if self._lastAverageSpin is None else self._lastAverageSpin}
+
+    def SetState(self, state):
+        self._lattice[:] = state["words"]
+        self._iterationNum = int(state["iterationNum"])
+        SetGeneratorState([self._rng, *self._sublatticeRngs], state["rng"])
+
+        self._lastTotalEnergy = OptionalFloat(state["lastTotalEnergy"])
+        self._lastAverageSpin = OptionalFloat(state["lastAverageSpin"])
+
+    def _BondAndSpinSums(self):
+        """Sums of s_i s_j over every bond (each counted once) and of the spins, from counts of disagreeing bonds and set bits."""
+
+        bondSum = self._bondCount
+        spinSum = -self._sizeX * self._sizeY
+
+        for start in range(0, self._sizeX, self._rowsPerBlock):
+            rows = self._lattice[start:start + self._rowsPerBlock]
+            nextRows = self._words[start + 2:start + 2 + len(rows)]
+            if start + len(rows) == self._sizeX:
+                nextRows = nextRows[:-1]
+
+            right = rows >> ONE
+            right[:, :-1] |= rows[:, 1:] << HIGH_SHIFT
+
+            bondSum -= 2 * PopCount((rows ^ right) & (self._rowMask & ~self._lastColumn))
+            bondSum -= 2 * PopCount(rows[:len(nextRows)] ^ nextRows)
+            spinSum += 2 * PopCount(rows)
+
+        return bondSum, spinSum
+
+    def CalculateEnergy(self):
+        """Calculates the total energy, counting each bond once."""
+
+        bondSum, spinSum = self._BondAndSpinSums()
+        self._lastTotalEnergy = -self._interactionStrength * bondSum - self._bField * spinSum
+        self._lastAverageSpin = spinSum / (self._sizeX * self._sizeY)
+
+        return self._lastTotalEnergy
+
+    def CalculateMagnetisation(self):
+        """Calculates the total magnetisation (sum of the spins), and updates the average spin."""
+
+        spinSum = 2 * PopCount(self._lattice) - self._sizeX * self._sizeY
+        self._lastAverageSpin = spinSum / (self._sizeX * self._sizeY)
+
+        return spinSum
+
+    def CalculateNeighbourCorrelation(self):
+        """Average s_i s_j over the nearest neighbour bonds, 1 when every bond is aligned."""
+        return self._BondAndSpinSums()[0] / self._bondCount
+
+    def CalculateDomainWallLength(self):
+        """Number of unaligned nearest neighbour bonds, the length of the walls between domains."""
+        return (self._bondCount - self._BondAndSpinSums()[0]) // 2
+
+    def Iterate(self, repeats):
+        """Performs whole checkerboard sweeps covering roughly repeats spin updates (at least one sweep)."""
+        self.Sweep(max(1, round(repeats / (self._sizeX * self._sizeY))))
+
+    def Sweep(self, sweeps):
+        """Performs checkerboard Metropolis sweeps, one flip attempt per spin each.
+        Parameters:
+            sweeps : How many full lattice sweeps to perform.
+        """
+
+        self._threadFinished = False
+
+        if self._lastTotalEnergy is None:
+            self.CalculateEnergy()
+
+        totalEnergyChange = 0.0
+        totalSpinChange = 0
+        for i in range(sweeps):
+            for colour in range(2):
+                for start in range(0, self._sizeX, self._rowsPerBlock):
+                    energyChange, spinChange = self._UpdateBlock(start, min(start + self._rowsPerBlock, self._sizeX), colour)
+                    totalEnergyChange += energyChange
+                    totalSpinChange += spinChange
+
+        self._iterationNum += sweeps * self._sizeX * self._sizeY
+        self._lastTotalEnergy += totalEnergyChange
+        self._lastAverageSpin += totalSpinChange / (self._sizeX * self._sizeY)
+
+        self._threadFinished = True
+
+    def _UpdateBlock(self, start, end, colour):
+        """Attempts to flip the sites of one checkerboard colour in rows start to end - 1.
+        Returns the changes in the total energy and total spin.
+        """
+
+        spins = self._words[start + 1:end + 1]
+        rowCount = end - start
+
+        #Neighbours to the left and right are the words shifted by one bit, carrying across word boundaries
+        left = spins << ONE
+        left[:, 1:] |= spins[:, :-1] >> HIGH_SHIFT
+        right = spins >> ONE
+        right[:, :-1] |= spins[:, 1:] << HIGH_SHIFT
+
+        differUp = spins ^ self._words[start:end]
+        differDown = spins ^ self._words[start + 2:end + 2]
+        differLeft = (spins ^ left) & ~self._firstColumn
+        differRight = (spins ^ right) & ~self._lastColumn
+
+        #Missing neighbours at the edges of the grid, as the bits of a count from 0 to 2
+        columnEdge = self._firstColumn | self._lastColumn
+        missingLow = np.broadcast_to(columnEdge, spins.shape).copy()
+        missingHigh = np.zeros_like(spins)
+        for rowIndex in {start, end - 1}:
+            if rowIndex == 0:
+                differUp[rowIndex - start] = 0
+            elif rowIndex == self._sizeX - 1:
+                differDown[rowIndex - start] = 0
+            else:
+                continue
+
+            missingLow[rowIndex - start] = ~columnEdge & self._rowMask
+            missingHigh[rowIndex - start] = columnEdge
+
+        #Class bits of c = 2 * disagreements + missing neighbours
+        disagree0, disagree1, disagree2 = _BitSum(differUp, differDown, differLeft, differRight)
+        classBits = [missingLow, disagree0 ^ missingHigh, disagree1 ^ (disagree0 & missingHigh), disagree2 | (disagree1 & disagree0 & missingHigh)]
+
+        #Checkerboard colour of every bit, site (x, y) is updated when x + y has the parity of colour
+        rowParity = (np.arange(start, end) + colour) % 2 == 0
+        sites = np.where(rowParity, EVEN_BITS, ODD_BITS)[:, np.newaxis] & self._rowMask
+
+        classMasks = self._ClassMasks(classBits)
+        flips = self._GroupMask(self._alwaysAccept, classMasks, spins)
+        if len(self._thresholds) > 0:
+            groups = [(threshold, self._GroupMask(members, classMasks, spins) & sites) for threshold, members in self._thresholds]
+            flips |= self._PassThresholds(groups, self._sublatticeRngs[colour])
+
+        flips &= sites
+
+        #Energy change 2 J (4 - c) + 2 B s and spin change -2 s summed over the flipped sites
+        flipCount = PopCount(flips)
+        classSum = sum((1 << i) * PopCount(flips & bits) for i, bits in enumerate(classBits))
+        spinSum = 2 * PopCount(flips & spins) - flipCount
+
+        spins ^= flips
+
+        return 2 * self._interactionStrength * (4 * flipCount - classSum) + 2 * self._bField * spinSum, -2 * spinSum
+
+    def _GroupMask(self, members, classMasks, spins):
+        """Mask of the sites in any of the (c, spinUp) classes of members."""
+
+        classes = {}
+        for c, spinUp in members:
+            classes.setdefault(c, set()).add(spinUp)
+
+        mask = np.zeros_like(spins)
+        for c, spinStates in classes.items():
+            if len(spinStates) == 2:
+                mask |= classMasks[c]
+            else:
+                mask |= classMasks[c] & (spins if True in spinStates else ~spins)
+
+        return mask
+
+    def _ClassMasks(self, classBits):
+        """Masks of the sites in each class c from 0 to 8, given the bits of c lowest first."""
+
+        bit0, bit1, bit2, bit3 = classBits
+        low = [~bit0 & ~bit1, bit0 & ~bit1, ~bit0 & bit1, bit0 & bit1]
+        high = [~bit2 & ~bit3, bit2]
+
+        masks = [low[c & 3] & high[c >> 2] for c in range(8)]
+        masks.append(bit3)
+
+        return masks
+
+    def _PassThresholds(self, groups, rng):
+        """Returns the bits that pass a Metropolis test, given (threshold, mask) groups, drawing from the stream rng.
+        Every bit has a uniform random THRESHOLD_BITS bit fraction, compared with its group's threshold from the most
+        significant bit down. A bit is decided at the first place they differ, so on average only a few random words
+        are needed, and words are dropped from the comparison once all of their bits are decided.
+        """
+
+        shape = groups[0][1].shape
+        passed = np.zeros(shape[0] * shape[1], dtype=np.uint64)
+
+        index = np.arange(passed.size)
+        masks = [mask.ravel() for threshold, mask in groups]
+        undecided = np.zeros(passed.size, dtype=np.uint64)
+        for mask in masks:
+            undecided |= mask
+        below = np.zeros(passed.size, dtype=np.uint64)
+
+        for bit in reversed(range(THRESHOLD_BITS)):
+            randomWords = rng.bit_generator.random_raw(len(index))
+
+            thresholdBits = np.zeros(len(index), dtype=np.uint64)
+            for (threshold, group), mask in zip(groups, masks):
+                if (threshold >> bit) & 1:
+                    thresholdBits |= mask
+
+            below |= undecided & ~randomWords & thresholdBits
+            undecided &= ~(randomWords ^ thresholdBits)
+
+            #Keep comparing only the words that still have undecided bits
+            keep = undecided != 0
+            if not keep.all():
+                passed[index[~keep]] = below[~keep]
+                index, undecided, below = index[keep], undecided[keep], below[keep]
+                masks = [mask[keep] for mask in masks]
+
+                if len(index) == 0:
+                    break
+
+        #Bits still equal to the threshold are not below it
+        passed[index] = below
+
+        return passed.reshape(shape)
+
+    def StartIterateThread(self, repeats):
+        """Starts the iteration thread and doesn't start the next job until the results have been drawn.
+        Parameters:
+            repeats : How many iterations to perform before drawing to the screen.
+        """
+
+        if self._threadFinished:
+            self._thd = threading.Thread(target=self.Iterate, args=(repeats,))
+            self._thd.start()
+
+    def IsThreadFinished(self):
+        return self._threadFinished
@@ -0,0 +1,151 @@
+import numpy as np
+
+from spin_grid import NeighbourSum, LatticeBondSum, CheckerboardMasks, AcceptanceTable
+from checkpoint import PackSpins, UnpackSpins, GeneratorState, SetGeneratorState
+import rng_streams
+
+class ReplicaGrid():
+    """Holds one square spin grid per temperature in a single (N, L, L) array so every replica is swept at once.
+    Neighbouring temperatures can optionally exchange configurations (parallel tempering).
+    """
+
+    def __init__(self, size, temperatures, bField, interactionStrength, seed=None):
+        self._size = size
+        self._temperatures = np.asarray(temperatures, dtype=float)
+        self._betas = 1.0 / self._temperatures
+
+        self._bField = bField
+        self._interactionStrength = interactionStrength
+
+        self._iterationNum = 0
+        self._lastAverageSpin = None
+        self._lastTotalEnergy = None
+
+        replicaCount = len(self._temperatures)
+        self._grids = np.zeros((replicaCount, size, size), dtype=np.int8)
+
+        #Every replica sweeps with a Philox stream per sublattice, the ones a single grid seeded with the replica's own
+        #seed would use, drawing into its own row of one buffer. Exchanges draw from the seed's stream
+        seed = rng_streams.Root(seed)
+        self._rng = rng_streams.Stream(seed)
+        self._replicaRngs = [rng_streams.Streams(rng_streams.Child(seed, rng_streams.REPLICA_KEY, replica), 2, rng_streams.SUBLATTICE_KEY)
+                             for replica in range(replicaCount)]
+
+        self._checkerboardSites = [np.flatnonzero(mask) for mask in CheckerboardMasks(size, size)]
+        self._uniforms = np.empty((replicaCount, len(self._checkerboardSites[0])))
+
+        #Energy changes are shared, acceptance depends on each replica's temperature
+        self._energyTable = AcceptanceTable(0.0, bField, interactionStrength)[0]
+        self._acceptanceTable = np.stack([AcceptanceTable(beta, bField, interactionStrength)[1] for beta in self._betas]).reshape(replicaCount, -1)
+
+        #Replica exchange statistics for each neighbouring pair
+        self._swapAttempts = np.zeros(replicaCount - 1, dtype=np.int64)
+        self._swapAccepts = np.zeros(replicaCount - 1, dtype=np.int64)
+        self._swapOffset = 0
+
+    def SetGrid(self, spins):
+        """Copies a spin arrangement into every replica.
+        Parameters:
+            spins : (L, L) array of spins, or (N, L, L) for a different arrangement per replica.
+        """
+
+        self._grids[:] = spins
+        self.CalculateEnergy()
+        self._lastAverageSpin = self._grids.mean(axis=(1, 2))
+
+    def _Generators(self):
+        return [self._rng, *(rng for rngs in self._replicaRngs for rng in rngs)]
+
+    def GetState(self):
+        """Every replica (packed to 1 bit per spin), the totals, exchange statistics and generator state, for checkpointing.
+        The arrays are copies, so later sweeps don't change a state that has been taken.
+        """
+        if self._lastTotalEnergy is None:
+            self.SetGrid(self._grids)
+
+        return {"grids": PackSpins(self._grids), "iterationNum": self._iterationNum, "rng": GeneratorState(self._Generators()),
+                "lastTotalEnergy": self._lastTotalEnergy.copy(), "lastAverageSpin": self._lastAverageSpin.copy(),
+                "swapAttempts": self._swapAttempts.copy(), "swapAccepts": self._swapAccepts.copy(), "swapOffset": self._swapOffset}
+
+    def SetState(self, state):
+        self._grids[:] = UnpackSpins(state["grids"], self._grids.shape)
+        self._iterationNum = int(state["iterationNum"])
+        SetGeneratorState(self._Generators(), state["rng"])
+
+        self._lastTotalEnergy = np.array(state["lastTotalEnergy"])
+        self._lastAverageSpin = np.array(state["lastAverageSpin"], dtype=float)
+
+        self._swapAttempts = np.array(state["swapAttempts"], dtype=np.int64)
+        self._swapAccepts = np.array(state["swapAccepts"], dtype=np.int64)
+        self._swapOffset = int(state["swapOffset"])
+
+    def CalculateEnergy(self):
+        """Calculates the total energy of every replica, counting each bond once."""
+
+        bonds = LatticeBondSum(self._grids, (False, False))
+
+        self._lastTotalEnergy = -self._interactionStrength * bonds - self._bField * self._grids.sum(axis=(1, 2), dtype=np.int64)
+
+        return self._lastTotalEnergy
+
+    def Sweep(self, sweeps, exchange=True):
+        """Performs checkerboard sweeps of every replica together.
+        Parameters:
+            sweeps : How many full lattice sweeps to perform.
+            exchange : Whether to attempt replica exchange swaps after every sweep.
+        """
+
+        if self._lastTotalEnergy is None:
+            self.SetGrid(self._grids)
+
+        replicaCount = self._grids.shape[0]
+        latticeSize = self._size * self._size
+
+        flatGrids = self._grids.reshape(replicaCount, -1)
+        for i in range(sweeps):
+            for colour, sites in enumerate(self._checkerboardSites):
+                #Index into the tables from the local configuration, then draw only for the sites of this sublattice
+                tableIndex = ((self._grids > 0) * 9 + NeighbourSum(self._grids) + 4).reshape(replicaCount, -1)[:, sites]
+                randomFloats = self._uniforms[:, :len(sites)]
+                for rngs, row in zip(self._replicaRngs, randomFloats):
+                    rngs[colour].random(out=row)
+
+                flips = randomFloats < np.take_along_axis(self._acceptanceTable, tableIndex, axis=1)
+                spins = flatGrids[:, sites]
+
+                self._lastTotalEnergy = self._lastTotalEnergy + np.where(flips, np.take(self._energyTable, tableIndex), 0.0).sum(axis=1)
+                self._lastAverageSpin = self._lastAverageSpin - 2 * np.where(flips, spins, 0).sum(axis=1, dtype=np.int64) / latticeSize
+                flatGrids[:, sites] = np.where(flips, -spins, spins)
+
+            if exchange:
+                self.ExchangeReplicas()
+
+        self._iterationNum += sweeps * latticeSize
+
+    def ExchangeReplicas(self):
+        """Attempts to swap the configurations of neighbouring temperatures, alternating between even and odd pairs."""
+
+        lower = np.arange(self._swapOffset, len(self._betas) - 1, 2)
+        upper = lower + 1
+        self._swapOffset = 1 - self._swapOffset
+
+        #Metropolis criterion for exchanging two configurations
+        exponent = (self._betas[lower] - self._betas[upper]) * (self._lastTotalEnergy[lower] - self._lastTotalEnergy[upper])
+        accepted = self._rng.random(len(lower)) < np.exp(np.minimum(exponent, 0.0))
+
+        self._swapAttempts[lower] += 1
+        self._swapAccepts[lower[accepted]] += 1
+
+        lower = lower[accepted]
+        upper = upper[accepted]
+        swap = np.concatenate([lower, upper])
+        swapped = np.concatenate([upper, lower])
+
+        self._grids[swap] = self._grids[swapped]
+        self._lastTotalEnergy[swap] = self._lastTotalEnergy[swapped]
+        self._lastAverageSpin[swap] = self._lastAverageSpin[swapped]
+
+    def GetSwapRates(self):
+        """Returns the fraction of accepted exchanges between each pair of neighbouring temperatures."""
+
+        return self._swapAccepts / np.maximum(self._swapAttempts, 1)
@@ -0,0 +1,156 @@
+"""Binary columnar storage for temperature sweep results.
+A run is a directory holding one .npy file per column and a JSON metadata file. Rows are appended as each
+temperature finishes, so a crashed run keeps everything it completed, and columns load as zero-copy memory maps.
+"""
+
+import json, os
+import numpy as np
+
+METADATA_FILE = "metadata.json"
+HEADER_SIZE = 128 #Fixed .npy header length so the row count can be rewritten in place
+
+def _ColumnFile(runDir, name):
+    return os.path.join(runDir, name + ".npy")
+
+def _WriteHeader(fileBuff, rowCount):
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d,), }" % rowCount
+
+    #Magic string, version 1.0, header length, then the header padded with spaces and ending in a newline
+    preamble = b"\x93NUMPY\x01\x00" + np.uint16(HEADER_SIZE - 10).tobytes()
+    fileBuff.seek(0)
+    fileBuff.write(preamble + header.ljust(HEADER_SIZE - 11).encode("latin1") + b"\n")
+
+def _ReadRowCount(fileName):
+    with open(fileName, "rb") as fileBuff:
+        np.lib.format.read_magic(fileBuff)
+        shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(fileBuff)
+    return shape[0]
+
+def WriteJson(fileName, data):
+    """Writes a JSON file atomically by renaming a finished temporary file over it."""
+
+    tempName = fileName + ".tmp"
+    with open(tempName, "w") as fileBuff:
+        json.dump(data, fileBuff, indent=2)
+    os.replace(tempName, fileName)
+
+class ResultWriter():
+    """Appends rows of float values to a run directory, one file per column.
+    Opening an existing run continues after the rows it already holds, if it was started with the same columns and
+    metadata.
+    Parameters:
+        runDir : Directory of the run, created if it doesn't exist.
+        columns : Names of the columns, in order.
+        metadata : Settings of the run, stored with it and checked against those stored when it is reopened.
+        unchecked : Names of metadata values a reopened run keeps from when it was started rather than checking,
+                    such as a seed drawn fresh by each process.
+    """
+
+    def __init__(self, runDir, columns, metadata=None, unchecked=()):
+        self._runDir = runDir
+        self._columns = list(columns)
+
+        os.makedirs(runDir, exist_ok=True)
+
+        metadataFile = os.path.join(runDir, METADATA_FILE)
+        if os.path.exists(metadataFile):
+            with open(metadataFile) as fileBuff:
+                self._metadata = json.load(fileBuff)
+
+            #Round trip through JSON so tuples compare equal to the lists they are stored as
+            expected = json.loads(json.dumps({"columns": self._columns, **(metadata or {})}))
+            different = [name for name in sorted(set(expected) | set(self._metadata))
+                         if name not in unchecked and expected.get(name) != self._metadata.get(name)]
+            if len(different) > 0:
+                details = ", ".join(f"{name} {self._metadata.get(name)!r} not {expected.get(name)!r}" for name in different)
+                raise ValueError(f"Run {runDir} was started with different settings ({details}), move it to start a new run")
+        else:
+            self._metadata = {"columns": self._columns, **(metadata or {})}
+            WriteJson(metadataFile, self._metadata)
+
+        self._rowCount = None
+        self._files = {}
+        for name in self._columns:
+            fileName = _ColumnFile(runDir, name)
+            if os.path.exists(fileName):
+                rowCount = _ReadRowCount(fileName)
+                fileBuff = open(fileName, "r+b")
+
+                #Drop anything written after the last complete row
+                fileBuff.truncate(HEADER_SIZE + 8 * rowCount)
+            else:
+                rowCount = 0
+                fileBuff = open(fileName, "w+b")
+                _WriteHeader(fileBuff, 0)
+                fileBuff.flush()
+
+            self._files[name] = fileBuff
+            self._rowCount = rowCount if self._rowCount is None else min(self._rowCount, rowCount)
+
+    def GetMetadata(self):
+        return self._metadata
+
+    def RowCount(self):
+        return self._rowCount
+
+    def Append(self, values):
+        """Appends one row, given as a dictionary of column name to value."""
+
+        #Write the data first, the header update then commits the row
+        for name in self._columns:
+            fileBuff = self._files[name]
+            fileBuff.seek(HEADER_SIZE + 8 * self._rowCount)
+            fileBuff.write(np.float64(values[name]).tobytes())
+
+        self._rowCount += 1
+        for fileBuff in self._files.values():
+            fileBuff.flush()
+            _WriteHeader(fileBuff, self._rowCount)
+            fileBuff.flush()
+
+    def Close(self):
+        for fileBuff in self._files.values():
+            fileBuff.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+def LoadRun(runDir):
+    """Loads a run as a dictionary of read-only memory mapped columns, along with its metadata."""
+
+    with open(os.path.join(runDir, METADATA_FILE)) as fileBuff:
+        metadata = json.load(fileBuff)
+
+    columns = {}
+    for name in metadata["columns"]:
+        fileName = _ColumnFile(runDir, name)
+        if _ReadRowCount(fileName) == 0:
+            columns[name] = np.empty(0)
+        else:
+            columns[name] = np.load(fileName, mmap_mode="r")
+
+    #Columns can differ by a row if a write was interrupted
+    rowCount = min(len(values) for values in columns.values())
+    return {name: values[:rowCount] for name, values in columns.items()}, metadata
+
+def WriteCsv(fileName, columnNames, columns):
+    """Writes equal length columns to a CSV file with a header row."""
+
+    np.savetxt(fileName, np.column_stack(columns), delimiter=",", header=",".join(columnNames), comments="", fmt="%s")
+
+def ReadCsv(fileName, usecols=None):
+    """Reads the numeric rows of a CSV file with a header row into a 2D array."""
+
+    return np.loadtxt(fileName, delimiter=",", skiprows=1, usecols=usecols, ndmin=2)
+
+def ExportCsv(runDir, fileName, columnNames, sortBy=None):
+    """Writes the selected columns of a run to a CSV file for the report, optionally sorted by one column."""
+
+    columns, metadata = LoadRun(runDir)
+
+    order = np.argsort(columns[sortBy], kind="stable") if sortBy is not None else slice(None)
+    WriteCsv(fileName, columnNames, [np.asarray(columns[name])[order] for name in columnNames])
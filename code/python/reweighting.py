@@ -0,0 +1,222 @@
+"""Histogram reweighting of recorded samples, giving observables at temperatures between (or near) the simulated ones.
+A run saves the total energy and total spin of every sweep after burn-in, one file per temperature. A single run is
+reweighted to nearby temperatures with Ferrenberg-Swendsen single histogram reweighting. Several runs are combined with
+the multiple histogram method (WHAM), which solves self-consistently for the free energy of each run so every sample
+contributes at every temperature, weighted by the run's statistical inefficiency.
+
+    python reweighting.py ./results/run-temp/samples --range 2.0 2.6 --count 300 --output ./csv/reweighted-temp.csv
+"""
+
+import argparse, glob, os
+import numpy as np
+
+import analysis, results_store
+
+OUTPUT_COLUMNS = ["temp", "energy", "magnetisation", "heatcap", "susceptibility", "binder", "effective-samples"]
+
+class SampleRecorder():
+    """Keeps the total energy and total spin of every sample at one temperature, for saving and reweighting later."""
+
+    def __init__(self):
+        self._energies = np.empty(1024)
+        self._spinSums = np.empty(1024, dtype=np.int32)
+        self._count = 0
+
+    def Reset(self):
+        """Drops every sample, when the burn-in cut moves."""
+        self._count = 0
+
+    def Add(self, energy, spinSum):
+        if self._count == len(self._energies):
+            self._energies = np.resize(self._energies, max(1024, 2 * self._count))
+            self._spinSums = np.resize(self._spinSums, max(1024, 2 * self._count))
+
+        self._energies[self._count] = energy
+        self._spinSums[self._count] = round(spinSum)
+        self._count += 1
+
+    def Count(self):
+        return self._count
+
+    def GetState(self):
+        """Copies of the samples so far, for checkpointing."""
+        return {"energies": self._energies[:self._count].copy(), "spinSums": self._spinSums[:self._count].copy()}
+
+    def SetState(self, state):
+        self._energies = np.array(state["energies"], dtype=float)
+        self._spinSums = np.array(state["spinSums"], dtype=np.int32)
+        self._count = len(self._energies)
+
+    def Save(self, fileName, temperature, field, interactionStrength, siteCount):
+        """Writes the samples and the conditions they were taken at to an .npz file, replacing it atomically."""
+
+        directory = os.path.dirname(fileName)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        tempName = fileName + ".tmp"
+        with open(tempName, "wb") as fileBuff:
+            np.savez(fileBuff, energies=self._energies[:self._count], spinSums=self._spinSums[:self._count], temperature=temperature,
+                     field=field, interactionStrength=interactionStrength, siteCount=siteCount)
+        os.replace(tempName, fileName)
+
+def LoadSamples(fileName):
+    """Loads a file written by SampleRecorder.Save as a dictionary."""
+
+    with np.load(fileName) as data:
+        samples = {name: data[name] for name in data.files}
+
+    for name in ["temperature", "field", "interactionStrength"]:
+        samples[name] = float(samples[name])
+    samples["siteCount"] = int(samples["siteCount"])
+
+    return samples
+
+def LoadSampleDir(sampleDir):
+    """Loads every sample file in a directory, in order of temperature."""
+
+    runs = [LoadSamples(fileName) for fileName in glob.glob(os.path.join(sampleDir, "*.npz"))]
+    return sorted(runs, key=lambda run: run["temperature"])
+
+def _LogSumExp(values, axis=None):
+    largest = np.max(values, axis=axis, keepdims=True)
+    return np.squeeze(largest, axis=axis) + np.log(np.sum(np.exp(values - largest), axis=axis))
+
+def _Observables(energies, spinSums, logWeights, beta, siteCount):
+    """Weighted averages of one set of samples, per spin as in ObservableAccumulator, with the Kish effective sample count."""
+
+    weights = np.exp(logWeights - np.max(logWeights))
+    weights /= np.sum(weights)
+
+    meanEnergy = np.dot(weights, energies)
+    energyVariance = np.dot(weights, np.square(energies - meanEnergy))
+
+    absMag = np.abs(spinSums.astype(float))
+    meanAbsMag = np.dot(weights, absMag)
+    meanMagSq = np.dot(weights, np.square(absMag))
+    meanMagFourth = np.dot(weights, np.square(np.square(absMag)))
+
+    return {
+        "energy": meanEnergy / siteCount,
+        "magnetisation": meanAbsMag / siteCount,
+        "heatcap": beta**2 * energyVariance / siteCount,
+        "susceptibility": beta * (meanMagSq - meanAbsMag**2) / siteCount,
+        "binder": 1.0 - meanMagFourth / (3.0 * meanMagSq**2),
+        "effective-samples": 1.0 / np.sum(np.square(weights)),
+    }
+
+def _CheckConditions(runs):
+    for run in runs[1:]:
+        for name in ["field", "interactionStrength", "siteCount"]:
+            if run[name] != runs[0][name]:
+                raise ValueError(f"Runs at kBT={runs[0]['temperature']} and kBT={run['temperature']} differ in {name}, "
+                                 f"{runs[0][name]} and {run[name]}")
+
+def _Inefficiency(run):
+    """Statistical inefficiency g of a run, from its energy series, so it holds about N / g independent samples."""
+    if np.var(run["energies"]) == 0.0:
+        return 1.0
+    return max(1.0, analysis.IntegratedAutocorrelationTime(run["energies"]))
+
+def SingleHistogram(run, temperatures):
+    """Reweights the samples of one run to each temperature, returning a dictionary of arrays named by OUTPUT_COLUMNS.
+    Only reliable within a few standard deviations of the run's energy distribution, watch the effective samples.
+    """
+
+    runBeta = 1.0 / run["temperature"]
+    energies = run["energies"] - np.mean(run["energies"])
+
+    results = {name: np.empty(len(temperatures)) for name in OUTPUT_COLUMNS}
+    for i, temperature in enumerate(temperatures):
+        beta = 1.0 / temperature
+        values = _Observables(run["energies"], run["spinSums"], -(beta - runBeta) * energies, beta, run["siteCount"])
+
+        results["temp"][i] = temperature
+        for name, value in values.items():
+            results[name][i] = value
+
+    return results
+
+def FreeEnergies(runs, tolerance=1e-10, maxIterations=100000):
+    """Solves the multiple histogram equations for the dimensionless free energy of each run, the first fixed at 0.
+    Samples are grouped by distinct energy, so the cost of each iteration is independent of the run lengths.
+    Returns the free energies, the distinct energies, and the log of the denominator sum_k (N_k / g_k) exp(f_k - beta_k E)
+    at each of them.
+    """
+
+    _CheckConditions(runs)
+    betas = np.array([1.0 / run["temperature"] for run in runs])
+
+    #Each run counts as its number of independent samples
+    inefficiency = np.array([_Inefficiency(run) for run in runs])
+    logEffectiveCounts = np.log([len(run["energies"]) for run in runs]) - np.log(inefficiency)
+
+    allEnergies = np.concatenate([run["energies"] for run in runs])
+    runIndex = np.repeat(np.arange(len(runs)), [len(run["energies"]) for run in runs])
+    distinctEnergies, inverse = np.unique(allEnergies, return_inverse=True)
+
+    #Histogram of every run combined, each sample weighted by 1 / g of its run
+    logHistogram = np.log(np.bincount(inverse, weights=1.0 / inefficiency[runIndex], minlength=len(distinctEnergies)))
+
+    shifted = distinctEnergies - np.mean(allEnergies)
+    exponents = -betas[:, np.newaxis] * shifted[np.newaxis, :] #-beta_k E for each run and distinct energy
+    freeEnergies = np.zeros(len(runs))
+    for iteration in range(maxIterations):
+        logDenominator = _LogSumExp(logEffectiveCounts[:, np.newaxis] + freeEnergies[:, np.newaxis] + exponents, axis=0)
+        newFreeEnergies = -_LogSumExp(logHistogram[np.newaxis, :] - logDenominator[np.newaxis, :] + exponents, axis=1)
+        newFreeEnergies -= newFreeEnergies[0]
+
+        change = np.max(np.abs(newFreeEnergies - freeEnergies))
+        freeEnergies = newFreeEnergies
+        if change < tolerance:
+            break
+    else:
+        raise RuntimeError(f"Free energies not converged to {tolerance} after {maxIterations} iterations, change {change}")
+
+    logDenominator = _LogSumExp(logEffectiveCounts[:, np.newaxis] + freeEnergies[:, np.newaxis] + exponents, axis=0)
+    return freeEnergies, distinctEnergies, logDenominator
+
+def MultiHistogram(runs, temperatures, tolerance=1e-10):
+    """Combines the samples of several runs to give the observables at each temperature, as SingleHistogram.
+    Reliable anywhere the energy distributions of neighbouring runs overlap.
+    """
+
+    freeEnergies, distinctEnergies, logDenominator = FreeEnergies(runs, tolerance)
+
+    energies = np.concatenate([run["energies"] for run in runs])
+    spinSums = np.concatenate([run["spinSums"] for run in runs])
+    logSampleWeights = np.concatenate([np.full(len(run["energies"]), -np.log(_Inefficiency(run))) for run in runs])
+
+    #Each sample's share of the combined density of states
+    logSampleWeights -= logDenominator[np.searchsorted(distinctEnergies, energies)]
+    shifted = energies - np.mean(energies)
+
+    results = {name: np.empty(len(temperatures)) for name in OUTPUT_COLUMNS}
+    for i, temperature in enumerate(temperatures):
+        beta = 1.0 / temperature
+        values = _Observables(energies, spinSums, logSampleWeights - beta * shifted, beta, runs[0]["siteCount"])
+
+        results["temp"][i] = temperature
+        for name, value in values.items():
+            results[name][i] = value
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reweights recorded samples onto a fine temperature grid.")
+    parser.add_argument("sampleDir", help="directory of sample files written by the simulation")
+    parser.add_argument("--range", type=float, nargs=2, metavar=("LOW", "HIGH"), help="temperature range, defaults to the range of the runs")
+    parser.add_argument("--count", type=int, default=200, help="number of evenly spaced temperatures")
+    parser.add_argument("--output", default="./csv/reweighted-temp.csv", help="CSV file the observables are written to")
+    args = parser.parse_args()
+
+    runs = LoadSampleDir(args.sampleDir)
+    if len(runs) == 0:
+        raise SystemExit(f"No sample files in {args.sampleDir}")
+
+    low, high = args.range or (runs[0]["temperature"], runs[-1]["temperature"])
+    temperatures = np.linspace(low, high, args.count)
+
+    results = SingleHistogram(runs[0], temperatures) if len(runs) == 1 else MultiHistogram(runs, temperatures)
+    results_store.WriteCsv(args.output, OUTPUT_COLUMNS, [results[name] for name in OUTPUT_COLUMNS])
+    print(f"{len(runs)} runs reweighted to {args.count} temperatures in {args.output}, fewest effective samples {np.min(results['effective-samples']):.0f}")
@@ -0,0 +1,42 @@
+"""Independent, reproducible random number streams for the lattice engines.
+Every stream is a counter-based Philox generator keyed by a SeedSequence and a spawn key path naming what the stream
+is for (a task, replica or sublattice), so its numbers depend only on the base seed and that path, never on how many
+processes share the work or the order they run in. Draws are made in bulk into buffers allocated once.
+"""
+
+import numpy as np
+
+BIT_GENERATOR = np.random.Philox
+
+#First element of the spawn key path of each kind of stream, below the seed of a grid or run
+SUBLATTICE_KEY = 1 #(SUBLATTICE_KEY, colour) of a checkerboard sublattice
+REPLICA_KEY = 2 #(REPLICA_KEY, replica) of a parallel tempering replica
+TEMPERATURE_KEY = 3 #(TEMPERATURE_KEY, temperature in micro units) of a temperature chosen during a run
+SPINS_KEY = 4 #(SPINS_KEY,) of the random starting spins of a grid seeded with the same seed
+
+def Root(seed):
+    """A seed as a SeedSequence, drawing fresh entropy for None, so every stream of an object can be derived from it."""
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+def Child(seed, *key):
+    """SeedSequence at a spawn key path below a seed, the same however many other children are made or in what order."""
+
+    parent = Root(seed)
+    return np.random.SeedSequence(parent.entropy, spawn_key=parent.spawn_key + tuple(int(value) for value in key), pool_size=parent.pool_size)
+
+def Stream(seed, *key):
+    """Philox Generator of the stream at a spawn key path below a seed, or of the seed itself for an empty path."""
+    return np.random.Generator(BIT_GENERATOR(Child(seed, *key)))
+
+def Streams(seed, count, *key):
+    """Generators of count streams numbered from 0 below a key path, one per replica or sublattice."""
+    seed = Root(seed)
+    return [Stream(seed, *key, i) for i in range(count)]
+
+def TemperatureSeed(seed, temperature):
+    """SeedSequence of a temperature, fixed by its value so it doesn't depend on when the temperature was chosen."""
+    return Child(seed, TEMPERATURE_KEY, round(temperature * 1e6))
+
+def RandomSpins(seed, shape):
+    """Random spins of -1 and 1 from the SPINS_KEY stream of a seed, apart from the streams a grid with that seed updates with."""
+    return Stream(seed, SPINS_KEY).choice(np.array([-1, 1], dtype=np.int8), size=shape)
@@ -0,0 +1,203 @@
+"""Runs a SpinGrid continuously in a separate process, for the GUI.
+The lattice is published through a double buffer in shared memory that the GUI reads in place, and start, stop and
+parameter changes are sent over a command queue, so neither side ever waits for the other.
+"""
+
+import multiprocessing, queue, time
+from multiprocessing import shared_memory
+import numpy as np
+
+import spin_grid, rng_streams
+
+PUBLISH_INTERVAL = 1.0 / 120.0 #Minimum seconds between published frames
+
+#Commands understood by the worker, sent as (command, value)
+COMMAND_START = "start"
+COMMAND_STOP = "stop"
+COMMAND_TEMPERATURE = "temperature"
+COMMAND_FIELD = "field"
+COMMAND_QUIT = "quit"
+
+class SharedLattice():
+    """Two copies of a spin grid in shared memory, written by one process and read by another without locks.
+    The writer fills the copy the reader isn't using, then increments the sequence counter to publish it. The reader
+    records the sequence it has taken, and the writer only publishes again once the reader has moved to the newest
+    copy, so a copy is never overwritten while it is being read. Only one reader is supported.
+    """
+
+    def __init__(self, shape, name=None):
+        self._shape = tuple(shape)
+        self._owner = name is None
+
+        headerBytes = 2 * 8 + 2 * 4 * 8
+        size = headerBytes + 2 * int(np.prod(self._shape))
+        self._block = shared_memory.SharedMemory(name=name, create=self._owner, size=size if self._owner else 0)
+
+        #[published sequence, sequence taken by the reader], then [iterations, total energy, average spin, acceptance rate] and the spins of each copy
+        self._sequences = np.ndarray((2,), dtype=np.int64, buffer=self._block.buf)
+        self._stats = np.ndarray((2, 4), dtype=float, buffer=self._block.buf, offset=2 * 8)
+        self._spins = np.ndarray((2,) + self._shape, dtype=np.int8, buffer=self._block.buf, offset=headerBytes)
+
+        if self._owner:
+            self._sequences[:] = 0
+            self._stats[:] = 0.0
+            self._spins[:] = 0
+
+    def Name(self):
+        return self._block.name
+
+    def CanPublish(self):
+        """Whether the reader has taken the newest copy, leaving the other one free."""
+        return self._sequences[1] >= self._sequences[0]
+
+    def Publish(self, grid, acceptanceRate=np.nan):
+        """Copies the spins and totals of a grid, and the acceptance rate since the last publish, into the free copy and publishes it.
+        Returns False without copying if the reader hasn't taken the newest copy yet.
+        """
+
+        if not self.CanPublish():
+            return False
+
+        sequence = int(self._sequences[0]) + 1
+        copy = sequence % 2
+
+        self._spins[copy] = grid._lattice
+        self._stats[copy] = (grid._iterationNum, grid._lastTotalEnergy, grid._lastAverageSpin, acceptanceRate)
+        self._sequences[0] = sequence
+
+        return True
+
+    def Read(self):
+        """Takes the newest copy for reading, which stays unchanged until the next call. The writer can't publish while
+        the reader holds the newest copy, so the state is at most one call behind the simulation.
+        Returns the sequence number (0 before anything is published), a read only view of the spins and the
+        iteration count, total energy, average spin and acceptance rate (nan unless the worker is instrumented).
+        """
+
+        sequence = int(self._sequences[0])
+        self._sequences[1] = sequence
+
+        spins = self._spins[sequence % 2]
+        spins.flags.writeable = False
+        iterationNum, totalEnergy, averageSpin, acceptanceRate = self._stats[sequence % 2]
+
+        return sequence, spins, (int(iterationNum), totalEnergy, averageSpin, acceptanceRate)
+
+    def Close(self):
+        """Detaches from the shared memory, and frees it if this is the process that created it."""
+
+        #Views have to be released before the block can be closed
+        self._sequences = self._stats = self._spins = None
+        self._block.close()
+        if self._owner:
+            self._block.unlink()
+
+def _WorkerMain(blockName, shape, kBT, bField, interactionStrength, iterationCount, seed, instrument, commands):
+    """Worker process loop, iterating while started and applying commands between batches of iterations."""
+
+    lattice = SharedLattice(shape, blockName)
+
+    grid = spin_grid.SpinGrid(shape[0], shape[1], bField, interactionStrength, seed)
+    timer = grid.EnableInstrumentation() if instrument else None
+    grid.SetGrid(rng_streams.RandomSpins(seed, shape))
+    grid.SetTemperature(kBT)
+    grid.CalculateEnergy()
+    grid.CalculateMagnetisation()
+
+    running = False
+    dirty = True #Whether the grid has changed since it was last published
+    lastPublish = 0.0
+    lastCounts = (0, 0) #Proposals and acceptances at the last publish
+
+    try:
+        while True:
+            #Commands are checked between batches while running. When stopped the worker waits for one, waking now
+            #and then to retry publishing if the reader hasn't allowed the newest state out yet.
+            try:
+                if running:
+                    command, value = commands.get_nowait()
+                else:
+                    command, value = commands.get(timeout=PUBLISH_INTERVAL if dirty else None)
+            except queue.Empty:
+                command = None
+
+            if command == COMMAND_QUIT:
+                break
+            elif command == COMMAND_START:
+                running = True
+            elif command == COMMAND_STOP:
+                running = False
+            elif command == COMMAND_TEMPERATURE:
+                grid.SetTemperature(value)
+            elif command == COMMAND_FIELD:
+                grid.SetMagneticField(value)
+                grid.CalculateEnergy()
+                dirty = True
+
+            if command is not None:
+                continue
+
+            if running:
+                grid.Iterate(iterationCount)
+                dirty = True
+
+            #The newest state is published as soon as the reader allows, at most once per interval
+            now = time.perf_counter()
+            if dirty and now - lastPublish >= PUBLISH_INTERVAL and lattice.CanPublish():
+                acceptanceRate = np.nan
+                if timer is not None:
+                    counts = (int(timer.proposals.sum()), int(timer.acceptances.sum()))
+                    if counts[0] > lastCounts[0]:
+                        acceptanceRate = (counts[1] - lastCounts[1]) / (counts[0] - lastCounts[0])
+                    lastCounts = counts
+
+                lattice.Publish(grid, acceptanceRate)
+                lastPublish = now
+                dirty = False
+    finally:
+        lattice.Close()
+
+class SimulationWorker():
+    """Runs a SpinGrid with random initial spins in a worker process. The newest state is read with Read().
+    Parameters:
+        sizeX, sizeY : Grid dimensions.
+        kBT, bField, interactionStrength : Model parameters, the temperature and field can be changed later.
+        iterationCount : Spin flips attempted between checks for commands.
+        seed : Seed for the initial spins and the simulation.
+        instrument : Whether the worker counts proposals and acceptances, publishing the acceptance rate of each interval.
+    """
+
+    def __init__(self, sizeX, sizeY, kBT, bField, interactionStrength, iterationCount, seed=None, instrument=False):
+        self._lattice = SharedLattice((sizeX, sizeY))
+        self._commands = multiprocessing.Queue()
+
+        args = (self._lattice.Name(), (sizeX, sizeY), kBT, bField, interactionStrength, iterationCount, seed, instrument, self._commands)
+        self._process = multiprocessing.Process(target=_WorkerMain, args=args, daemon=True)
+        self._process.start()
+
+    def Start(self):
+        self._commands.put((COMMAND_START, None))
+
+    def Stop(self):
+        self._commands.put((COMMAND_STOP, None))
+
+    def SetTemperature(self, kBT):
+        self._commands.put((COMMAND_TEMPERATURE, kBT))
+
+    def SetMagneticField(self, bField):
+        self._commands.put((COMMAND_FIELD, bField))
+
+    def Read(self):
+        """See SharedLattice.Read, the view is valid until the next call."""
+        return self._lattice.Read()
+
+    def Close(self, timeout=5.0):
+        """Stops the worker process and frees the shared memory."""
+
+        self._commands.put((COMMAND_QUIT, None))
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+        self._lattice.Close()
@@ -1,15 +1,229 @@
-import array, threading
-import numpy.random as rand
+import threading, time
 import numpy as np
 
-class SpinGrid():
-    def __init__(self, sizeX, sizeY, bField, interactionStrength):
-        self._sizeX = sizeX
-        self._sizeY = sizeY
+from checkpoint import PackSpins, UnpackSpins, GeneratorState, SetGeneratorState, OptionalFloat
+from instrumentation import Instrumentation
+import rng_streams
+
+try:
+    import numba
+except ImportError:
+    numba = None #Single spin updates run as plain Python instead
+
+#Update algorithms used by HypercubicGrid.Sweep
+ALGORITHM_METROPOLIS = "metropolis" #Random sequential single spin flips
+ALGORITHM_CHECKERBOARD = "checkerboard" #Vectorised single spin flips, one sublattice at a time
+ALGORITHM_WOLFF = "wolff" #Single cluster flips
+ALGORITHM_SWENDSEN_WANG = "swendsen-wang" #Every cluster of the lattice at once
+ALGORITHMS = (ALGORITHM_METROPOLIS, ALGORITHM_CHECKERBOARD, ALGORITHM_WOLFF, ALGORITHM_SWENDSEN_WANG)
+
+RANDOM_BATCH = 1 << 16 #Single spin updates whose random numbers are drawn together
+
+def LatticeNeighbourSum(spins, periodic):
+    """Sums the nearest neighbour spins of every site of a hypercubic lattice.
+    Parameters:
+        spins : Array of spins, the lattice is the last len(periodic) axes and any leading axes are separate lattices.
+        periodic : Whether each lattice axis wraps around, missing neighbours at open edges count as 0.
+    """
+
+    total = np.zeros(spins.shape, dtype=np.int8)
+    firstAxis = spins.ndim - len(periodic)
+
+    for axis, wraps in enumerate(periodic):
+        #Views with the current axis first, so the same slices work for every axis
+        spinView = np.moveaxis(spins, firstAxis + axis, 0)
+        totalView = np.moveaxis(total, firstAxis + axis, 0)
+
+        totalView[1:] += spinView[:-1]
+        totalView[:-1] += spinView[1:]
+        if wraps:
+            totalView[0] += spinView[-1]
+            totalView[-1] += spinView[0]
+
+    return total
+
+def LatticeBondSum(spins, periodic):
+    """Sums s_i s_j over the nearest neighbour bonds of a hypercubic lattice, counting each bond once.
+    Parameters:
+        spins : Array of spins, the lattice is the last len(periodic) axes and any leading axes are separate lattices.
+        periodic : Whether each lattice axis wraps around.
+    Returns the sum for each lattice, as int64.
+    """
+
+    firstAxis = spins.ndim - len(periodic)
+    latticeAxes = tuple(range(firstAxis, spins.ndim))
+
+    total = np.zeros(spins.shape[:firstAxis], dtype=np.int64)
+    for axis, wraps in enumerate(periodic):
+        #Views with the current axis last, so the same slices work for every axis
+        spinView = np.moveaxis(spins, firstAxis + axis, -1)
+
+        total += (spinView[..., 1:] * spinView[..., :-1]).sum(axis=latticeAxes, dtype=np.int64)
+        if wraps:
+            total += (spinView[..., 0] * spinView[..., -1]).sum(axis=latticeAxes[:-1], dtype=np.int64)
+
+    return total
+
+def LatticeBondCount(shape, periodic):
+    """Number of nearest neighbour bonds of a hypercubic lattice, as counted by LatticeBondSum.
+    A periodic axis of length 2 has two bonds between each pair of sites, both counted.
+    """
+
+    siteCount = int(np.prod(shape))
+    return sum(siteCount // length * (length if wraps else length - 1) for length, wraps in zip(shape, periodic))
+
+def NeighbourSum(spins):
+    """Sums the nearest neighbour spins of every site over the last two axes (open boundaries).
+    Parameters:
+        spins : Array of spins, any leading axes are treated as separate grids.
+    """
+
+    return LatticeNeighbourSum(spins, (False, False))
+
+def ParityMasks(shape):
+    """Returns boolean masks for the even and odd sites of a hypercubic lattice, by the sum of their coordinates.
+    No two sites of the same parity are nearest neighbours, unless a periodic axis has an odd length.
+    """
+
+    even = (np.indices(shape).sum(axis=0) % 2) == 0
+    return even, ~even
+
+def CheckerboardMasks(sizeX, sizeY):
+    """Returns boolean masks for the black and white sites of a checkerboard.
+    No two sites of the same colour are nearest neighbours, so each colour can be updated at once.
+    """
+
+    return ParityMasks((sizeX, sizeY))
+
+def LatticeNeighbourTable(shape, periodic):
+    """Flat indices of the 2d nearest neighbours of every site of a d dimensional lattice.
+    Columns 2a and 2a + 1 are the neighbours one step down and up axis a. Missing neighbours at open edges point
+    at a ghost site with index equal to the number of sites.
+    """
+
+    siteCount = int(np.prod(shape))
+    index = np.arange(siteCount).reshape(shape)
+
+    table = np.full(tuple(shape) + (2 * len(shape),), siteCount, dtype=np.intp)
+    for axis, wraps in enumerate(periodic):
+        indexView = np.moveaxis(index, axis, 0)
+        lowerView = np.moveaxis(table[..., 2 * axis], axis, 0)
+        upperView = np.moveaxis(table[..., 2 * axis + 1], axis, 0)
+
+        lowerView[1:] = indexView[:-1]
+        upperView[:-1] = indexView[1:]
+        if wraps:
+            lowerView[0] = indexView[-1]
+            upperView[-1] = indexView[0]
+
+    return table.reshape(siteCount, -1)
+
+def NeighbourTable(sizeX, sizeY):
+    """Flat indices of the four nearest neighbours of every site.
+    Missing neighbours at the open edges point at a ghost site with index sizeX * sizeY.
+    """
+
+    return LatticeNeighbourTable((sizeX, sizeY), (False, False))
+
+def ClusterLabels(siteCount, bondsA, bondsB):
+    """Labels connected clusters with an array based union-find, every site ends up pointing at the smallest index in its cluster.
+    Parameters:
+        siteCount : Number of sites.
+        bondsA, bondsB : Flat site indices at either end of each active bond.
+    """
+
+    labels = np.arange(siteCount)
+
+    while len(bondsA) > 0:
+        rootsA = labels[bondsA]
+        rootsB = labels[bondsB]
+
+        #Drop bonds that already join the same cluster
+        differ = rootsA != rootsB
+        bondsA, bondsB = bondsA[differ], bondsB[differ]
+        rootsA, rootsB = rootsA[differ], rootsB[differ]
+
+        #Hook the larger root onto the smaller one
+        np.minimum.at(labels, np.maximum(rootsA, rootsB), np.minimum(rootsA, rootsB))
+
+        #Compress paths until every site points straight at its root
+        while True:
+            parents = labels[labels]
+            if np.array_equal(parents, labels):
+                break
+            labels = parents
+
+    return labels
+
+def AcceptanceTable(beta, bField, interactionStrength, coordination=4):
+    """Builds the energy change and Metropolis acceptance probability for every local configuration.
+    Both tables are indexed by [(spin + 1) // 2, neighbourSum + coordination].
+    """
+
+    spin = np.array([-1, 1])[:, np.newaxis]
+    neighbourSum = np.arange(-coordination, coordination + 1)[np.newaxis, :]
+
+    energyChange = 2 * spin * (interactionStrength * neighbourSum + bField)
+    acceptance = np.minimum(1.0, np.exp(-beta * energyChange))
+
+    return energyChange, acceptance
+
+def _MetropolisLoop(spins, neighbourTable, sites, randomFloats, acceptance, energyChanges, coordination, proposals=None, acceptances=None):
+    """Attempts a single spin flip at each of the given sites in turn.
+    Runs either compiled by Numba on arrays, or as plain Python on memoryviews and lists, which index faster than arrays.
+    Parameters:
+        acceptance, energyChanges : Flattened tables from AcceptanceTable.
+        proposals, acceptances : Counts of each table index to add to while instrumented, or None. Numba compiles the
+                                 None case separately with the counting removed.
+    Returns the changes in the total energy and total spin.
+    """
+
+    neighbourCount = neighbourTable.shape[1]
+    tableWidth = 2 * coordination + 1
+
+    totalEnergyChange = 0.0
+    totalSpinChange = 0
+    for i in range(len(sites)):
+        site = sites[i]
+        spin = spins[site]
+
+        neighbourSum = 0
+        for neighbour in range(neighbourCount):
+            neighbourSum += spins[neighbourTable[site, neighbour]]
+
+        tableIndex = (spin + 1) // 2 * tableWidth + neighbourSum + coordination
+        if proposals is not None:
+            proposals[tableIndex] += 1
+        if randomFloats[i] <= acceptance[tableIndex]:
+            spins[site] = -spin
+            totalSpinChange -= 2 * spin
+            totalEnergyChange += energyChanges[tableIndex]
+            if acceptances is not None:
+                acceptances[tableIndex] += 1
+
+    return totalEnergyChange, totalSpinChange
+
+if numba is not None:
+    _CompiledMetropolisLoop = numba.njit(cache=True)(_MetropolisLoop)
+
+class HypercubicGrid():
+    """Ising model on a d dimensional hypercubic lattice, with periodic or open boundaries chosen per axis.
+    Neighbours come from a flat index table built once, with a ghost site standing in for missing neighbours.
+    """
+
+    def __init__(self, shape, bField, interactionStrength, periodic=False, seed=None):
+        self._shape = tuple(int(length) for length in shape)
+        self._periodic = (bool(periodic),) * len(self._shape) if np.ndim(periodic) == 0 else tuple(bool(wraps) for wraps in periodic)
+
+        if len(self._periodic) != len(self._shape):
+            raise ValueError(f"Expected a boundary for each of the {len(self._shape)} axes, got {len(self._periodic)}")
+        if any(wraps and length < 2 for length, wraps in zip(self._shape, self._periodic)):
+            raise ValueError(f"Periodic axes need at least 2 sites, the shape is {self._shape}")
 
         self._bField = bField
         self._interactionStrength = interactionStrength
         self._beta = 0.0
+        self._instrumentation = None #Counters and phase timers, only recorded while enabled
         
         self._thd = None
         self._threadFinished = True
@@ -18,79 +232,446 @@ class SpinGrid():
         self._lastAverageSpin = None
         self._lastTotalEnergy = None
 
+        #Each grid draws from its own Philox streams so runs can be reproduced from a seed, with a separate stream for
+        #each checkerboard sublattice
+        seed = rng_streams.Root(seed)
+        self._rng = rng_streams.Stream(seed)
+        self._sublatticeRngs = rng_streams.Streams(seed, 2, rng_streams.SUBLATTICE_KEY)
+
         #Build grid of 0s (to be populated with -1 or +1 for spins)
-        self._grid = array.array("i", [0 for i in range(sizeX * sizeY)])
+        #The lattice is a view of a flat array with one extra ghost site, which stays 0 and stands in for missing neighbours
+        siteCount = int(np.prod(self._shape))
+        self._spins = np.zeros(siteCount + 1, dtype=np.int8)
+        self._lattice = self._spins[:-1].reshape(self._shape)
+        self._neighbourTable = LatticeNeighbourTable(self._shape, self._periodic)
+        self._coordination = 2 * len(self._shape)
+        self._bondCount = LatticeBondCount(self._shape, self._periodic)
+
+        #Sublattices only decouple when every periodic axis has an even length
+        self._checkerboardSites = [np.flatnonzero(mask) for mask in ParityMasks(self._shape)]
+        self._checkerboardValid = all(length % 2 == 0 or not wraps for length, wraps in zip(self._shape, self._periodic))
+        self._algorithm = ALGORITHM_CHECKERBOARD if self._checkerboardValid else ALGORITHM_WOLFF
+
+        self._BuildTables()
+        self._bondProbability = 0.0
+
+        #Preallocated buffers the random numbers are drawn into
+        self._uniforms = np.empty(siteCount)
+        self._batchUniforms = np.empty((RANDOM_BATCH, 2))
+        self._batchSites = np.empty(RANDOM_BATCH, dtype=np.intp)
+        self._bondUniforms = np.empty(self._bondCount)
+
+        #Preallocated buffers for building Wolff clusters
+        self._clusterMask = np.zeros(siteCount + 1, dtype=bool)
+        self._clusterBuffer = np.empty(siteCount, dtype=np.intp)
+        self._wolffClusterCount = 0
+        self._wolffClusterSites = 0
 
     def SetTemperature(self, kBT):
         self._beta = 1.0 / (kBT)
+        self._BuildTables()
 
-    def SetSpin(self, xPos, yPos, value):
+        #Probability of adding an aligned neighbour to a cluster
+        self._bondProbability = max(0.0, 1.0 - np.exp(-2.0 * self._beta * self._interactionStrength))
+        self._wolffClusterCount = 0
+        self._wolffClusterSites = 0
+
+    def SetMagneticField(self, bField):
+        """Changes the external field, the total energy is recalculated on the next iteration."""
+        self._bField = bField
+        self._BuildTables()
+        self._lastTotalEnergy = None
+
+    def _BuildTables(self):
+        timer = self._instrumentation
+        if timer is not None:
+            start = time.perf_counter()
+
+        self._energyTable, self._acceptanceTable = AcceptanceTable(self._beta, self._bField, self._interactionStrength, self._coordination)
+
+        #Flat copies for single spin updates, as lists when they run as plain Python
+        self._flatEnergyTable = self._energyTable.astype(float).ravel()
+        self._flatAcceptanceTable = self._acceptanceTable.ravel()
+        if numba is None:
+            self._flatEnergyTable = self._flatEnergyTable.tolist()
+            self._flatAcceptanceTable = self._flatAcceptanceTable.tolist()
+
+        if timer is not None:
+            timer.SetEnergyChanges(self._energyTable)
+            timer.Lap("tables", start)
+
+    def EnableInstrumentation(self):
+        """Starts recording proposal and acceptance counts and phase timings, returning the Instrumentation they go to."""
+        self._instrumentation = Instrumentation(self._energyTable)
+        return self._instrumentation
+
+    def DisableInstrumentation(self):
+        self._instrumentation = None
+
+    def GetInstrumentation(self):
+        """The Instrumentation being recorded into, or None when disabled."""
+        return self._instrumentation
+
+    def SetAlgorithm(self, algorithm):
+        """Selects the update algorithm used by Sweep, one of ALGORITHMS."""
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown update algorithm '{algorithm}', expected one of {ALGORITHMS}")
+        if algorithm == ALGORITHM_CHECKERBOARD and not self._checkerboardValid:
+            raise ValueError(f"Checkerboard updates need even lengths along periodic axes, the shape is {self._shape}")
+
+        self._algorithm = algorithm
+
+    def SetGrid(self, spins):
+        """Copies a whole spin arrangement into the grid, totals are recalculated on the next iteration."""
+        self._lattice[:] = spins
+        self._lastTotalEnergy = None
+        self._lastAverageSpin = None
+
+    def GetGrid(self):
+        """A copy of the whole spin arrangement."""
+        return self._lattice.copy()
+
+    def GetState(self):
+        """The lattice (packed to 1 bit per spin), counters and generator state as a dictionary, for checkpointing.
+        The temperature and algorithm are not included, they are part of the run settings.
+        """
+        return {"spins": PackSpins(self._lattice), "iterationNum": self._iterationNum, "rng": GeneratorState([self._rng, *self._sublatticeRngs]),
+                "lastTotalEnergy": np.nan if self._lastTotalEnergy is None else self._lastTotalEnergy,
+                "lastAverageSpin": np.nan if self._lastAverageSpin is None else self._lastAverageSpin,
+                "wolffClusterCount": self._wolffClusterCount, "wolffClusterSites": self._wolffClusterSites}
+
+    def SetState(self, state):
+        self._lattice[:] = UnpackSpins(state["spins"], self._shape)
+        self._iterationNum = int(state["iterationNum"])
+        SetGeneratorState([self._rng, *self._sublatticeRngs], state["rng"])
+
+        self._lastTotalEnergy = OptionalFloat(state["lastTotalEnergy"])
+        self._lastAverageSpin = OptionalFloat(state["lastAverageSpin"])
+
+        self._wolffClusterCount = int(state["wolffClusterCount"])
+        self._wolffClusterSites = int(state["wolffClusterSites"])
+
+    def SetSpin(self, position, value):
         if value == 1 or value == -1:
-            self._grid[xPos * self._sizeY + yPos] = value
+            self._lattice[tuple(position)] = value
 
-    def GetSpin(self, xPos, yPos):
-        return self._grid[xPos * self._sizeY + yPos]
+    def GetSpin(self, position):
+        return int(self._lattice[tuple(position)])
 
-    def GetNearestNeighbours(self, xPos, yPos):
-        neighbours = []
-        if xPos > 0:
-            neighbours.append((xPos - 1, yPos))
-        if xPos < self._sizeX - 1:
-            neighbours.append((xPos + 1, yPos))
-        if yPos > 0:
-            neighbours.append((xPos, yPos - 1))
-        if yPos < self._sizeY - 1:
-            neighbours.append((xPos, yPos + 1))
+    def GetNearestNeighbours(self, position):
+        """Coordinates of the neighbours of a site, including those across periodic boundaries."""
+        site = np.ravel_multi_index(tuple(position), self._shape)
+        neighbours = self._neighbourTable[site]
 
-        return neighbours
+        return [np.unravel_index(neighbour, self._shape) for neighbour in neighbours[neighbours < self._lattice.size]]
 
     def CalculateEnergy(self):
-        self._lastTotalEnergy = 0.0
-        for xPos in range(self._sizeX):
-            for yPos in range(self._sizeY):
-                self._lastTotalEnergy += self.CalculateSingleEnergy(xPos, yPos)
+        """Calculates the total energy, counting each bond once so flipping a spin changes it by 2 s (J n + B)."""
+
+        bondSum = int(LatticeBondSum(self._lattice, self._periodic))
+        spinSum = int(self._lattice.sum(dtype=np.int64))
+        self._lastTotalEnergy = -self._interactionStrength * bondSum - self._bField * spinSum
 
         return self._lastTotalEnergy
 
-    def CalculateSingleEnergy(self, x, y):
-        energy = 0.0
+    def CalculateMagnetisation(self):
+        """Calculates the total magnetisation (sum of the spins), and updates the average spin."""
 
-        #Iterate over nearest neighbours
-        for neighbour in self.GetNearestNeighbours(x, y):
-            energy += -self.GetSpin(x, y) * self.GetSpin(neighbour[0], neighbour[1])
-        
-        energy *= self._interactionStrength
-        energy += -self._bField * self.GetSpin(x, y)
+        spinSum = int(self._lattice.sum(dtype=np.int64))
+        self._lastAverageSpin = spinSum / self._lattice.size
+
+        return spinSum
 
-        return energy
+    def CalculateNeighbourCorrelation(self):
+        """Average s_i s_j over the nearest neighbour bonds, 1 when every bond is aligned."""
+        if self._bondCount == 0:
+            return 1.0
+        return int(LatticeBondSum(self._lattice, self._periodic)) / self._bondCount
+
+    def CalculateDomainWallLength(self):
+        """Number of unaligned nearest neighbour bonds, the length (area in 3D) of the walls between domains."""
+        return (self._bondCount - int(LatticeBondSum(self._lattice, self._periodic))) // 2
 
     def Iterate(self, repeats):
+        """Performs random sequential single spin flip Metropolis updates.
+        Sites and random numbers are drawn in batches, and the flips are a loop over the neighbour and acceptance
+        tables, compiled with Numba when it is installed.
+        Parameters:
+            repeats : How many flips to attempt.
+        """
 
         self._threadFinished = False
 
-        randomX = rand.randint(0, self._sizeX, repeats)
-        randomY = rand.randint(0, self._sizeY, repeats)
-        randomFloats = rand.random(repeats)
+        timer = self._instrumentation
+        if timer is not None:
+            start = time.perf_counter()
 
         totalSpinChange = 0
-        totalEnergyChange = 0
-        for i in range(repeats):
-            #Choose a random spin
-            xPos = randomX[i]
-            yPos = randomY[i]
-
-            #Calculate energy change if this spin flips
-            newSpin = self.GetSpin(xPos, yPos) * -1
-            energyChange = -4 * self.CalculateSingleEnergy(xPos, yPos)
-
-            #Conditions to flip spin
-            if energyChange <= 0 or randomFloats[i] <= np.exp(-energyChange * self._beta):
-                self.SetSpin(xPos, yPos, newSpin)
-                totalSpinChange += newSpin * 2
-                totalEnergyChange += energyChange
+        totalEnergyChange = 0.0
+        for batchStart in range(0, repeats, RANDOM_BATCH):
+            batchSize = min(RANDOM_BATCH, repeats - batchStart)
+
+            #A site, as floor(u * sites), and an acceptance test for each flip, drawn in pairs so the stream doesn't
+            #depend on how the flips are split between calls
+            draws = self._rng.random(out=self._batchUniforms[:batchSize])
+            sites = np.multiply(draws[:, 0], self._lattice.size, out=self._batchSites[:batchSize], casting="unsafe")
+            randomFloats = draws[:, 1]
+
+            if timer is not None:
+                start = timer.Lap("random", start)
+                energyChange, spinChange = self._CountedIterate(sites, randomFloats)
+                start = timer.Lap("flips", start)
+            elif numba is not None:
+                energyChange, spinChange = _CompiledMetropolisLoop(self._spins, self._neighbourTable, sites, randomFloats,
+                                                                   self._flatAcceptanceTable, self._flatEnergyTable, self._coordination)
+            else:
+                energyChange, spinChange = _MetropolisLoop(self._spins.data, self._neighbourTable.data, sites.tolist(), randomFloats.tolist(),
+                                                           self._flatAcceptanceTable, self._flatEnergyTable, self._coordination)
+
+            totalEnergyChange += energyChange
+            totalSpinChange += spinChange
 
         self._iterationNum += repeats
+        self._UpdateTotals(totalEnergyChange, totalSpinChange)
+
+        if timer is not None:
+            timer.Lap("totals", start)
+
+        self._threadFinished = True
+
+    def _CountedIterate(self, sites, randomFloats):
+        """One batch of Iterate, counting proposals and acceptances into the instrumentation."""
+
+        timer = self._instrumentation
+        if numba is not None:
+            return _CompiledMetropolisLoop(self._spins, self._neighbourTable, sites, randomFloats, self._flatAcceptanceTable,
+                                           self._flatEnergyTable, self._coordination, timer.proposals, timer.acceptances)
+
+        proposals = [0] * len(timer.proposals)
+        acceptances = [0] * len(timer.acceptances)
+        changes = _MetropolisLoop(self._spins.data, self._neighbourTable.data, sites.tolist(), randomFloats.tolist(),
+                                  self._flatAcceptanceTable, self._flatEnergyTable, self._coordination, proposals, acceptances)
+        timer.proposals += proposals
+        timer.acceptances += acceptances
+        return changes
+
+    def Sweep(self, sweeps):
+        """Performs full lattice sweeps with the selected update algorithm.
+        A Metropolis or checkerboard sweep attempts one flip per spin, a Wolff sweep flips enough clusters to cover
+        the grid on average, and a Swendsen-Wang sweep updates every cluster once.
+        Parameters:
+            sweeps : How many full lattice sweeps to perform.
+        """
+
+        if self._algorithm == ALGORITHM_METROPOLIS:
+            self.Iterate(sweeps * self._lattice.size)
+            return
+
+        self._threadFinished = False
+
+        if self._algorithm == ALGORITHM_WOLFF:
+            update = self._WolffSweep
+        elif self._algorithm == ALGORITHM_SWENDSEN_WANG:
+            update = self._SwendsenWangSweep
+        else:
+            update = self._CheckerboardSweep
+
+        totalSpinChange = 0
+        totalEnergyChange = 0.0
+        for i in range(sweeps):
+            energyChange, spinChange, spinUpdates = update()
+
+            totalEnergyChange += energyChange
+            totalSpinChange += spinChange
+            self._iterationNum += spinUpdates
+
+        timer = self._instrumentation
+        if timer is not None:
+            start = time.perf_counter()
+
+        self._UpdateTotals(totalEnergyChange, totalSpinChange)
+
+        if timer is not None:
+            timer.Lap("totals", start)
+
+        self._threadFinished = True
+
+    def _CheckerboardSweep(self):
+        """Updates each sublattice in turn, with every site's flip decided from the same configuration.
+        While instrumented, the phases are timed and the proposals and acceptances counted, drawing the same random numbers.
+        """
+
+        lattice = self._lattice
+
+        timer = self._instrumentation
+        if timer is not None:
+            start = time.perf_counter()
+
+        flatSpins = self._spins[:-1]
+        energyChange = 0.0
+        spinChange = 0
+        for sites, rng in zip(self._checkerboardSites, self._sublatticeRngs):
+            #Index into the tables from the local configuration of every site, then draw only for this sublattice
+            tableIndex = (lattice > 0) * (2 * self._coordination + 1) + LatticeNeighbourSum(lattice, self._periodic) + self._coordination
+            sublatticeIndex = tableIndex.ravel()[sites]
+            if timer is not None:
+                start = timer.Lap("neighbours", start)
+
+            randomFloats = rng.random(out=self._uniforms[:len(sites)])
+            if timer is not None:
+                start = timer.Lap("random", start)
+
+            accepted = randomFloats < np.take(self._acceptanceTable, sublatticeIndex)
+            flips = sites[accepted]
+            if timer is not None:
+                start = timer.Lap("acceptance", start)
+
+            energyChange += np.take(self._energyTable, sublatticeIndex[accepted]).sum()
+            spinChange -= 2 * int(flatSpins[flips].sum(dtype=np.int64))
+            flatSpins[flips] *= -1
+
+            if timer is not None:
+                start = timer.Lap("flips", start)
+                timer.CountTableIndices(sublatticeIndex, sublatticeIndex[accepted])
+                start = timer.Lap("counting", start)
+
+        return energyChange, spinChange, lattice.size
+
+    def _WolffSweep(self):
+        #The number of clusters is fixed before the sweep from the mean cluster size so far.
+        #Stopping once enough spins have flipped would make the measurement times depend on the clusters and bias averages.
+        if self._wolffClusterCount > 0:
+            clusterCount = int(np.ceil(self._lattice.size * self._wolffClusterCount / self._wolffClusterSites))
+        else:
+            clusterCount = 1
+
+        timer = self._instrumentation
+        if timer is not None:
+            start = time.perf_counter()
+
+        energyChange = 0.0
+        spinChange = 0
+        spinUpdates = 0
+        for i in range(clusterCount):
+            clusterEnergyChange, clusterSpinChange, clusterSize = self._WolffCluster()
+
+            energyChange += clusterEnergyChange
+            spinChange += clusterSpinChange
+            spinUpdates += clusterSize
+
+        self._wolffClusterCount += clusterCount
+        self._wolffClusterSites += spinUpdates
 
+        if timer is not None:
+            timer.CountClusters(clusterCount, spinUpdates)
+            timer.Lap("clusters", start)
+
+        return energyChange, spinChange, spinUpdates
+
+    def _WolffCluster(self):
+        """Grows a single cluster from a random seed site one shell at a time and tries to flip it."""
+
+        spins = self._spins
+        inCluster = self._clusterMask
+        cluster = self._clusterBuffer
+
+        seedSite = self._rng.integers(0, self._lattice.size)
+        clusterSpin = int(spins[seedSite])
+
+        cluster[0] = seedSite
+        inCluster[seedSite] = True
+        clusterSize = 1
+        shellStart = 0
+
+        while shellStart < clusterSize:
+            shell = cluster[shellStart:clusterSize]
+            shellStart = clusterSize
+
+            #Aligned neighbours not yet in the cluster, the ghost site is never aligned
+            candidates = self._neighbourTable[shell].ravel()
+            candidates = candidates[(spins[candidates] == clusterSpin) & ~inCluster[candidates]]
+            candidates = candidates[self._rng.random(len(candidates)) < self._bondProbability]
+            candidates = np.unique(candidates)
+
+            cluster[clusterSize:clusterSize + len(candidates)] = candidates
+            inCluster[candidates] = True
+            clusterSize += len(candidates)
+
+        sites = cluster[:clusterSize]
+
+        #Only bonds crossing the cluster boundary change energy
+        neighbours = self._neighbourTable[sites]
+        boundarySum = int(np.where(inCluster[neighbours], 0, spins[neighbours]).sum(dtype=np.int64))
+        inCluster[sites] = False
+
+        bondEnergyChange = 2 * self._interactionStrength * clusterSpin * boundarySum
+        fieldEnergyChange = 2 * self._bField * clusterSpin * clusterSize
+
+        #The field isn't included in the bond probability, so it decides whether the cluster flips
+        if fieldEnergyChange > 0 and self._rng.random() >= np.exp(-self._beta * fieldEnergyChange):
+            return 0.0, 0, clusterSize
+
+        spins[sites] *= -1
+
+        return bondEnergyChange + fieldEnergyChange, -2 * clusterSpin * clusterSize, clusterSize
+
+    def _SwendsenWangSweep(self):
+        """Places bonds between aligned neighbours, then flips every cluster independently."""
+
+        spins = self._spins
+        siteCount = self._lattice.size
+
+        timer = self._instrumentation
+        if timer is not None:
+            start = time.perf_counter()
+
+        #Each bond is taken once, from a site to its neighbour up each axis
+        bondsA = []
+        bondsB = []
+        for axis in range(len(self._shape)):
+            partners = self._neighbourTable[:, 2 * axis + 1]
+            sites = np.flatnonzero(partners < siteCount)
+            bondsA.append(sites)
+            bondsB.append(partners[sites])
+        bondsA = np.concatenate(bondsA)
+        bondsB = np.concatenate(bondsB)
+
+        active = (spins[bondsA] == spins[bondsB]) & (self._rng.random(out=self._bondUniforms[:len(bondsA)]) < self._bondProbability)
+        if timer is not None:
+            start = timer.Lap("bonds", start)
+
+        labels = ClusterLabels(siteCount, bondsA[active], bondsB[active])
+        if timer is not None:
+            start = timer.Lap("labels", start)
+
+        #Heat bath choice for each cluster given its magnetisation in the field
+        flatSpins = spins[:-1]
+        if self._bField == 0.0:
+            flipProbability = 0.5
+        else:
+            clusterMagnetisation = np.bincount(labels, weights=flatSpins, minlength=siteCount)
+            flipProbability = 1.0 / (1.0 + np.exp(2.0 * self._beta * self._bField * clusterMagnetisation))
+
+        flipCluster = self._rng.random(out=self._uniforms) < flipProbability
+        flips = flipCluster[labels]
+
+        #Bonds between a flipped and an unflipped site change sign
+        cross = flips[bondsA] != flips[bondsB]
+        crossSum = int((spins[bondsA[cross]] * spins[bondsB[cross]]).sum(dtype=np.int64))
+
+        flippedSum = int(flatSpins[flips].sum(dtype=np.int64))
+        flatSpins[flips] *= -1
+
+        energyChange = 2 * self._interactionStrength * crossSum + 2 * self._bField * flippedSum
+
+        if timer is not None:
+            start = timer.Lap("flips", start)
+            timer.CountClusters(len(np.unique(labels)), siteCount)
+            timer.Lap("counting", start)
+
+        return energyChange, -2 * flippedSum, siteCount
+
+    def _UpdateTotals(self, totalEnergyChange, totalSpinChange):
         #Update total energy
         if self._lastTotalEnergy == None:
             self.CalculateEnergy()
@@ -99,17 +680,9 @@ class SpinGrid():
 
         #Calculate average spin for first time
         if self._lastAverageSpin == None:
-            avgSpin = 0
-            for x in range(self._sizeX):
-                for y in range(self._sizeY):
-                    avgSpin += self.GetSpin(x, y)
-            avgSpin /= self._sizeX * self._sizeY
-
-            self._lastAverageSpin = avgSpin
+            self.CalculateMagnetisation()
         else: #Adjust average only
-            self._lastAverageSpin += totalSpinChange / (self._sizeX * self._sizeY)
-
-        self._threadFinished = True
+            self._lastAverageSpin += totalSpinChange / self._lattice.size
 
     def StartIterateThread(self, repeats):
         """Starts the iteration thread and doesn't start the next job until the results have been drawn.
@@ -123,3 +696,20 @@ class SpinGrid():
 
     def IsThreadFinished(self):
         return self._threadFinished
+
+class SpinGrid(HypercubicGrid):
+    """Square grid with open boundaries, addressed by x and y coordinates."""
+
+    def __init__(self, sizeX, sizeY, bField, interactionStrength, seed=None):
+        super().__init__((sizeX, sizeY), bField, interactionStrength, False, seed)
+
+        self._sizeX = sizeX
+        self._sizeY = sizeY
+        self._grid = self._lattice
+
+    def SetSpin(self, xPos, yPos, value):
+        if value == 1 or value == -1:
+            self._grid[xPos, yPos] = value
+
+    def GetSpin(self, xPos, yPos):
+        return int(self._grid[xPos, yPos])
@@ -0,0 +1,105 @@
+"""Runs temperature sweep tasks across a pool of worker processes.
+Every task receives its own SeedSequence child so results don't depend on the number of workers or the order they finish in.
+"""
+
+import collections, os
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+import numpy as np
+
+import rng_streams
+
+#initialGrid overrides the grid shared by every task, for tasks that start from their own spins
+SweepTask = collections.namedtuple("SweepTask", ["temperature", "field", "gridSize", "seed", "initialGrid"], defaults=[None])
+
+#Worker process state, set up once per worker by _AttachInitialGrid
+_sharedBlock = None
+_initialGrid = None
+
+def MakeTasks(temperatures, field, gridSize, seedSequence):
+    """Builds one task per temperature, each with an independent child of the seed sequence."""
+
+    seeds = seedSequence.spawn(len(temperatures))
+    return [SweepTask(temp, field, gridSize, seed) for temp, seed in zip(temperatures, seeds)]
+
+def RandomInitialGrid(gridSize, seed, dimensions=2):
+    """Generates a square (or hypercubic) grid of random spins with gridSize sites along each axis."""
+
+    rng = rng_streams.Stream(seed)
+    return rng.choice(np.array([-1, 1], dtype=np.int8), size=(gridSize,) * dimensions)
+
+def _AttachInitialGrid(name, shape, dtype):
+    global _sharedBlock, _initialGrid
+
+    _sharedBlock = shared_memory.SharedMemory(name=name)
+    _initialGrid = np.ndarray(shape, dtype=dtype, buffer=_sharedBlock.buf)
+    _initialGrid.flags.writeable = False
+
+def _RunTask(taskFunc, task):
+    return taskFunc(task, _initialGrid if task.initialGrid is None else task.initialGrid)
+
+def RunSweep(taskFunc, tasks, initialGrid, workers=None):
+    """Runs every task on a process pool, yielding (task, result) pairs as they complete.
+    Parameters:
+        taskFunc : Module level function called as taskFunc(task, initialGrid) in a worker.
+        tasks : Iterable of SweepTask.
+        initialGrid : Starting spin arrangement, placed in shared memory rather than pickled to each worker. Tasks with
+                      their own initialGrid use that instead.
+        workers : Number of worker processes, defaults to the number of cores.
+    """
+
+    initialGrid = np.ascontiguousarray(initialGrid)
+    sharedBlock = shared_memory.SharedMemory(create=True, size=initialGrid.nbytes)
+    sharedGrid = np.ndarray(initialGrid.shape, dtype=initialGrid.dtype, buffer=sharedBlock.buf)
+    sharedGrid[:] = initialGrid
+
+    try:
+        initArgs = (sharedBlock.name, initialGrid.shape, initialGrid.dtype.str)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_AttachInitialGrid, initargs=initArgs) as pool:
+            futures = {pool.submit(_RunTask, taskFunc, task): task for task in tasks}
+
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    finally:
+        del sharedGrid
+        sharedBlock.close()
+        sharedBlock.unlink()
+
+def BalanceLanes(costs, laneCount):
+    """Splits tasks between lanes by the longest processing time first rule, so the lanes finish close together.
+    Returns the task indices of each non-empty lane, cheapest first.
+    """
+
+    lanes = [[] for lane in range(laneCount)]
+    totals = np.zeros(laneCount)
+    for index in np.argsort(costs, kind="stable")[::-1]:
+        lane = np.argmin(totals)
+        lanes[lane].append(int(index))
+        totals[lane] += costs[index]
+
+    return [sorted(lane, key=lambda index: costs[index]) for lane in lanes if len(lane) > 0]
+
+def RunBalancedSweep(taskFunc, tasks, costs, workers=None):
+    """Runs tasks that each carry their own initialGrid, yielding (task, result) pairs as they complete.
+    The tasks are split into one lane per worker by estimated cost with BalanceLanes, and each lane runs its cheapest
+    tasks first, so small runs report early while the lanes still finish together.
+    Parameters:
+        taskFunc : Module level function called as taskFunc(task, task.initialGrid) in a worker.
+        costs : Estimated relative cost of each task.
+    """
+
+    lanes = BalanceLanes(costs, min(workers or os.cpu_count(), len(tasks)))
+    if len(lanes) == 0:
+        return
+
+    with ProcessPoolExecutor(max_workers=len(lanes)) as pool:
+        running = {pool.submit(_RunTask, taskFunc, tasks[lane[0]]): (lane, 0) for lane in lanes}
+
+        while len(running) > 0:
+            done, pending = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                lane, position = running.pop(future)
+                if position + 1 < len(lane):
+                    running[pool.submit(_RunTask, taskFunc, tasks[lane[position + 1]])] = (lane, position + 1)
+
+                yield tasks[lane[position]], future.result()
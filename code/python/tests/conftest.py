@@ -0,0 +1,4 @@
+import os, sys
+
+#The modules are flat scripts in the directory above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
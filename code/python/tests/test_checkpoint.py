@@ -0,0 +1,220 @@
+"""A run restarted from a checkpoint must continue bit for bit like one that was never interrupted."""
+
+import copy
+
+import numpy as np
+import pytest
+
+import spin_grid, packed_grid, replica_grid, checkpoint, observables, equilibration, reweighting
+
+SIZE = 12
+TOTAL_SWEEPS = 12
+RESTART_SWEEP = 5
+
+def _HypercubicEngine(algorithm, periodic):
+    def Create():
+        grid = spin_grid.HypercubicGrid((SIZE, SIZE), 0.1, 1.0, periodic, 2024)
+        grid.SetGrid(np.random.default_rng(1).choice(np.array([-1, 1], dtype=np.int8), size=(SIZE, SIZE)))
+        grid.SetTemperature(2.3)
+        grid.SetAlgorithm(algorithm)
+        return grid
+    return Create
+
+def _PackedEngine():
+    grid = packed_grid.PackedSpinGrid(SIZE, 70, 0.1, 1.0, 2024)
+    grid.SetRandomGrid()
+    grid.SetTemperature(2.3)
+    return grid
+
+def _ReplicaEngine():
+    replicas = replica_grid.ReplicaGrid(SIZE, [1.8, 2.3, 2.8], 0.1, 1.0, 2024)
+    replicas.SetGrid(np.random.default_rng(1).choice(np.array([-1, 1], dtype=np.int8), size=(SIZE, SIZE)))
+    return replicas
+
+ENGINES = {
+    "metropolis": _HypercubicEngine(spin_grid.ALGORITHM_METROPOLIS, False),
+    "checkerboard": _HypercubicEngine(spin_grid.ALGORITHM_CHECKERBOARD, True),
+    "wolff": _HypercubicEngine(spin_grid.ALGORITHM_WOLFF, True),
+    "swendsen-wang": _HypercubicEngine(spin_grid.ALGORITHM_SWENDSEN_WANG, False),
+    "packed": _PackedEngine,
+    "replicas": _ReplicaEngine,
+}
+
+def _Sweeps(engine, sweeps):
+    """Sweeps one at a time, returning the tracked total energy after each."""
+
+    energies = []
+    for i in range(sweeps):
+        engine.Sweep(1)
+        energies.append(np.copy(engine._lastTotalEnergy))
+    return energies
+
+def _AssertStatesEqual(state, expected):
+    assert state.keys() == expected.keys()
+    for key in expected:
+        value, expectedValue = np.asarray(state[key]), np.asarray(expected[key])
+        assert np.array_equal(value, expectedValue, equal_nan=value.dtype.kind in "fc"), key
+
+def _SaveAndLoad(engine, fileName):
+    checkpoint.SaveCheckpoint(fileName, {"engine": engine.GetState()})
+    return checkpoint.LoadCheckpoint(fileName)["engine"]
+
+@pytest.mark.parametrize("name", ENGINES)
+@pytest.mark.parametrize("throughFile", [True, False], ids=["file", "memory"])
+def test_restart_is_bit_identical(name, throughFile, tmp_path):
+    create = ENGINES[name]
+
+    uninterrupted = create()
+    expectedEnergies = _Sweeps(uninterrupted, TOTAL_SWEEPS)
+
+    interrupted = create()
+    energies = _Sweeps(interrupted, RESTART_SWEEP)
+    state = _SaveAndLoad(interrupted, str(tmp_path / "run.npz")) if throughFile else interrupted.GetState()
+    del interrupted
+
+    resumed = create()
+    resumed.SetState(state)
+    energies += _Sweeps(resumed, TOTAL_SWEEPS - RESTART_SWEEP)
+
+    #Spins, generator states and totals, then the energy after every sweep
+    _AssertStatesEqual(resumed.GetState(), uninterrupted.GetState())
+    for energy, expected in zip(energies, expectedEnergies):
+        assert np.array_equal(energy, expected)
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_taken_state_is_unchanged_by_later_sweeps(name):
+    create = ENGINES[name]
+
+    uninterrupted = create()
+    expectedEnergies = _Sweeps(uninterrupted, TOTAL_SWEEPS)
+
+    #Keep sweeping the engine the state was taken from, as a run does while its checkpoint is written
+    engine = create()
+    _Sweeps(engine, RESTART_SWEEP)
+    state = engine.GetState()
+    taken = copy.deepcopy(state)
+    _Sweeps(engine, TOTAL_SWEEPS - RESTART_SWEEP)
+    _AssertStatesEqual(state, taken)
+
+    resumed = create()
+    resumed.SetState(state)
+    energies = _Sweeps(resumed, TOTAL_SWEEPS - RESTART_SWEEP)
+
+    _AssertStatesEqual(resumed.GetState(), uninterrupted.GetState())
+    for energy, expected in zip(energies, expectedEnergies[RESTART_SWEEP:]):
+        assert np.array_equal(energy, expected)
+
+def _AddToAccumulator(accumulator, energies, spins, reset):
+    accumulator.Reset(reset)
+    accumulator.Add(energies, spins)
+
+def _AddToDetector(detector, energies, spins, reset):
+    detector.Add(energies[0])
+
+def _AddToRecorder(recorder, energies, spins, reset):
+    if reset[0]:
+        recorder.Reset()
+    recorder.Add(energies[0], spins[0])
+
+#Objects checkpointed alongside the grids, with how to add one sample to each
+RECORDERS = {
+    "accumulator": (lambda: observables.ObservableAccumulator(SIZE**2, 3), _AddToAccumulator),
+    "detector": (lambda: equilibration.EquilibriumDetector(1e-3, batchCount=16, minBatches=4), _AddToDetector),
+    "recorder": (reweighting.SampleRecorder, _AddToRecorder),
+}
+
+@pytest.mark.parametrize("name", RECORDERS)
+def test_taken_recorder_state_is_unchanged_by_later_samples(name):
+    create, add = RECORDERS[name]
+    rng = np.random.default_rng(3)
+    samples = [(rng.normal(-200.0, 5.0, 3), rng.integers(-144, 145, 3), rng.random(3) < 0.05) for i in range(400)]
+
+    uninterrupted = create()
+    for sample in samples:
+        add(uninterrupted, *sample)
+
+    recorder = create()
+    for sample in samples[:150]:
+        add(recorder, *sample)
+    state = recorder.GetState()
+    taken = copy.deepcopy(state)
+    for sample in samples[150:]:
+        add(recorder, *sample)
+    _AssertStatesEqual(state, taken)
+
+    resumed = create()
+    resumed.SetState(state)
+    for sample in samples[150:]:
+        add(resumed, *sample)
+    _AssertStatesEqual(resumed.GetState(), uninterrupted.GetState())
+
+@pytest.mark.parametrize("name", ["metropolis", "packed"])
+def test_state_restores_before_totals_are_calculated(name):
+    grid = ENGINES[name]()
+    grid.SetState(grid.GetState())
+
+    assert grid._lastTotalEnergy is None
+    grid.Sweep(1)
+    assert grid._lastTotalEnergy is not None
+
+def test_checkpoint_settings_are_checked(tmp_path):
+    fileName = str(tmp_path / "run.npz")
+    settings = {"gridSize": 8, "temperature": 2.3, "seedEntropy": 2**100, "seedSpawnKey": [1, 2]}
+    checkpoint.SaveCheckpoint(fileName, {"loop": {"cycle": 3}}, settings)
+
+    assert int(checkpoint.LoadCheckpoint(fileName, dict(settings))["loop"]["cycle"]) == 3
+    with pytest.raises(ValueError, match="seedSpawnKey"):
+        checkpoint.LoadCheckpoint(fileName, {**settings, "seedSpawnKey": [1, 3]})
+    with pytest.raises(ValueError, match="algorithm"):
+        checkpoint.LoadCheckpoint(fileName, {**settings, "algorithm": "wolff"})
+
+def _SmallRun(monkeypatch, checkpointDir):
+    import ising_model
+
+    monkeypatch.setattr(ising_model, "CHECKPOINT_DIR", checkpointDir)
+    monkeypatch.setattr(ising_model, "CHECKPOINT_CYCLES", 1)
+    monkeypatch.setattr(ising_model, "SAMPLE_ITERATIONS", 10 * 8 * 8)
+    monkeypatch.setattr(ising_model, "MAX_ITERATIONS", 6 * 10 * 8 * 8)
+    monkeypatch.setattr(ising_model, "TARGET_ERROR", 1e-12) #Never converges, so every cycle runs
+    monkeypatch.setattr(ising_model, "DIMENSIONS", 2)
+    monkeypatch.setattr(ising_model, "PERIODIC_BOUNDARIES", False)
+    monkeypatch.setattr(ising_model, "PACKED_LATTICE", False)
+    monkeypatch.setattr(ising_model, "UPDATE_ALGORITHM", spin_grid.ALGORITHM_CHECKERBOARD)
+    monkeypatch.setattr(ising_model, "SAMPLE_DIR", None)
+    monkeypatch.setattr(ising_model, "INSTRUMENTATION_DIR", None)
+    return ising_model
+
+def test_interrupted_temperature_resumes_exactly(monkeypatch, tmp_path):
+    import sweep_runner
+
+    ising_model = _SmallRun(monkeypatch, None)
+    task = sweep_runner.SweepTask(2.3, 0.0, 8, np.random.SeedSequence(7, spawn_key=(4,)))
+    initialGrid = sweep_runner.RandomInitialGrid(8, 1)
+    expected = ising_model.FindEquilibriumEnergy(task, initialGrid)
+
+    #Interrupt the run as its third checkpoint is written
+    ising_model = _SmallRun(monkeypatch, str(tmp_path))
+    saveCheckpoint = ising_model._SaveCheckpoint
+    def InterruptedSave(checkpointFile, states, cycle, settings):
+        saveCheckpoint(checkpointFile, states, cycle, settings)
+        if cycle == 3:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(ising_model, "_SaveCheckpoint", InterruptedSave)
+    with pytest.raises(KeyboardInterrupt):
+        ising_model.FindEquilibriumEnergy(task, initialGrid)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    #A different seed or algorithm doesn't touch the checkpoint
+    monkeypatch.setattr(ising_model, "_SaveCheckpoint", saveCheckpoint)
+    otherSeed = task._replace(seed=np.random.SeedSequence(8, spawn_key=(4,)))
+    assert not np.array_equal(ising_model.FindEquilibriumEnergy(otherSeed, initialGrid), expected, equal_nan=True)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    loadCheckpoint = ising_model._LoadCheckpoint
+    startCycles = []
+    monkeypatch.setattr(ising_model, "_LoadCheckpoint", lambda *args: startCycles.append(loadCheckpoint(*args)) or startCycles[-1])
+
+    resumed = ising_model.FindEquilibriumEnergy(task, initialGrid)
+    assert startCycles == [3]
+    assert np.array_equal(resumed, expected, equal_nan=True)
+    assert len(list(tmp_path.iterdir())) == 0
@@ -0,0 +1,57 @@
+"""The burn-in cut must leave the mean, error and fluctuation results on exactly the same samples."""
+
+import numpy as np
+import pytest
+
+import equilibration, ising_model, reweighting, spin_grid, sweep_runner
+
+def test_cut_discards_every_sample_so_far():
+    detector = equilibration.EquilibriumDetector(1e-3, batchCount=16, minBatches=4)
+    values = np.concatenate([np.linspace(10.0, 0.0, 40), np.random.default_rng(2).normal(0.0, 1.0, 200)])
+    for value in values:
+        detector.Add(value)
+
+    burnIn = detector.BurnIn()
+    assert burnIn > 0
+    assert detector.Mean() == pytest.approx(values[burnIn:].mean(), abs=1e-12)
+    assert detector.Variance() == pytest.approx(values[burnIn:].var(ddof=1), rel=1e-12)
+
+def test_results_come_from_the_recorded_samples(monkeypatch, tmp_path):
+    monkeypatch.setattr(ising_model, "CHECKPOINT_DIR", None)
+    monkeypatch.setattr(ising_model, "SAMPLE_ITERATIONS", 10 * 16 * 16)
+    monkeypatch.setattr(ising_model, "MAX_ITERATIONS", 40 * 10 * 16 * 16)
+    monkeypatch.setattr(ising_model, "TARGET_ERROR", 1e-12)
+    monkeypatch.setattr(ising_model, "DIMENSIONS", 2)
+    monkeypatch.setattr(ising_model, "PERIODIC_BOUNDARIES", False)
+    monkeypatch.setattr(ising_model, "PACKED_LATTICE", False)
+    monkeypatch.setattr(ising_model, "UPDATE_ALGORITHM", spin_grid.ALGORITHM_CHECKERBOARD)
+    monkeypatch.setattr(ising_model, "INSTRUMENTATION_DIR", None)
+    monkeypatch.setattr(ising_model, "SAMPLE_DIR", str(tmp_path))
+
+    #Domains coarsen slowly from a random start below T_c, so the first part of the run is cut as burn-in
+    task = sweep_runner.SweepTask(2.0, 0.0, 16, 11)
+    energy, energyError, spin, spinError, heatCap, susceptibility, binder = ising_model.FindEquilibriumEnergy(task, sweep_runner.RandomInitialGrid(16, 3))
+
+    samples = reweighting.LoadSamples(next(tmp_path.iterdir()))
+    energies = samples["energies"]
+    spins = np.abs(samples["spinSums"]) / 256
+    assert 0 < len(energies) < 400
+
+    beta = 1.0 / 2.0
+    assert energy == pytest.approx(energies.mean(), rel=1e-9)
+    assert spin == pytest.approx(spins.mean(), rel=1e-9)
+    assert heatCap == pytest.approx(beta**2 * energies.var() / 256, rel=1e-6)
+
+def test_short_batches_do_not_converge():
+    detector = equilibration.EquilibriumDetector(0.1, batchCount=16, minBatches=4, minBatchSize=8)
+
+    #The error is within the target from the first few batches, but they are too short to trust
+    wouldConverge = False
+    for value in np.random.default_rng(4).normal(0.0, 0.1, 400):
+        detector.Add(value)
+        if detector._batchSize < 8:
+            wouldConverge |= detector.IsEquilibrated() and detector.Error() <= 0.1
+            assert not detector.IsConverged()
+
+    assert wouldConverge
+    assert detector.IsConverged()
@@ -0,0 +1,38 @@
+"""Points of the finite size scaling study must never pick up a checkpoint of another run."""
+
+import os
+
+import spin_grid, checkpoint, ising_model, sweep_runner
+import finite_size_scaling as fss
+
+def test_points_checkpoint_by_seed_in_their_own_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(fss, "CHECKPOINT_DIR", str(tmp_path / "fss"))
+    monkeypatch.setattr(ising_model, "CHECKPOINT_DIR", str(tmp_path / "ising"))
+    monkeypatch.setattr(ising_model, "CHECKPOINT_CYCLES", 1)
+    monkeypatch.setattr(ising_model, "SAMPLE_ITERATIONS", 10 * 8 * 8)
+    monkeypatch.setattr(ising_model, "MAX_ITERATIONS", 2 * 10 * 8 * 8)
+    monkeypatch.setattr(ising_model, "TARGET_ERROR", 1e-12)
+    monkeypatch.setattr(ising_model, "DIMENSIONS", 2)
+    monkeypatch.setattr(ising_model, "PACKED_LATTICE", False)
+    monkeypatch.setattr(ising_model, "UPDATE_ALGORITHM", spin_grid.ALGORITHM_CHECKERBOARD)
+    monkeypatch.setattr(ising_model, "SAMPLE_DIR", None)
+    monkeypatch.setattr(ising_model, "INSTRUMENTATION_DIR", None)
+
+    saved = []
+    saveCheckpoint = checkpoint.SaveCheckpoint
+    def RecordingSave(fileName, states, settings=None):
+        saved.append(fileName)
+        saveCheckpoint(fileName, states, settings)
+    monkeypatch.setattr(checkpoint, "SaveCheckpoint", RecordingSave)
+
+    names = set()
+    for seed in [2024, 2025]:
+        runSeed, gridSeed = fss._PointSeeds(8, 2.3, seed)
+        task = sweep_runner.SweepTask(2.3, 0.0, 8, runSeed)
+        fss._RunPoint(task, sweep_runner.RandomInitialGrid(8, gridSeed))
+        names.add(saved[-1])
+
+    assert len(names) == 2
+    assert all(os.path.dirname(name) == fss.CHECKPOINT_DIR for name in names)
+    assert not os.path.exists(tmp_path / "ising")
+    assert ising_model.CHECKPOINT_DIR == str(tmp_path / "ising")
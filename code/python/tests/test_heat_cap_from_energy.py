@@ -0,0 +1,46 @@
+"""The sliding least-squares gradient must match direct fits and reproduce the heat capacity in the report."""
+
+import os
+
+import numpy as np
+import pytest
+
+import heat_cap_from_energy, results_store
+
+REPORT_CSV_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..", "report", "csv")
+
+def test_reproduces_report_heat_capacity():
+    temps, energies = heat_cap_from_energy.LoadEnergyData(os.path.join(REPORT_CSV_DIR, "energy-1000.csv"))
+    gradTemps, gradients = heat_cap_from_energy.SlidingGradient(temps, energies)
+
+    expected = results_store.ReadCsv(os.path.join(REPORT_CSV_DIR, "heat-cap-1000.csv"))
+    assert np.array_equal(gradTemps, expected[:, 0])
+
+    #The report's values came from a Nelder-Mead fit, which only converged to about 1e-5
+    assert np.max(np.abs(gradients - expected[:, 1])) < 1e-4
+
+@pytest.mark.parametrize("anchored", [True, False])
+def test_matches_direct_fits_on_uneven_x(anchored):
+    rng = np.random.default_rng(5)
+    xValues = np.cumsum(rng.uniform(0.01, 0.2, 60)) + 1.0
+    yValues = np.sin(xValues) + rng.normal(0.0, 0.05, len(xValues))
+    avgPoints = 4
+
+    centres, gradients = heat_cap_from_energy.SlidingGradient(xValues, yValues, avgPoints, anchored)
+
+    windowSize = 2 * avgPoints
+    assert len(gradients) == len(xValues) - windowSize
+    for i, gradient in enumerate(gradients):
+        x = xValues[i:i + windowSize]
+        y = yValues[i:i + windowSize]
+        if anchored:
+            expected = np.sum((x - x[0]) * (y - y[0])) / np.sum((x - x[0])**2)
+        else:
+            expected = np.polyfit(x, y, 1)[0]
+
+        assert centres[i] == xValues[i + avgPoints]
+        assert gradient == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+def test_too_few_points_give_no_gradients():
+    centres, gradients = heat_cap_from_energy.SlidingGradient(np.arange(8.0), np.arange(8.0), 4)
+    assert len(centres) == 0 and len(gradients) == 0
@@ -0,0 +1,27 @@
+"""Each replica must sweep exactly like a single checkerboard grid seeded with the replica's own seed."""
+
+import numpy as np
+import pytest
+
+import spin_grid, replica_grid, rng_streams, checkpoint
+
+def test_replicas_match_single_grids_on_their_streams():
+    temperatures = [1.8, 2.3, 2.8]
+    initialGrid = rng_streams.RandomSpins(1, (10, 10))
+
+    replicas = replica_grid.ReplicaGrid(10, temperatures, 0.1, 1.0, 2024)
+    replicas.SetGrid(initialGrid)
+    replicas.Sweep(7, exchange=False)
+
+    for replica, temperature in enumerate(temperatures):
+        grid = spin_grid.SpinGrid(10, 10, 0.1, 1.0, rng_streams.Child(2024, rng_streams.REPLICA_KEY, replica))
+        grid.SetGrid(initialGrid)
+        grid.SetTemperature(temperature)
+        grid.SetAlgorithm(spin_grid.ALGORITHM_CHECKERBOARD)
+        grid.Sweep(7)
+
+        #Only one uniform is drawn per site of each sublattice, so the streams end in the same place too
+        assert np.array_equal(replicas._grids[replica], grid.GetGrid())
+        assert replicas._lastTotalEnergy[replica] == pytest.approx(grid._lastTotalEnergy, abs=1e-9)
+        assert replicas._lastAverageSpin[replica] == pytest.approx(grid._lastAverageSpin, abs=1e-12)
+        assert checkpoint.GeneratorState(replicas._replicaRngs[replica]) == checkpoint.GeneratorState(grid._sublatticeRngs)
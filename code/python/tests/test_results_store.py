@@ -0,0 +1,77 @@
+"""A run directory must only be continued by a run with the same columns and settings."""
+
+import numpy as np
+import pytest
+
+import results_store, ising_model
+
+COLUMNS = ["temp", "energy"]
+METADATA = {"gridSize": 16, "dimensions": 2, "periodic": False, "interactionStrength": 1.0, "bField": 0.0,
+            "algorithm": "checkerboard", "seed": [1, 2]}
+
+def _StartRun(runDir):
+    with results_store.ResultWriter(runDir, COLUMNS, METADATA) as writer:
+        writer.Append({"temp": 1.5, "energy": -1.9})
+
+def test_reopened_run_continues_after_its_rows(tmp_path):
+    _StartRun(tmp_path)
+
+    with results_store.ResultWriter(tmp_path, COLUMNS, {**METADATA, "seed": (1, 2)}) as writer:
+        assert writer.RowCount() == 1
+        writer.Append({"temp": 2.5, "energy": -0.8})
+
+    columns, metadata = results_store.LoadRun(tmp_path)
+    assert list(columns["temp"]) == [1.5, 2.5]
+    assert metadata == {"columns": COLUMNS, **METADATA}
+
+@pytest.mark.parametrize("name, value", [("gridSize", 32), ("dimensions", 3), ("periodic", True),
+                                         ("interactionStrength", -1.0), ("bField", 0.1), ("algorithm", "wolff"), ("seed", [3])])
+def test_reopened_run_with_other_settings_is_refused(tmp_path, name, value):
+    _StartRun(tmp_path)
+
+    with pytest.raises(ValueError, match=name):
+        results_store.ResultWriter(tmp_path, COLUMNS, {**METADATA, name: value})
+
+def test_reopened_run_with_other_columns_is_refused(tmp_path):
+    _StartRun(tmp_path)
+
+    with pytest.raises(ValueError, match="columns"):
+        results_store.ResultWriter(tmp_path, ["temp", "heatcap"], METADATA)
+
+def test_unchecked_settings_are_kept_from_the_start(tmp_path):
+    _StartRun(tmp_path)
+
+    with results_store.ResultWriter(tmp_path, COLUMNS, {**METADATA, "seed": [3]}, unchecked=["seed"]) as writer:
+        assert writer.GetMetadata()["seed"] == [1, 2]
+
+def test_parallel_tempering_writes_only_missing_temperatures(monkeypatch, tmp_path):
+    monkeypatch.setattr(ising_model, "GRID_SIZE", 8)
+    monkeypatch.setattr(ising_model, "CHECKPOINT_DIR", None)
+    monkeypatch.setattr(ising_model, "SAMPLE_ITERATIONS", 10 * 8 * 8)
+    monkeypatch.setattr(ising_model, "MAX_ITERATIONS", 3 * 10 * 8 * 8)
+    monkeypatch.setattr(ising_model, "SAMPLE_SWEEPS", 10)
+    monkeypatch.setattr(ising_model, "SAMPLE_DIR", None)
+
+    temps = [1.8, 2.3, 2.8]
+    initialGrid = np.ones((8, 8), dtype=np.int8)
+    def Run(runDir, finishedRows):
+        with results_store.ResultWriter(runDir, ising_model.RESULT_COLUMNS) as writer:
+            for row in finishedRows:
+                writer.Append(row)
+            ising_model.RunParallelTempering(writer, temps, {row["temp"] for row in finishedRows}, initialGrid, 2024)
+        return results_store.LoadRun(runDir)[0]
+
+    complete = Run(tmp_path / "complete", [])
+    assert list(complete["temp"]) == temps
+
+    #A run interrupted after writing its first row only adds the others, with the same values
+    firstRow = {name: float(values[0]) for name, values in complete.items()}
+    resumed = Run(tmp_path / "resumed", [firstRow])
+    for name in ising_model.RESULT_COLUMNS:
+        assert np.array_equal(resumed[name], complete[name])
+
+    def Unexpected(*args):
+        raise AssertionError("a finished run was rerun")
+    monkeypatch.setattr(ising_model, "FindEquilibriumEnergies", Unexpected)
+    rows = [{name: float(values[i]) for name, values in complete.items()} for i in range(len(temps))]
+    assert len(Run(tmp_path / "finished", rows)["temp"]) == len(temps)
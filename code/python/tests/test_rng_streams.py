@@ -0,0 +1,53 @@
+"""Streams must depend only on the seed and key path, so results are the same however many workers share a run."""
+
+import numpy as np
+
+import rng_streams, spin_grid, sweep_runner
+
+def test_random_spins_are_reproducible_and_apart_from_the_grid_stream():
+    spins = rng_streams.RandomSpins(2024, (6, 10))
+    assert spins.dtype == np.int8 and spins.shape == (6, 10)
+    assert set(np.unique(spins)) == {-1, 1}
+    assert np.array_equal(spins, rng_streams.RandomSpins(np.random.SeedSequence(2024), (6, 10)))
+
+    #The grid seeded with 2024 updates with Stream(2024), whose first draws must not have set the spins
+    gridSpins = rng_streams.Stream(2024).choice(np.array([-1, 1], dtype=np.int8), size=(6, 10))
+    assert not np.array_equal(spins, gridSpins)
+
+def test_children_depend_only_on_their_key_path():
+    first = rng_streams.Streams(7, 3, rng_streams.REPLICA_KEY)
+    rng_streams.Stream(7, rng_streams.SUBLATTICE_KEY, 0).random(100)
+    second = rng_streams.Streams(7, 3, rng_streams.REPLICA_KEY)
+
+    for a, b in zip(first, second):
+        assert np.array_equal(a.random(8), b.random(8))
+    assert rng_streams.BIT_GENERATOR is np.random.Philox and isinstance(first[0].bit_generator, np.random.Philox)
+
+def _SweepTemperature(task, initialGrid):
+    """A short run of one task, returning its final spins and the energy after every sweep."""
+
+    grid = spin_grid.SpinGrid(task.gridSize, task.gridSize, task.field, 1.0, task.seed)
+    grid.SetGrid(initialGrid)
+    grid.SetTemperature(task.temperature)
+
+    energies = []
+    for algorithm in [spin_grid.ALGORITHM_CHECKERBOARD, spin_grid.ALGORITHM_METROPOLIS, spin_grid.ALGORITHM_WOLFF]:
+        grid.SetAlgorithm(algorithm)
+        for sweep in range(5):
+            grid.Sweep(1)
+            energies.append(grid._lastTotalEnergy)
+    return grid.GetGrid(), np.array(energies)
+
+def test_results_do_not_depend_on_the_worker_count():
+    temperatures = [1.5, 2.0, 2.3, 2.6, 3.0]
+    tasks = sweep_runner.MakeTasks(temperatures, 0.1, 12, np.random.SeedSequence(99))
+    initialGrid = rng_streams.RandomSpins(5, (12, 12))
+
+    results = {}
+    for workers in [1, 2]:
+        results[workers] = {task.temperature: result for task, result in sweep_runner.RunSweep(_SweepTemperature, tasks, initialGrid, workers)}
+
+    assert results[1].keys() == set(temperatures)
+    for temperature in temperatures:
+        for value, expected in zip(results[2][temperature], results[1][temperature]):
+            assert np.array_equal(value, expected)
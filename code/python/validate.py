@@ -0,0 +1,356 @@
+"""Validates every lattice engine against exact results.
+Tiny lattices are compared with the exact partition function, found by adding one layer of spins at a time, and a
+larger periodic grid is compared with Onsager's solution. Each fixed seed run must agree within Z_TOLERANCE standard
+errors, with the errors corrected for autocorrelation. The energy and magnetisation the engines track incrementally are
+also checked against a full recalculation every CHECK_INTERVAL sweeps. Exits with an error if any check fails.
+
+    python validate.py          #Every check
+    python validate.py --quick  #Fewer sweeps, the tolerances widen to match
+"""
+
+import argparse, sys
+import numpy as np
+
+import spin_grid, packed_grid, replica_grid, analysis, onsager, rng_streams
+
+SEED = 2024
+Z_TOLERANCE = 4.0 #Standard errors a measured mean may differ from the exact value by
+BOOKKEEPING_TOLERANCE = 1e-9 #Difference allowed between tracked and recalculated totals, relative to the number of sites
+CHECK_INTERVAL = 10 #Sweeps between full recalculations of the totals
+BURN_IN_FRACTION = 0.2 #Fraction of each run discarded before averaging
+ERROR_BATCHES = 16 #Batch means used as a second estimate of each standard error
+QUICK_FACTOR = 2 #Sweeps are divided by this with --quick, much shorter runs miss the rare excitations of the ordered tiny lattices
+
+#Exact enumeration, lattices as (name, shape, periodic) and conditions as (kBT, field)
+EXACT_LATTICES = [("4x4 open", (4, 4), False), ("4x4 periodic", (4, 4), True),
+                  ("3x3x3 open", (3, 3, 3), False), ("3x3x3 mixed", (3, 3, 3), (False, True, True))]
+EXACT_CONDITIONS = [(1.5, 0.0), (onsager.CriticalTemperature(), 0.0), (3.5, 0.0), (2.5, 0.5)]
+EXACT_SWEEPS = 20000
+
+#Onsager comparison on a periodic grid, at temperatures far enough from T_c for finite size effects to be negligible
+ONSAGER_SIZE = 64
+ONSAGER_TEMPERATURES = [1.8, 3.0]
+ONSAGER_SWEEPS = {spin_grid.ALGORITHM_METROPOLIS: 4000, spin_grid.ALGORITHM_CHECKERBOARD: 4000,
+                  spin_grid.ALGORITHM_WOLFF: 400, spin_grid.ALGORITHM_SWENDSEN_WANG: 1000}
+
+def _Shift(counts, offset, axis):
+    """Moves counts offset places along an axis, filling with zeros."""
+
+    length = counts.shape[axis]
+    source = [slice(None)] * counts.ndim
+    target = [slice(None)] * counts.ndim
+    source[axis] = slice(max(-offset, 0), length - max(offset, 0))
+    target[axis] = slice(max(offset, 0), length - max(-offset, 0))
+
+    shifted = np.zeros_like(counts)
+    shifted[tuple(target)] = counts[tuple(source)]
+    return shifted
+
+def DensityOfStates(shape, periodic):
+    """Counts the configurations of a small hypercubic lattice with each bond sum and spin sum.
+    Layers of spins are added one at a time along an open axis (or the first axis when every axis wraps), so the cost
+    grows with the number of layer configurations squared rather than with every configuration of the lattice.
+    Parameters:
+        shape : Lengths of the lattice axes.
+        periodic : Whether each axis wraps around, or a single value for every axis.
+    Returns bondValues, spinValues, counts with counts[i, j] configurations having bond sum bondValues[i] and spin sum spinValues[j].
+    """
+
+    periodic = (bool(periodic),) * len(shape) if np.ndim(periodic) == 0 else tuple(bool(wraps) for wraps in periodic)
+
+    #Relabelling the axes doesn't change the counts, so the layer axis is moved first
+    layerAxis = periodic.index(False) if False in periodic else 0
+    order = [layerAxis] + [axis for axis in range(len(shape)) if axis != layerAxis]
+    shape = tuple(shape[axis] for axis in order)
+    periodic = tuple(periodic[axis] for axis in order)
+
+    layerCount = shape[0]
+    layerShape = shape[1:]
+    layerSites = int(np.prod(layerShape))
+    siteCount = layerCount * layerSites
+    bondCount = spin_grid.LatticeBondCount(shape, periodic)
+
+    #Every configuration of a single layer, with its bonds inside the layer and to a neighbouring layer
+    configs = (1 - 2 * ((np.arange(2**layerSites)[:, None] >> np.arange(layerSites)) & 1)).astype(np.int8)
+    layerSpins = configs.reshape((len(configs),) + layerShape)
+    intraBonds = (layerSpins * spin_grid.LatticeNeighbourSum(layerSpins, periodic[1:])).reshape(len(configs), -1).sum(axis=1) // 2
+    spinSums = configs.sum(axis=1, dtype=np.int64)
+    overlaps = configs.astype(np.int64) @ configs.T.astype(np.int64)
+
+    def AddLayer(counts):
+        flatCounts = counts.reshape(len(counts), -1)
+
+        added = np.zeros_like(counts)
+        for overlap in np.unique(overlaps):
+            transfer = (overlaps == overlap).astype(float)
+            added += _Shift((transfer.T @ flatCounts).reshape(counts.shape), overlap, 1)
+
+        for config in range(len(configs)):
+            added[config] = _Shift(_Shift(added[config], intraBonds[config], 0), spinSums[config], 1)
+
+        return added
+
+    #counts[config of the newest layer, bond sum, spin sum], as floats so the layers are matrix products (exact below 2^53)
+    countShape = (len(configs), 2 * bondCount + 1, 2 * siteCount + 1)
+    total = np.zeros(countShape[1:])
+
+    #Without an open axis the first layer has to be fixed, so its bonds with the last layer are known
+    firstLayers = range(len(configs)) if periodic[0] else [None]
+    for first in firstLayers:
+        counts = np.zeros(countShape)
+        starts = np.arange(len(configs)) if first is None else np.array([first])
+        counts[starts, bondCount + intraBonds[starts], siteCount + spinSums[starts]] = 1.0
+
+        for layer in range(1, layerCount):
+            counts = AddLayer(counts)
+
+        if first is not None:
+            for config in range(len(configs)):
+                counts[config] = _Shift(counts[config], overlaps[config, first], 0)
+
+        total += counts.sum(axis=0)
+
+    return np.arange(-bondCount, bondCount + 1), np.arange(-siteCount, siteCount + 1), np.rint(total).astype(np.int64)
+
+def ExactObservables(densityOfStates, kBT, bField, interactionStrength=1.0):
+    """Exact thermal averages per spin from a density of states, with the conventions of observables.ObservableAccumulator.
+    Returns a dictionary with the energy, absMagnetisation, heatCapacity and susceptibility.
+    """
+
+    bondValues, spinValues, counts = densityOfStates
+    siteCount = spinValues[-1]
+
+    energy = -interactionStrength * bondValues[:, None] - bField * spinValues[None, :]
+    absMagnetisation = np.abs(spinValues)[None, :]
+
+    #Weights are normalised in logs, g(E) e^(-E / kBT) overflows for all but the smallest lattices
+    present = counts > 0
+    logWeights = np.where(present, np.log(np.where(present, counts, 1)) - energy / kBT, -np.inf)
+    weights = np.exp(logWeights - logWeights.max())
+    weights /= weights.sum()
+
+    meanEnergy = (weights * energy).sum()
+    meanAbsMag = (weights * absMagnetisation).sum()
+
+    return {
+        "energy": meanEnergy / siteCount,
+        "absMagnetisation": meanAbsMag / siteCount,
+        "heatCapacity": ((weights * energy**2).sum() - meanEnergy**2) / kBT**2 / siteCount,
+        "susceptibility": ((weights * absMagnetisation**2).sum() - meanAbsMag**2) / kBT / siteCount,
+    }
+
+def RecalculateTotals(spins, periodic, bField, interactionStrength):
+    """Total energy and spin sum of a configuration from scratch, vectorised over any leading (replica) axes."""
+
+    axes = tuple(range(spins.ndim - len(periodic), spins.ndim))
+    bondSum = (spins * spin_grid.LatticeNeighbourSum(spins, periodic)).sum(axis=axes, dtype=np.int64) // 2
+    spinSum = spins.sum(axis=axes, dtype=np.int64)
+
+    return -interactionStrength * bondSum - bField * spinSum, spinSum
+
+class _GridRun():
+    """Reads the tracked totals and spins of a SpinGrid, HypercubicGrid, PackedSpinGrid or ReplicaGrid."""
+
+    def __init__(self, grid, spins, siteCount):
+        self._grid = grid
+        self._spins = spins
+        self._siteCount = siteCount
+
+    def Sweep(self):
+        self._grid.Sweep(1)
+
+    def Totals(self):
+        return np.asarray(self._grid._lastTotalEnergy), np.asarray(self._grid._lastAverageSpin) * self._siteCount
+
+    def Spins(self):
+        return self._spins()
+
+class _LatticeRun():
+    """Reads the tracked totals and spins of metropolis.Lattice, which takes its inverse temperature from the module."""
+
+    def __init__(self, size, kBT, bField, interactionStrength, seed):
+        import matplotlib
+        matplotlib.use("Agg")
+        import metropolis
+
+        metropolis.beta = 1.0 / kBT
+
+        self._lattice = metropolis.Lattice(size, interactionStrength, bField, seed=seed)
+
+    def Sweep(self):
+        self._lattice.metropolis(self._lattice.lattice.size)
+
+    def Totals(self):
+        return np.asarray(self._lattice.energy, dtype=float), np.asarray(self._lattice.magnetization, dtype=float)
+
+    def Spins(self):
+        return self._lattice.lattice
+
+def RunEngine(run, periodic, bField, interactionStrength, sweeps):
+    """Records the tracked energy and spin sum after every sweep, comparing them with a recalculation every CHECK_INTERVAL sweeps.
+    Returns the energies and spin sums (one column per replica) and a description of each bookkeeping error.
+    """
+
+    energies = []
+    spinSums = []
+    errors = []
+    for sweep in range(sweeps):
+        run.Sweep()
+        energy, spinSum = run.Totals()
+        energies.append(energy)
+        spinSums.append(spinSum)
+
+        if (sweep + 1) % CHECK_INTERVAL == 0 or sweep == sweeps - 1:
+            spins = run.Spins()
+            exactEnergy, exactSpinSum = RecalculateTotals(spins, periodic, bField, interactionStrength)
+            tolerance = BOOKKEEPING_TOLERANCE * spins.size
+
+            if np.any(np.abs(energy - exactEnergy) > tolerance) or np.any(np.abs(spinSum - exactSpinSum) > tolerance):
+                errors.append(f"sweep {sweep + 1}: tracked energy {energy} and spin sum {spinSum}, recalculated {exactEnergy} and {exactSpinSum}")
+
+    return np.array(energies, dtype=float).reshape(sweeps, -1), np.array(spinSums, dtype=float).reshape(sweeps, -1), errors
+
+def MeanAndError(series):
+    """Mean of a time series after the burn-in, and its standard error corrected for autocorrelation.
+    The error is the larger of the estimate from the integrated autocorrelation time and from batch means.
+    """
+
+    series = np.asarray(series, dtype=float)[int(BURN_IN_FRACTION * len(series)):]
+
+    variance = series.var()
+    if variance == 0.0:
+        return series.mean(), 0.0
+
+    tau = max(float(analysis.IntegratedAutocorrelationTime(series)), 1.0)
+    tauError = np.sqrt(variance * tau / len(series))
+
+    #Rare slow excursions make tau from a short series too small, the spread of batch means catches them
+    batchLength = len(series) // ERROR_BATCHES
+    if batchLength == 0:
+        return series.mean(), tauError
+    batchMeans = series[:batchLength * ERROR_BATCHES].reshape(ERROR_BATCHES, batchLength).mean(axis=1)
+
+    return series.mean(), max(tauError, batchMeans.std(ddof=1) / np.sqrt(ERROR_BATCHES))
+
+class Report():
+    """Collects the checks, printing each as it is made."""
+
+    def __init__(self):
+        self.failures = []
+
+    def Compare(self, name, quantity, series, exact):
+        mean, error = MeanAndError(series)
+        difference = abs(mean - exact)
+        sigma = difference / error if error > 0.0 else (0.0 if difference < 1e-12 else np.inf)
+        passed = sigma <= Z_TOLERANCE
+
+        print(f"{name:52} {quantity:16} {mean:9.5f} +- {error:7.5f}  exact {exact:9.5f}  {sigma:5.1f} sigma  {'ok' if passed else 'FAIL'}", flush=True)
+        if not passed:
+            self.failures.append(f"{name} {quantity}: {mean:.5f} +- {error:.5f}, exact {exact:.5f}")
+
+    def Bookkeeping(self, name, errors):
+        if len(errors) > 0:
+            print(f"{name:52} bookkeeping      {len(errors)} mismatch(es), first at {errors[0]}  FAIL", flush=True)
+            self.failures.append(f"{name} bookkeeping: {errors[0]}")
+
+def _ExactEngines(shape, periodic, conditions, seed):
+    """Yields (name, run, temperatures) for every engine that can simulate the lattice, with one temperature per replica.
+    Parameters:
+        conditions : List of (kBT, field), all with the same field.
+    """
+
+    bField = conditions[0][1]
+    for kBT, field in conditions:
+        for algorithm in spin_grid.ALGORITHMS:
+            if len(shape) == 2 and not np.any(periodic):
+                grid = spin_grid.SpinGrid(shape[0], shape[1], field, 1.0, seed)
+            else:
+                grid = spin_grid.HypercubicGrid(shape, field, 1.0, periodic, seed)
+
+            if algorithm == spin_grid.ALGORITHM_CHECKERBOARD and not grid._checkerboardValid:
+                continue
+
+            grid.SetGrid(rng_streams.RandomSpins(seed, shape))
+            grid.SetTemperature(kBT)
+            grid.SetAlgorithm(algorithm)
+            yield f"{type(grid).__name__}/{algorithm} kBT={kBT:.3f} B={field}", _GridRun(grid, lambda grid=grid: grid._lattice, grid._lattice.size), [kBT]
+
+        if len(shape) == 2 and not np.any(periodic):
+            grid = packed_grid.PackedSpinGrid(shape[0], shape[1], field, 1.0, seed)
+            grid.SetRandomGrid()
+            grid.SetTemperature(kBT)
+            yield f"PackedSpinGrid kBT={kBT:.3f} B={field}", _GridRun(grid, grid.GetGrid, shape[0] * shape[1]), [kBT]
+
+        if len(shape) == 2 and np.all(periodic) and shape[0] == shape[1]:
+            yield f"metropolis.Lattice kBT={kBT:.3f} B={field}", _LatticeRun(shape[0], kBT, field, 1.0, seed), [kBT]
+
+    #Replicas share a field, so there is one replica grid for all the temperatures
+    if len(shape) == 2 and not np.any(periodic) and shape[0] == shape[1]:
+        temperatures = [kBT for kBT, field in conditions]
+        grid = replica_grid.ReplicaGrid(shape[0], temperatures, bField, 1.0, seed)
+        grid.SetGrid(rng_streams.RandomSpins(seed, shape))
+        yield f"ReplicaGrid B={bField}", _GridRun(grid, lambda grid=grid: grid._grids, shape[0] * shape[1]), temperatures
+
+def ValidateExact(report, sweeps, seed=SEED):
+    """Compares every engine on the tiny lattices with exact enumeration."""
+
+    for latticeName, shape, periodic in EXACT_LATTICES:
+        densityOfStates = DensityOfStates(shape, periodic)
+        periodicAxes = (bool(periodic),) * len(shape) if np.ndim(periodic) == 0 else tuple(periodic)
+        siteCount = int(np.prod(shape))
+
+        #Conditions are grouped by field so each replica grid runs at a single field
+        for bField in sorted(set(field for kBT, field in EXACT_CONDITIONS)):
+            conditions = [(kBT, field) for kBT, field in EXACT_CONDITIONS if field == bField]
+
+            for engineName, run, temperatures in _ExactEngines(shape, periodicAxes, conditions, seed):
+                name = f"{latticeName} {engineName}"
+                energies, spinSums, errors = RunEngine(run, periodicAxes, bField, 1.0, sweeps)
+                report.Bookkeeping(name, errors)
+
+                for replica, kBT in enumerate(temperatures):
+                    exact = ExactObservables(densityOfStates, kBT, bField)
+                    replicaName = name if len(temperatures) == 1 else f"{name} kBT={kBT:.3f}"
+                    report.Compare(replicaName, "energy", energies[:, replica] / siteCount, exact["energy"])
+                    report.Compare(replicaName, "|magnetisation|", np.abs(spinSums[:, replica]) / siteCount, exact["absMagnetisation"])
+
+def ValidateOnsager(report, sweepFactor=1, seed=SEED):
+    """Compares every algorithm on a large periodic grid with the exact infinite lattice results, starting ordered."""
+
+    siteCount = ONSAGER_SIZE * ONSAGER_SIZE
+    for kBT in ONSAGER_TEMPERATURES:
+        for algorithm in spin_grid.ALGORITHMS:
+            grid = spin_grid.HypercubicGrid((ONSAGER_SIZE, ONSAGER_SIZE), 0.0, 1.0, True, seed)
+            grid.SetGrid(np.ones((ONSAGER_SIZE, ONSAGER_SIZE), dtype=np.int8))
+            grid.SetTemperature(kBT)
+            grid.SetAlgorithm(algorithm)
+
+            name = f"{ONSAGER_SIZE}x{ONSAGER_SIZE} periodic HypercubicGrid/{algorithm} kBT={kBT:.3f}"
+            energies, spinSums, errors = RunEngine(_GridRun(grid, lambda grid=grid: grid._lattice, siteCount), (True, True), 0.0, 1.0,
+                                                   max(ONSAGER_SWEEPS[algorithm] // sweepFactor, 2 * CHECK_INTERVAL))
+            report.Bookkeeping(name, errors)
+            report.Compare(name, "energy", energies[:, 0] / siteCount, float(onsager.Energy(kBT)))
+
+            #Above T_c a finite grid still has a small |M|, so only the ordered phase is compared
+            if kBT < onsager.CriticalTemperature():
+                report.Compare(name, "|magnetisation|", np.abs(spinSums[:, 0]) / siteCount, float(onsager.Magnetisation(kBT)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validates the lattice engines against exact results.")
+    parser.add_argument("--quick", action="store_true", help=f"divide the number of sweeps by {QUICK_FACTOR}")
+    parser.add_argument("--seed", type=int, default=SEED, help="seed for every run")
+    args = parser.parse_args()
+
+    sweepFactor = QUICK_FACTOR if args.quick else 1
+    report = Report()
+
+    ValidateExact(report, EXACT_SWEEPS // sweepFactor, args.seed)
+    ValidateOnsager(report, sweepFactor, args.seed)
+
+    if len(report.failures) > 0:
+        print(f"\nVALIDATION FAILED in {len(report.failures)} check(s):")
+        for failure in report.failures:
+            print("  " + failure)
+        sys.exit(1)
+
+    print("\nEvery engine agrees with the exact results")